@@ -1,6 +1,13 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 import os
+import re
+import math
+import unicodedata
 import json
+import csv
+import tempfile
+import shutil
+import zipfile
 import pandas as pd
 from werkzeug.utils import secure_filename
 import PyPDF2
@@ -8,15 +15,29 @@ import docx
 from PIL import Image
 import pytesseract
 import uuid
+import hashlib
+import sqlite3
+import time
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+from sklearn.random_projection import SparseRandomProjection
+import scipy.sparse as sp
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
 import base64
-from io import BytesIO
+from datetime import datetime
+from io import BytesIO, StringIO
+from contextlib import contextmanager
+from collections import deque
 
 # Imports pour le style Excel
 try:
@@ -25,37 +46,493 @@ try:
 except ImportError:
     OPENPYXL_STYLES_AVAILABLE = False
 
+# Imports pour l'export Parquet/Arrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+    
+    # Types Arrow des colonnes d'export (hors colonnes dictionnaires)
+    EXPORT_ARROW_TYPES = {
+        'string': pa.string(),
+        'bool': pa.bool_(),
+        'int': pa.int64(),
+        'float': pa.float64(),
+        'date': pa.date32()
+    }
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 # Variables pour les imports optionnels
 SENTENCE_TRANSFORMERS_AVAILABLE = False
 MISTRAL_AVAILABLE = False
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['JSON_FOLDER'] = 'documents_json'
+app.config['JSON_FOLDER'] = 'documents_json'  # Ancien stockage (un JSON par document), importé au démarrage
+app.config['DOCUMENTS_DB'] = 'documents.sqlite3'
+app.config['DOCUMENTS_PAGE_MAX'] = 1000  # Taille maximum d'une page de /get_all_documents
+app.config['EXPORT_SPOOL_MAX_SIZE'] = 32 * 1024 * 1024  # Au-delà, l'export est écrit sur disque
+app.config['EXPORT_BATCH_SIZE'] = 5000  # Documents par lot pour l'export Parquet/Arrow
 app.config['CATALOG_FILE'] = 'catalog.json'
 app.config['API_KEY_FILE'] = 'mistral_api_key.txt'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['EXCEL_CHUNK_SIZE'] = 5000  # Lignes lues et écrites par lot lors de l'import Excel/CSV
+app.config['EXCEL_PREVIEW_ROWS'] = 1000  # Lignes importées renvoyées dans la réponse de /upload_excel
+app.config['UPLOAD_TOKEN_FOLDER'] = os.path.join('uploads', 'probes')  # Fichiers analysés par /get_excel_columns
+app.config['UPLOAD_TOKEN_TTL'] = 24 * 3600  # Secondes de validité d'un jeton d'upload
+app.config['UPLOAD_DUPLICATE_POLICY'] = 'skip'  # Fichier déjà importé : 'skip', 'link' ou 'version'
+app.config['INGESTION_WORKERS'] = 2 * (os.cpu_count() or 1)  # Fichiers uploadés traités simultanément
+app.config['OCR_WORKERS'] = os.cpu_count() or 1  # Processus OCR en parallèle
+app.config['OCR_TESSERACT_THREADS'] = 1  # Threads internes de Tesseract par processus (0 = défaut de Tesseract)
+app.config['OCR_PAGE_TIMEOUT'] = 120  # Secondes maximum par page
+app.config['OCR_LANGUAGE'] = 'fra'
+app.config['PDF_PAGES_PER_TASK'] = 10  # Pages d'un PDF extraites par tâche du pool
+app.config['PDF_MIN_TEXT_CHARS'] = 20  # En dessous, la page est considérée scannée et passée à l'OCR
+app.config['CONTEXT_RETRIEVAL_ENABLED'] = True  # Envoyer les passages pertinents (BM25) plutôt que le début du document
+app.config['CONTEXT_CHUNK_CHARS'] = 800  # Taille des passages indexés
+app.config['CONTEXT_FIELD_TOKENS'] = 600  # Budget de contexte pour l'extraction d'un champ
+app.config['CONTEXT_BATCH_TOKENS'] = 1500  # Budget de contexte pour l'extraction de tous les champs en un appel
+app.config['JUSTIFICATION_LOCAL_THRESHOLD'] = 0.75  # Confiance minimale du repérage local avant de solliciter le LLM
+app.config['JUSTIFICATION_FUZZY_MIN_SIMILARITY'] = 0.8  # Similarité minimale (distance d'édition) d'une correspondance approchée
+app.config['JUSTIFICATION_FUZZY_MAX_CHARS'] = 64  # Longueur maximale d'une valeur cherchée par correspondance approchée
+app.config['JUSTIFICATION_CONTEXT_SENTENCES'] = 0  # Phrases ajoutées de part et d'autre de la phrase trouvée
+app.config['JUSTIFICATION_MAX_PASSAGE_CHARS'] = 400  # Longueur maximale d'un passage
+app.config['JUSTIFICATION_BATCH_FIELDS'] = 15  # Champs justifiés par prompt groupé
+app.config['EXTRACTION_MODE'] = 'batch'  # 'batch' (un appel JSON par document) ou 'per_field'
+app.config['LLM_MAX_CONCURRENCY'] = 16  # Requêtes Mistral simultanées maximum
+app.config['LLM_REQUESTS_PER_SECOND'] = 5  # Limite de débit par clé API (0 = illimité)
+app.config['LLM_MAX_RETRIES'] = 3  # Tentatives supplémentaires sur erreur 429/5xx
+app.config['LLM_CACHE_ENABLED'] = True
+app.config['LLM_PRICES'] = {  # Prix par million de tokens (entrée, sortie), pour l'estimation du coût
+    'mistral-large-latest': (2.0, 6.0)
+}
+app.config['LLM_LATENCY_BUCKETS'] = [0.25, 0.5, 1, 2, 5, 10, 30, 60]  # Bornes (secondes) de l'histogramme de latence
+app.config['LLM_CACHE_FILE'] = 'llm_cache.sqlite3'
+app.config['LLM_CACHE_TTL'] = 30 * 24 * 3600  # Durée de vie des réponses en cache, en secondes (0 = illimitée)
+app.config['LLM_CACHE_MAX_ENTRIES'] = 100000
+app.config['JOBS_FOLDER'] = 'jobs'
+app.config['EMBEDDING_BACKEND'] = 'auto'  # 'auto', 'sentence_transformers' ou 'hashing' (local, sans téléchargement)
+app.config['EMBEDDING_HASHING_DIMENSIONS'] = 256
+app.config['EMBEDDING_MODEL'] = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+app.config['EMBEDDING_PRELOAD'] = False  # Charger le modèle au démarrage plutôt qu'au premier clustering
+app.config['EMBEDDING_BATCH_SIZE'] = 64
+app.config['EMBEDDING_THREADS'] = 0  # Threads torch pour l'encodage (0 = valeur par défaut de torch)
+app.config['CLUSTERING_MINIBATCH_THRESHOLD'] = 5000  # Au-delà, MiniBatchKMeans remplace KMeans
+app.config['CLUSTERING_BATCH_SIZE'] = 2048
+app.config['CLUSTERING_SILHOUETTE_SAMPLE'] = 5000  # Documents échantillonnés pour la silhouette
+app.config['CLUSTERING_MAX_WORKERS'] = min(4, os.cpu_count() or 1)  # Valeurs de k évaluées en parallèle
+app.config['TFIDF_MAX_FEATURES'] = 1000  # Taille du vocabulaire du clustering TF-IDF
+app.config['TFIDF_STOP_WORDS'] = 'french'  # 'french', 'english' ou None
+app.config['TFIDF_SVD_COMPONENTS'] = 0  # Réduction LSA avant KMeans (0 = matrice creuse conservée)
+app.config['CATEGORY_CENTROIDS_ENABLED'] = True  # Classer localement les nouveaux documents avant d'appeler le LLM
+app.config['CATEGORY_MARGIN_THRESHOLD'] = 0.05  # Écart de similarité minimum entre les deux meilleures catégories
+app.config['CATEGORY_CENTROID_MAX_DOCS'] = 2000  # Documents par catégorie utilisés pour le centroïde
+app.config['CLASSIFICATION_MODE'] = 'batch'  # 'batch' (plusieurs documents par prompt) ou 'per_document'
+app.config['CLASSIFICATION_BATCH_TOKENS'] = 6000  # Taille maximum estimée d'un prompt de classification par lot
+app.config['CLASSIFICATION_BATCH_MAX_DOCS'] = 40
+app.config['CLASSIFICATION_EXCERPT_CHARS'] = 1000  # Contenu envoyé par document
+app.config['EMBEDDING_CACHE_FOLDER'] = 'embeddings'
+app.config['EMBEDDING_CACHE_DTYPE'] = 'float32'  # 'float16' divise par deux la taille de la matrice
+app.config['EMBEDDING_PRECOMPUTE'] = True  # Encoder les documents en arrière-plan dès leur import
+app.config['JOBS_SAVE_INTERVAL'] = 1.0  # Secondes minimum entre deux écritures de progression
+app.config['JOBS_STREAM_INTERVAL'] = 0.5  # Secondes entre deux lectures de progression d'un flux de tâche
 
 # Créer les dossiers nécessaires
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['JSON_FOLDER'], exist_ok=True)
+os.makedirs(app.config['JOBS_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx', 'png', 'jpg', 'jpeg', 'xlsx', 'xls', 'csv'}
 
+# Clés reprises du document existant pour un doublon lié (politique 'link')
+DUPLICATE_LINK_KEYS = ['content', 'pages', 'category', 'extracted_fields', 'justifications']
+
+# Mots vides français ignorés par le clustering TF-IDF
+FRENCH_STOP_WORDS = [
+    'a', 'à', 'afin', 'ai', 'aie', 'ainsi', 'alors', 'au', 'aucun', 'aucune', 'aussi', 'autre', 'autres',
+    'aux', 'avec', 'avoir', 'bon', 'car', 'ce', 'cela', 'celle', 'celles', 'celui', 'ces', 'cet', 'cette',
+    'ceux', 'chaque', 'ci', 'comme', 'comment', 'd', 'dans', 'de', 'des', 'donc', 'dont', 'du', 'elle',
+    'elles', 'en', 'encore', 'entre', 'es', 'est', 'et', 'été', 'être', 'eu', 'fait', 'faire', 'il', 'ils',
+    'j', 'je', 'l', 'la', 'le', 'les', 'leur', 'leurs', 'lui', 'm', 'ma', 'mais', 'me', 'même', 'mes',
+    'moi', 'mon', 'n', 'ne', 'ni', 'nos', 'notre', 'nous', 'on', 'ont', 'ou', 'où', 'par', 'pas', 'peu',
+    'peut', 'plus', 'pour', 'qu', 'quand', 'que', 'quel', 'quelle', 'quelles', 'quels', 'qui', 's', 'sa',
+    'sans', 'se', 'selon', 'ses', 'si', 'son', 'sont', 'sous', 'sur', 't', 'ta', 'te', 'tes', 'toi',
+    'ton', 'tous', 'tout', 'toute', 'toutes', 'très', 'tu', 'un', 'une', 'vos', 'votre', 'vous', 'y'
+]
+
+# Mois en toutes lettres, pour retrouver une date ISO écrite en français
+FRENCH_MONTHS = ['janvier', 'fevrier', 'mars', 'avril', 'mai', 'juin', 'juillet', 'aout', 'septembre',
+                 'octobre', 'novembre', 'decembre']
+
+# Réponses du modèle signifiant qu'une valeur n'a pas été trouvée
+NOT_FOUND_VALUES = ['n/a', 'non trouvé', 'non disponible', '']
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+class DocumentStore:
+    """Stockage des documents dans SQLite (mode WAL).
+    
+    Le document complet est conservé en JSON dans la colonne `data` ; les champs utilisés
+    pour filtrer (catégorie, type, fichier source, statut d'extraction) sont indexés.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        
+        self.connect().executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id TEXT PRIMARY KEY,"
+            " title TEXT,"
+            " category TEXT,"
+            " type TEXT,"
+            " filename TEXT,"
+            " extraction_status TEXT,"
+            " created_at REAL,"
+            " updated_at REAL,"
+            " data TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_documents_category ON documents (category);"
+            "CREATE INDEX IF NOT EXISTS idx_documents_type ON documents (type);"
+            "CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents (filename);"
+            "CREATE INDEX IF NOT EXISTS idx_documents_extraction_status ON documents (extraction_status);"
+            "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS content_hashes (hash TEXT PRIMARY KEY, document_id TEXT NOT NULL);"
+        )
+    
+    def connect(self):
+        """Connexion SQLite propre au thread courant (transactions gérées explicitement)"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+    
+    @contextmanager
+    def transaction(self):
+        """Transaction en écriture (BEGIN IMMEDIATE) : évite les mises à jour perdues"""
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+    
+    @staticmethod
+    def row_values(document):
+        """Valeurs des colonnes indexées pour un document"""
+        now = time.time()
+        return (
+            document['id'],
+            document.get('title'),
+            document.get('category'),
+            document.get('type'),
+            document.get('filename'),
+            'extracted' if document.get('extracted_fields') else 'pending',
+            now,
+            now,
+            json.dumps(document, ensure_ascii=False)
+        )
+    
+    UPSERT_SQL = (
+        "INSERT INTO documents"
+        " (id, title, category, type, filename, extraction_status, created_at, updated_at, data)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        " ON CONFLICT(id) DO UPDATE SET"
+        " title = excluded.title, category = excluded.category, type = excluded.type,"
+        " filename = excluded.filename, extraction_status = excluded.extraction_status,"
+        " updated_at = excluded.updated_at, data = excluded.data"
+    )
+    
+    def get(self, doc_id):
+        """Retourne un document, ou None s'il n'existe pas"""
+        row = self.connect().execute("SELECT data FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def save(self, document):
+        """Crée ou remplace un document"""
+        with self.transaction() as connection:
+            connection.execute(self.UPSERT_SQL, self.row_values(document))
+    
+    def save_many(self, documents):
+        """Crée ou remplace plusieurs documents dans une seule transaction"""
+        with self.transaction() as connection:
+            connection.executemany(self.UPSERT_SQL, (self.row_values(document) for document in documents))
+    
+    def modify(self, doc_id, callback):
+        """Applique callback(document) et sauvegarde le résultat de façon atomique.
+        
+        Retourne le document modifié, ou None s'il n'existe pas.
+        """
+        with self.transaction() as connection:
+            row = connection.execute("SELECT data FROM documents WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                return None
+            document = json.loads(row[0])
+            callback(document)
+            connection.execute(self.UPSERT_SQL, self.row_values(document))
+            return document
+    
+    def update(self, doc_id, **values):
+        """Met à jour des clés d'un document, retourne False s'il n'existe pas"""
+        return self.modify(doc_id, lambda document: document.update(values)) is not None
+    
+    FILTER_COLUMNS = ['category', 'type', 'filename', 'extraction_status']
+    
+    def build_query(self, filters=None, categorized=None, after=None, limit=None, excerpt=None,
+                    include_content=True, per_category=None):
+        """Construit la requête de lecture des documents.
+        
+        filters : égalité sur les colonnes indexées (FILTER_COLUMNS).
+        categorized : True/False pour ne garder que les documents avec/sans catégorie.
+        after, limit : pagination par curseur (rowid du dernier document reçu).
+        excerpt, include_content : le contenu est tronqué ou retiré directement dans SQLite.
+        per_category : nombre maximum de documents par catégorie.
+        """
+        conditions = []
+        params = {}
+        
+        for column in self.FILTER_COLUMNS:
+            if filters and filters.get(column) is not None:
+                conditions.append(f"{column} = :{column}")
+                params[column] = filters[column]
+        if categorized is True:
+            conditions.append("category IS NOT NULL")
+        elif categorized is False:
+            conditions.append("category IS NULL")
+        if after is not None:
+            conditions.append("rowid > :after")
+            params['after'] = after
+        
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        
+        if per_category:
+            source = (
+                "SELECT doc_rowid, data FROM ("
+                " SELECT rowid AS doc_rowid, data,"
+                " ROW_NUMBER() OVER (PARTITION BY category ORDER BY rowid) AS category_rank"
+                f" FROM documents{where})"
+                " WHERE category_rank <= :per_category"
+            )
+            params['per_category'] = per_category
+        else:
+            source = f"SELECT rowid AS doc_rowid, data FROM documents{where}"
+        
+        if not include_content:
+            data_sql = "json_remove(data, '$.content')"
+        elif excerpt is not None:
+            data_sql = (
+                "CASE WHEN length(json_extract(data, '$.content')) > :excerpt"
+                " THEN json_set(data, '$.content', substr(json_extract(data, '$.content'), 1, :excerpt),"
+                " '$.content_truncated', json('true'))"
+                " ELSE data END"
+            )
+            params['excerpt'] = excerpt
+        else:
+            data_sql = "data"
+        
+        sql = f"SELECT doc_rowid, {data_sql} FROM ({source}) ORDER BY doc_rowid"
+        if limit is not None:
+            sql += " LIMIT :limit"
+            params['limit'] = limit
+        
+        return sql, params
+    
+    def iter_documents(self, **query):
+        """Parcourt les documents dans l'ordre d'insertion sans tout charger en mémoire"""
+        sql, params = self.build_query(**query)
+        
+        # Connexion dédiée : le parcours ne bloque pas les écritures du thread courant
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            for row in connection.execute(sql, params):
+                yield json.loads(row[1])
+        finally:
+            connection.close()
+    
+    def list_documents(self, limit, **query):
+        """Retourne une page de documents et le curseur de la page suivante (None à la fin)"""
+        sql, params = self.build_query(limit=limit, **query)
+        rows = self.connect().execute(sql, params).fetchall()
+        
+        documents = [json.loads(row[1]) for row in rows]
+        next_cursor = str(rows[-1][0]) if len(rows) == limit else None
+        return documents, next_cursor
+    
+    def category_counts(self):
+        """Nombre de documents par catégorie"""
+        rows = self.connect().execute(
+            "SELECT category, COUNT(*) FROM documents WHERE category IS NOT NULL GROUP BY category ORDER BY category"
+        ).fetchall()
+        return {category: count for category, count in rows}
+    
+    def count(self):
+        """Nombre total de documents"""
+        return self.connect().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+    
+    def category_summary(self):
+        """Nombre de documents (total et extraits) par catégorie, None pour les non catégorisés"""
+        rows = self.connect().execute(
+            "SELECT category, COUNT(*), SUM(extraction_status = 'extracted')"
+            " FROM documents GROUP BY category ORDER BY category"
+        ).fetchall()
+        return [(category, count, extracted) for category, count, extracted in rows]
+    
+    def delete_all(self):
+        """Supprime tous les documents"""
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM documents")
+            connection.execute("DELETE FROM content_hashes")
+    
+    def claim_hash(self, content_hash, doc_id):
+        """Associe le hash d'un fichier à un document s'il n'est pas déjà connu.
+        
+        Retourne l'identifiant du document associé au hash : doc_id, ou le document existant (doublon).
+        """
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO content_hashes (hash, document_id) VALUES (?, ?)", (content_hash, doc_id)
+            )
+            return connection.execute(
+                "SELECT document_id FROM content_hashes WHERE hash = ?", (content_hash,)
+            ).fetchone()[0]
+    
+    def set_hash(self, content_hash, doc_id):
+        """Associe le hash à un nouveau document (nouvelle version d'un fichier)"""
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO content_hashes (hash, document_id) VALUES (?, ?)", (content_hash, doc_id)
+            )
+    
+    def release_hash(self, content_hash, doc_id, previous_id=None):
+        """Retire l'association d'un hash à un document (fichier illisible, import annulé).
+        
+        previous_id : document auquel le hash était associé avant (nouvelle version), rétabli
+        plutôt que de supprimer l'association.
+        """
+        with self.transaction() as connection:
+            if previous_id:
+                connection.execute(
+                    "UPDATE content_hashes SET document_id = ? WHERE hash = ? AND document_id = ?",
+                    (previous_id, content_hash, doc_id)
+                )
+            else:
+                connection.execute(
+                    "DELETE FROM content_hashes WHERE hash = ? AND document_id = ?", (content_hash, doc_id)
+                )
+    
+    def import_json_folder(self, folder):
+        """Importe une seule fois les documents JSON historiques (un fichier par document).
+        
+        Les fichiers sont conservés sur disque ; retourne le nombre de documents importés.
+        """
+        connection = self.connect()
+        if connection.execute("SELECT value FROM store_meta WHERE key = 'json_import_done'").fetchone():
+            return 0
+        
+        imported = 0
+        with self.transaction() as connection:
+            if os.path.exists(folder):
+                for filename in sorted(os.listdir(folder)):
+                    if not filename.endswith('.json'):
+                        continue
+                    try:
+                        with open(os.path.join(folder, filename), 'r', encoding='utf-8') as file:
+                            document = json.load(file)
+                        document.setdefault('id', filename[:-len('.json')])
+                        values = self.row_values(document)
+                        connection.execute(
+                            "INSERT OR IGNORE INTO documents"
+                            " (id, title, category, type, filename, extraction_status, created_at, updated_at, data)"
+                            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            values
+                        )
+                        imported += 1
+                    except Exception as e:
+                        print(f"Erreur import {filename}: {e}")
+            connection.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('json_import_done', ?)",
+                               (str(time.time()),))
+        
+        return imported
+
+document_store = DocumentStore(app.config['DOCUMENTS_DB'])
+
+def extract_pdf_page_range(file_path, first_page, last_page, min_text_chars, lang, timeout):
+    """Extrait le texte des pages [first_page, last_page[ d'un PDF (exécuté dans un processus du pool).
+    
+    Les pages sans couche texte (moins de min_text_chars caractères) sont passées à l'OCR
+    à partir de leurs images ; le texte OCR est ajouté à la couche texte existante, qui est
+    conservée. Retourne une liste de (texte, ocr_utilisé).
+    """
+    pages = []
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page_index in range(first_page, last_page):
+            page = reader.pages[page_index]
+            text = page.extract_text() or ''
+            
+            ocr_used = False
+            if len(text.strip()) < min_text_chars:
+                ocr_texts = []
+                for image in page.images:
+                    try:
+                        ocr_texts.append(ocr_image(image.data, lang, timeout))
+                    except Exception as e:
+                        print(f"Erreur OCR page {page_index + 1} de {file_path}: {e}")
+                ocr_texts = [ocr_text for ocr_text in ocr_texts if ocr_text.strip()]
+                if ocr_texts:
+                    text = "\n".join([text.strip()] + ocr_texts if text.strip() else ocr_texts)
+                    ocr_used = True
+            
+            pages.append((text, ocr_used))
+    
+    return pages
+
 def extract_text_from_pdf(file_path):
-    """Extrait le texte d'un fichier PDF"""
+    """Extrait le texte d'un fichier PDF page par page, les blocs de pages étant traités en parallèle.
+    
+    Retourne (texte, pages) ; chaque page indique ses positions de début et de fin dans le texte
+    et si elle a été obtenue par OCR.
+    """
     try:
         with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text()
-        return text
+            page_count = len(PyPDF2.PdfReader(file).pages)
+        
+        pages_per_task = app.config['PDF_PAGES_PER_TASK']
+        futures = [
+            get_ocr_pool().submit(
+                extract_pdf_page_range, file_path, first_page, min(first_page + pages_per_task, page_count),
+                app.config['PDF_MIN_TEXT_CHARS'], app.config['OCR_LANGUAGE'], app.config['OCR_PAGE_TIMEOUT']
+            )
+            for first_page in range(0, page_count, pages_per_task)
+        ]
+        
+        # Les pages sont séparées par une ligne vide ; les positions permettent de retrouver chaque page
+        text_parts = []
+        pages = []
+        offset = 0
+        for future in futures:
+            for page_text, ocr_used in future.result():
+                if pages:
+                    text_parts.append("\n\n")
+                    offset += 2
+                text_parts.append(page_text)
+                pages.append({
+                    'page': len(pages) + 1,
+                    'start': offset,
+                    'end': offset + len(page_text),
+                    'ocr': ocr_used
+                })
+                offset += len(page_text)
+        
+        return "".join(text_parts), pages
     except Exception as e:
-        return f"Erreur lors de l'extraction du PDF: {str(e)}"
+        raise Exception(f"Erreur lors de l'extraction du PDF: {str(e)}")
 
 def extract_text_from_docx(file_path):
     """Extrait le texte d'un fichier Word"""
@@ -66,87 +543,435 @@ def extract_text_from_docx(file_path):
             text += paragraph.text + "\n"
         return text
     except Exception as e:
-        return f"Erreur lors de l'extraction du Word: {str(e)}"
+        raise Exception(f"Erreur lors de l'extraction du Word: {str(e)}")
 
-def extract_text_from_image(file_path):
-    """Extrait le texte d'une image avec OCR"""
+def init_ocr_worker(tesseract_threads):
+    """Initialise un processus OCR : limite les threads de Tesseract pour ne pas surcharger les cœurs"""
+    if tesseract_threads:
+        os.environ['OMP_THREAD_LIMIT'] = str(tesseract_threads)
+
+def ocr_image(source, lang, timeout):
+    """OCR d'une image (chemin ou contenu binaire), exécuté dans un processus du pool"""
+    image = Image.open(BytesIO(source) if isinstance(source, bytes) else source)
+    return pytesseract.image_to_string(image, lang=lang, timeout=timeout)
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def get_ocr_pool():
+    """Pool de processus partagé par l'OCR et l'extraction des PDF (créé au premier usage, OCR_WORKERS processus)"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            # fork : les processus du pool ne réimportent pas app.py (spawn/forkserver rejoueraient le démarrage)
+            start_methods = multiprocessing.get_all_start_methods()
+            mp_context = multiprocessing.get_context('fork') if 'fork' in start_methods else None
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=app.config['OCR_WORKERS'],
+                mp_context=mp_context,
+                initializer=init_ocr_worker,
+                initargs=(app.config['OCR_TESSERACT_THREADS'],)
+            )
+        return _ocr_pool
+
+def submit_ocr(source):
+    """Soumet une page (image) au pool OCR et retourne le Future"""
+    return get_ocr_pool().submit(ocr_image, source, app.config['OCR_LANGUAGE'], app.config['OCR_PAGE_TIMEOUT'])
+
+def get_ocr_result(future):
+    """Texte d'une page OCR soumise (exception en cas d'échec ou de délai dépassé)"""
     try:
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image, lang='fra')
-        return text
+        # Tesseract est interrompu par pytesseract au bout de OCR_PAGE_TIMEOUT ; marge pour l'attente en file
+        return future.result(timeout=app.config['OCR_PAGE_TIMEOUT'] * 10)
     except Exception as e:
-        return f"Erreur lors de l'extraction OCR: {str(e)}"
+        raise Exception(f"Erreur lors de l'extraction OCR: {str(e) or type(e).__name__}")
+
+def extract_text_from_image(file_path):
+    """Extrait le texte d'une image avec OCR"""
+    return get_ocr_result(submit_ocr(file_path))
 
-def process_document(file_path, filename):
-    """Traite un document et retourne le titre et le contenu"""
+def process_document(file_path, filename, ocr_future=None):
+    """Traite un document et retourne le titre, le contenu et les pages (PDF uniquement, sinon None).
+    
+    ocr_future : OCR de l'image déjà soumis au pool (voir run_ingestion_job).
+    Lève une exception si le fichier ne peut pas être lu.
+    """
     file_ext = filename.rsplit('.', 1)[1].lower()
+    pages = None
     
-    if file_ext == 'txt':
+    if ocr_future is not None:
+        content = get_ocr_result(ocr_future)
+    elif file_ext == 'txt':
         with open(file_path, 'r', encoding='utf-8') as file:
             content = file.read()
     elif file_ext == 'pdf':
-        content = extract_text_from_pdf(file_path)
+        content, pages = extract_text_from_pdf(file_path)
     elif file_ext == 'docx':
         content = extract_text_from_docx(file_path)
     elif file_ext in ['png', 'jpg', 'jpeg']:
         content = extract_text_from_image(file_path)
     else:
-        content = "Format non supporté"
+        raise Exception("Format non supporté")
     
     # Utiliser le nom du fichier comme titre par défaut
     title = filename.rsplit('.', 1)[0]
     
-    return title, content
+    return title, content, pages
 
-def perform_clustering(texts, doc_ids, n_docs):
-    """Effectue le clustering des documents"""
-    if n_docs < 2:
-        return [{'cluster_id': 0, 'documents': doc_ids, 'name': 'Tous les documents'}]
+class EmbeddingModel:
+    """Modèle sentence-transformers partagé par le processus, chargé une seule fois.
+    
+    Le chargement est paresseux (au premier encodage) ou anticipé au démarrage avec
+    EMBEDDING_PRELOAD ; un échec de chargement est mémorisé pour ne pas être retenté à chaque appel.
+    """
+    
+    backend = 'sentence_transformers'
+    
+    def __init__(self, model_name, batch_size=64, num_threads=0):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.model = None
+        self.error = None
+        self.lock = threading.Lock()
+    
+    def get(self):
+        """Retourne le modèle, en le chargeant si nécessaire"""
+        if self.model is not None:
+            return self.model
+        
+        with self.lock:
+            if self.model is None:
+                if self.error is not None:
+                    raise self.error
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    if self.num_threads:
+                        import torch
+                        torch.set_num_threads(self.num_threads)
+                    self.model = SentenceTransformer(self.model_name)
+                except Exception as e:
+                    print(f"Modèle d'embeddings indisponible ({self.model_name}): {e}")
+                    self.error = e
+                    raise
+        return self.model
+    
+    def encode(self, texts):
+        """Encode des textes en vecteurs normalisés"""
+        return self.get().encode(
+            texts, batch_size=self.batch_size, convert_to_numpy=True, normalize_embeddings=True
+        )
+    
+    def warm_up(self):
+        """Charge le modèle en arrière-plan"""
+        def load():
+            try:
+                self.get()
+            except Exception as e:
+                print(f"Erreur chargement du modèle d'embeddings: {e}")
+        
+        threading.Thread(target=load, daemon=True).start()
+
+embedding_model = EmbeddingModel(
+    app.config['EMBEDDING_MODEL'], app.config['EMBEDDING_BATCH_SIZE'], app.config['EMBEDDING_THREADS']
+)
+if app.config['EMBEDDING_PRELOAD'] and app.config['EMBEDDING_BACKEND'] != 'hashing':
+    embedding_model.warm_up()
+
+class HashingEmbeddingModel:
+    """Backend d'embeddings local, sans téléchargement de modèle.
+    
+    Les n-grammes de caractères sont hachés (HashingVectorizer) puis projetés en faible dimension
+    par une projection aléatoire creuse à graine fixe : sans apprentissage, le vecteur d'un texte
+    ne dépend pas du corpus et peut donc être mis en cache.
+    """
+    
+    backend = 'hashing'
+    
+    def __init__(self, dimensions=256, ngram_range=(2, 4), n_features=2 ** 18, chunk_size=1000):
+        self.model_name = f'hashing-char{ngram_range[0]}-{ngram_range[1]}-{n_features}-{dimensions}'
+        self.chunk_size = chunk_size
+        self.vectorizer = HashingVectorizer(
+            analyzer='char_wb', ngram_range=ngram_range, n_features=n_features,
+            alternate_sign=False, norm='l2', dtype=np.float32
+        )
+        # La matrice de projection ne dépend que du nombre de features et de la graine
+        self.projection = SparseRandomProjection(n_components=dimensions, dense_output=True, random_state=42)
+        self.projection.fit(sp.csr_matrix((1, n_features), dtype=np.float32))
+    
+    def encode(self, texts):
+        """Encode des textes en vecteurs normalisés, par blocs pour borner la mémoire"""
+        chunks = []
+        for start in range(0, len(texts), self.chunk_size):
+            hashed = self.vectorizer.transform(texts[start:start + self.chunk_size])
+            chunks.append(normalize(self.projection.transform(hashed)))
+        
+        if not chunks:
+            return np.zeros((0, self.projection.n_components), dtype=np.float32)
+        return np.vstack(chunks).astype(np.float32, copy=False)
+
+hashing_embedding_model = HashingEmbeddingModel(app.config['EMBEDDING_HASHING_DIMENSIONS'])
+
+def get_embedding_backend():
+    """Backend d'embeddings actif selon EMBEDDING_BACKEND.
+    
+    'auto' utilise sentence-transformers si le modèle peut être chargé, le hachage local sinon.
+    """
+    backend = app.config['EMBEDDING_BACKEND']
+    
+    if backend == 'hashing':
+        return hashing_embedding_model
+    if backend == 'sentence_transformers':
+        embedding_model.get()
+        return embedding_model
     
-    # Essayer d'importer sentence-transformers dynamiquement
     try:
-        from sentence_transformers import SentenceTransformer
-        model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-        embeddings = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
-    except Exception as e:
-        print(f"Erreur embeddings: {e}")
-        return perform_simple_clustering(texts, doc_ids, n_docs)
+        embedding_model.get()
+        return embedding_model
+    except Exception:
+        return hashing_embedding_model
+
+class EmbeddingCache:
+    """Cache persistant des embeddings, indexé par hash du texte encodé.
     
-    # Déterminer le nombre optimal de clusters
-    max_k = min(10, n_docs // 2)
-    min_k = 2
+    Les vecteurs sont stockés dans une matrice `.npy` ouverte en mémoire partagée (memmap)
+    et l'index hash -> ligne dans SQLite. Le cache est vidé si le modèle change.
+    `get_encoder` retourne le backend d'embeddings actif (voir get_embedding_backend).
+    """
     
-    if max_k < min_k:
-        return [{'cluster_id': 0, 'documents': doc_ids, 'name': 'Tous les documents'}]
+    def __init__(self, folder, get_encoder, dtype='float32'):
+        self.folder = folder
+        self.get_encoder = get_encoder
+        self.model_name = None
+        self.dtype = np.dtype(dtype)
+        self.matrix_path = os.path.join(folder, 'vectors.npy')
+        self.lock = threading.Lock()
+        self.matrix = None
+        self.rows = None
+        self.size = 0
+        
+        os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(folder, 'index.sqlite3'), check_same_thread=False, timeout=30)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings_meta (key TEXT PRIMARY KEY, value TEXT)")
     
-    best_k = min_k
-    best_score = -1
+    @staticmethod
+    def make_key(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
     
-    for k in range(min_k, max_k + 1):
-        try:
-            kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-            labels = kmeans.fit_predict(embeddings)
+    def load(self, encoder):
+        """Ouvre la matrice et l'index correspondant au backend (appelé sous verrou)"""
+        if self.rows is not None and self.model_name == encoder.model_name:
+            return
+        
+        model_row = self.connection.execute(
+            "SELECT value FROM embeddings_meta WHERE key = 'model'"
+        ).fetchone()
+        if model_row is None or model_row[0] != encoder.model_name or not os.path.exists(self.matrix_path):
+            self.reset(encoder.model_name)
+            return
+        
+        self.matrix = np.load(self.matrix_path, mmap_mode='r+')
+        self.rows = dict(self.connection.execute("SELECT hash, row FROM embeddings"))
+        self.size = len(self.rows)
+        self.model_name = encoder.model_name
+    
+    def reset(self, model_name):
+        """Vide le cache (index et matrice)"""
+        with self.connection:
+            self.connection.execute("DELETE FROM embeddings")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO embeddings_meta (key, value) VALUES ('model', ?)",
+                (model_name,)
+            )
+        self.model_name = model_name
+        self.matrix = None
+        self.rows = {}
+        self.size = 0
+        if os.path.exists(self.matrix_path):
+            os.remove(self.matrix_path)
+    
+    def clear(self):
+        with self.lock:
+            self.rows = None
+            self.reset(self.model_name)
+    
+    def reserve(self, count, dimension):
+        """Agrandit la matrice (capacité doublée) pour accueillir `count` nouvelles lignes"""
+        capacity = self.matrix.shape[0] if self.matrix is not None else 0
+        if self.size + count <= capacity:
+            return
+        
+        new_capacity = max(1024, capacity * 2, self.size + count)
+        tmp_path = self.matrix_path + '.tmp.npy'
+        matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=self.dtype, shape=(new_capacity, dimension))
+        if self.size:
+            matrix[:self.size] = self.matrix[:self.size]
+        matrix.flush()
+        del matrix
+        
+        self.matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self.matrix = np.load(self.matrix_path, mmap_mode='r+')
+    
+    def add(self, encoder, keys, vectors):
+        """Ajoute des vecteurs à la matrice puis les enregistre dans l'index"""
+        with self.lock:
+            self.load(encoder)
+            new_entries = [(key, vector) for key, vector in zip(keys, vectors) if key not in self.rows]
+            if not new_entries:
+                return
             
-            if len(set(labels)) > 1:
-                score = silhouette_score(embeddings, labels)
-                if score > best_score:
-                    best_score = score
-                    best_k = k
-        except Exception:
-            continue
+            self.reserve(len(new_entries), vectors.shape[1])
+            start = self.size
+            for offset, (key, vector) in enumerate(new_entries):
+                self.matrix[start + offset] = vector
+            self.matrix.flush()
+            
+            # L'index n'est écrit qu'une fois les vecteurs sur disque
+            entries = [(key, start + offset) for offset, (key, vector) in enumerate(new_entries)]
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO embeddings (hash, row) VALUES (?, ?)", entries)
+            self.rows.update(entries)
+            self.size += len(entries)
+    
+    def encode_missing(self, texts):
+        """Encode et enregistre les textes absents du cache"""
+        # Résolu hors verrou : le premier appel peut charger le modèle
+        encoder = self.get_encoder()
+        with self.lock:
+            self.load(encoder)
+            missing = {}
+            for text in texts:
+                key = self.make_key(text)
+                if key not in self.rows:
+                    missing.setdefault(key, text)
+        
+        if missing:
+            keys = list(missing)
+            vectors = encoder.encode([missing[key] for key in keys])
+            self.add(encoder, keys, np.asarray(vectors, dtype=self.dtype))
+        
+        return len(missing)
+    
+    def get_embeddings(self, texts):
+        """Retourne la matrice des embeddings des textes (les textes absents sont encodés).
+        
+        Si les lignes sont contiguës, la matrice retournée est une vue sur le memmap (sans copie).
+        """
+        self.encode_missing(texts)
+        
+        with self.lock:
+            rows = np.fromiter((self.rows[self.make_key(text)] for text in texts), dtype=np.int64, count=len(texts))
+            if len(rows) and np.array_equal(rows, np.arange(rows[0], rows[0] + len(rows))):
+                embeddings = self.matrix[rows[0]:rows[0] + len(rows)]
+            else:
+                embeddings = self.matrix[rows]
+        
+        return embeddings.astype(np.float32, copy=False)
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'model': self.model_name,
+                'entries': self.size,
+                'capacity': self.matrix.shape[0] if self.matrix is not None else 0,
+                'dtype': self.dtype.name
+            }
+
+embedding_cache = EmbeddingCache(
+    app.config['EMBEDDING_CACHE_FOLDER'], get_embedding_backend, app.config['EMBEDDING_CACHE_DTYPE']
+)
+_embedding_executor = ThreadPoolExecutor(max_workers=1)
+
+def get_clustering_text(document):
+    """Texte d'un document utilisé pour les embeddings"""
+    return f"{document.get('title', '')} {document.get('content', '')}"
+
+def precompute_embeddings(texts):
+    """Calcule en arrière-plan les embeddings des documents venant d'être importés"""
+    if not app.config['EMBEDDING_PRECOMPUTE'] or not texts:
+        return
+    
+    def compute():
+        try:
+            embedding_cache.encode_missing(texts)
+        except Exception as e:
+            print(f"Erreur précalcul des embeddings: {e}")
+    
+    _embedding_executor.submit(compute)
+
+def parse_k_range(data):
+    """Nombre de clusters demandé : k fixe (n_clusters) ou plage (min_clusters, max_clusters)"""
+    k_range = {}
+    for key in ['n_clusters', 'min_clusters', 'max_clusters']:
+        if data.get(key):
+            k_range[key] = int(data[key])
+    return k_range
+
+def get_candidate_k(n_docs, default_max_k, k_range=None):
+    """Valeurs de k à évaluer"""
+    k_range = k_range or {}
+    
+    if k_range.get('n_clusters'):
+        return [max(1, min(k_range['n_clusters'], n_docs))]
+    
+    min_k = max(2, k_range.get('min_clusters') or 2)
+    if k_range.get('max_clusters'):
+        max_k = min(k_range['max_clusters'], n_docs - 1)
+    else:
+        max_k = min(default_max_k, n_docs // 2)
+    
+    return list(range(min_k, max_k + 1))
+
+def fit_kmeans(vectors, k):
+    """Ajuste un KMeans (MiniBatchKMeans au-delà de CLUSTERING_MINIBATCH_THRESHOLD documents)"""
+    if vectors.shape[0] > app.config['CLUSTERING_MINIBATCH_THRESHOLD']:
+        model = MiniBatchKMeans(
+            n_clusters=k, random_state=42, n_init=3, batch_size=app.config['CLUSTERING_BATCH_SIZE']
+        )
+    else:
+        model = KMeans(n_clusters=k, random_state=42, n_init=10)
+    return model.fit_predict(vectors)
+
+def score_clustering(vectors, labels, metric='euclidean'):
+    """Silhouette calculée sur un échantillon (coût constant quelle que soit la taille du corpus)"""
+    sample_size = app.config['CLUSTERING_SILHOUETTE_SAMPLE']
+    if vectors.shape[0] <= sample_size:
+        sample_size = None
+    return silhouette_score(vectors, labels, metric=metric, sample_size=sample_size, random_state=42)
+
+def select_clustering(vectors, k_values, metric='euclidean'):
+    """Évalue les valeurs de k en parallèle et retourne les labels du meilleur modèle (sans réajustement)"""
+    if len(k_values) == 1:
+        return fit_kmeans(vectors, k_values[0])
     
-    # Clustering final
-    kmeans = KMeans(n_clusters=best_k, random_state=42, n_init=10)
-    labels = kmeans.fit_predict(embeddings)
+    def evaluate(k):
+        try:
+            labels = fit_kmeans(vectors, k)
+            score = score_clustering(vectors, labels, metric) if len(set(labels)) > 1 else -1
+            return score, labels
+        except Exception as e:
+            print(f"Erreur clustering k={k}: {e}")
+            return None
     
-    # Organiser les résultats
+    results = [result for result in run_in_parallel(evaluate, k_values, app.config['CLUSTERING_MAX_WORKERS']) if result]
+    if not results:
+        return fit_kmeans(vectors, k_values[0])
+    
+    # Premier meilleur score : à égalité, le plus petit k l'emporte
+    best_score, best_labels = max(results, key=lambda result: result[0])
+    return best_labels
+
+def build_clusters(doc_ids, labels):
+    """Structure de retour du clustering : documents regroupés par label"""
     clusters = {}
-    for i, (doc_id, label) in enumerate(zip(doc_ids, labels)):
+    for doc_id, label in zip(doc_ids, labels):
         if label not in clusters:
             clusters[label] = []
         clusters[label].append(doc_id)
     
-    # Créer la structure de retour
     result = []
     for cluster_id, documents in clusters.items():
         result.append({
@@ -157,57 +982,57 @@ def perform_clustering(texts, doc_ids, n_docs):
     
     return result
 
-def perform_simple_clustering(texts, doc_ids, n_docs):
-    """Clustering simple basé sur TF-IDF"""
+def perform_clustering(texts, doc_ids, n_docs, k_range=None):
+    """Effectue le clustering des documents"""
+    if n_docs < 2:
+        return [{'cluster_id': 0, 'documents': doc_ids, 'name': 'Tous les documents'}]
+    
+    # Embeddings lus dans le cache persistant : seuls les nouveaux textes sont encodés
     try:
-        # Utiliser TF-IDF pour vectoriser les textes
-        vectorizer = TfidfVectorizer(max_features=1000, stop_words=None)
-        tfidf_matrix = vectorizer.fit_transform(texts)
-        
-        # Déterminer le nombre optimal de clusters
-        max_k = min(5, n_docs // 2)
-        min_k = 2
+        embeddings = embedding_cache.get_embeddings(texts)
+    except Exception as e:
+        print(f"Erreur embeddings: {e}")
+        return perform_simple_clustering(texts, doc_ids, n_docs, k_range)
+    
+    # Déterminer le nombre de clusters
+    k_values = get_candidate_k(n_docs, 10, k_range)
+    
+    if not k_values:
+        return [{'cluster_id': 0, 'documents': doc_ids, 'name': 'Tous les documents'}]
+    
+    labels = select_clustering(embeddings, k_values)
+    
+    return build_clusters(doc_ids, labels)
+
+def perform_simple_clustering(texts, doc_ids, n_docs, k_range=None):
+    """Clustering simple basé sur TF-IDF.
+    
+    La matrice reste creuse (CSR) de bout en bout : KMeans et la silhouette (cosinus)
+    travaillent directement dessus, ou sur une réduction LSA si TFIDF_SVD_COMPONENTS est défini.
+    """
+    try:
+        # Utiliser TF-IDF pour vectoriser les textes (lignes normalisées L2)
+        stop_words = FRENCH_STOP_WORDS if app.config['TFIDF_STOP_WORDS'] == 'french' else app.config['TFIDF_STOP_WORDS']
+        vectorizer = TfidfVectorizer(
+            max_features=app.config['TFIDF_MAX_FEATURES'], stop_words=stop_words, dtype=np.float32
+        )
+        vectors = vectorizer.fit_transform(texts)
         
-        if max_k < min_k:
-            return [{'cluster_id': 0, 'documents': doc_ids, 'name': 'Tous les documents'}]
+        # Réduction LSA optionnelle (vecteurs denses de petite dimension)
+        n_components = app.config['TFIDF_SVD_COMPONENTS']
+        if n_components and n_components < vectors.shape[1]:
+            svd = TruncatedSVD(n_components=n_components, random_state=42)
+            vectors = normalize(svd.fit_transform(vectors))
         
-        best_k = min_k
-        best_score = -1
+        # Déterminer le nombre de clusters
+        k_values = get_candidate_k(n_docs, 5, k_range)
         
-        for k in range(min_k, max_k + 1):
-            try:
-                kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-                labels = kmeans.fit_predict(tfidf_matrix.toarray())
-                
-                if len(set(labels)) > 1:
-                    score = silhouette_score(tfidf_matrix.toarray(), labels)
-                    if score > best_score:
-                        best_score = score
-                        best_k = k
-            except Exception:
-                continue
+        if not k_values:
+            return [{'cluster_id': 0, 'documents': doc_ids, 'name': 'Tous les documents'}]
         
-        # Clustering final
-        kmeans = KMeans(n_clusters=best_k, random_state=42, n_init=10)
-        labels = kmeans.fit_predict(tfidf_matrix.toarray())
-        
-        # Organiser les résultats
-        clusters = {}
-        for i, (doc_id, label) in enumerate(zip(doc_ids, labels)):
-            if label not in clusters:
-                clusters[label] = []
-            clusters[label].append(doc_id)
-        
-        # Créer la structure de retour
-        result = []
-        for cluster_id, documents in clusters.items():
-            result.append({
-                'cluster_id': int(cluster_id),
-                'documents': documents,
-                'name': f'Cluster {cluster_id + 1}'
-            })
+        labels = select_clustering(vectors, k_values, metric='cosine')
         
-        return result
+        return build_clusters(doc_ids, labels)
         
     except Exception as e:
         print(f"Erreur clustering simple: {e}")
@@ -215,80 +1040,9 @@ def perform_simple_clustering(texts, doc_ids, n_docs):
 
 def name_clusters_with_mistral(clusters, api_key, instructions):
     """Nomme les clusters avec Mistral"""
-    try:
-        from mistralai import Mistral
-        client = Mistral(api_key=api_key)
-    except ImportError:
-        raise Exception("Mistral AI n'est pas disponible. Veuillez installer mistralai.")
-    
     try:
         for cluster in clusters:
-            # Récupérer les documents du cluster
-            doc_ids = cluster['documents']
-            documents = []
-            
-            for doc_id in doc_ids:
-                json_path = os.path.join(app.config['JSON_FOLDER'], f"{doc_id}.json")
-                if os.path.exists(json_path):
-                    with open(json_path, 'r', encoding='utf-8') as file:
-                        doc_data = json.load(file)
-                        documents.append({
-                            'title': doc_data.get('title', ''),
-                            'content': doc_data.get('content', '')[:1000]  # Limiter la taille
-                        })
-            
-            if not documents:
-                continue
-            
-            # Préparer le prompt
-            samples_text = ""
-            for i, doc in enumerate(documents[:5]):  # Max 5 documents
-                samples_text += f"Document {i+1}:\n"
-                samples_text += f"Titre: {doc['title']}\n"
-                samples_text += f"Contenu: {doc['content'][:500]}...\n\n"
-            
-            system_prompt = (
-                "Tu es un expert en catégorisation de documents. "
-                "Analyse les documents suivants et donne UNIQUEMENT le nom de la catégorie "
-                "en 1-4 mots clairs et précis. "
-                "Réponds uniquement avec le nom de la catégorie, sans explication."
-            )
-            
-            if instructions:
-                system_prompt += f"\n\nConsignes spécifiques: {instructions}"
-            
-            user_prompt = f"Documents du cluster:\n\n{samples_text}"
-            
-            # Appel à Mistral
-            response = client.chat.complete(
-                model="mistral-large-latest",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.2,
-                max_tokens=50
-            )
-            
-            cluster_name = response.choices[0].message.content.strip()
-            # Nettoyer le nom
-            cluster_name = cluster_name.replace('"', '').replace("'", '').strip()
-            if not cluster_name:
-                cluster_name = f"Cluster {cluster['cluster_id'] + 1}"
-            
-            cluster['name'] = cluster_name
-            
-            # Mettre à jour les documents avec la catégorie
-            for doc_id in doc_ids:
-                json_path = os.path.join(app.config['JSON_FOLDER'], f"{doc_id}.json")
-                if os.path.exists(json_path):
-                    with open(json_path, 'r', encoding='utf-8') as file:
-                        doc_data = json.load(file)
-                    
-                    doc_data['category'] = cluster_name
-                    
-                    with open(json_path, 'w', encoding='utf-8') as file:
-                        json.dump(doc_data, file, ensure_ascii=False, indent=2)
+            name_cluster_with_mistral(cluster, api_key, instructions)
         
         return clusters
         
@@ -296,22 +1050,73 @@ def name_clusters_with_mistral(clusters, api_key, instructions):
         print(f"Erreur Mistral: {e}")
         raise e
 
-def create_cluster_visualization(documents):
-    """Crée une visualisation des clusters"""
+def name_cluster_with_mistral(cluster, api_key, instructions):
+    """Nomme un cluster avec Mistral et met à jour la catégorie de ses documents"""
+    # Récupérer les documents du cluster
+    doc_ids = cluster['documents']
+    documents = []
+    
+    for doc_id in doc_ids:
+        doc_data = load_document(doc_id)
+        if doc_data is not None:
+            documents.append({
+                'title': doc_data.get('title', ''),
+                'content': doc_data.get('content', '')[:1000]  # Limiter la taille
+            })
+    
+    if not documents:
+        return cluster
+    
+    # Préparer le prompt
+    samples_text = ""
+    for i, doc in enumerate(documents[:5]):  # Max 5 documents
+        samples_text += f"Document {i+1}:\n"
+        samples_text += f"Titre: {doc['title']}\n"
+        samples_text += f"Contenu: {doc['content'][:500]}...\n\n"
+    
+    system_prompt = (
+        "Tu es un expert en catégorisation de documents. "
+        "Analyse les documents suivants et donne UNIQUEMENT le nom de la catégorie "
+        "en 1-4 mots clairs et précis. "
+        "Réponds uniquement avec le nom de la catégorie, sans explication."
+    )
+    
+    if instructions:
+        system_prompt += f"\n\nConsignes spécifiques: {instructions}"
+    
+    user_prompt = f"Documents du cluster:\n\n{samples_text}"
+    
+    # Appel à Mistral
+    cluster_name = mistral_chat(
+        api_key,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.2,
+        max_tokens=50
+    ).strip()
+    # Nettoyer le nom
+    cluster_name = cluster_name.replace('"', '').replace("'", '').strip()
+    if not cluster_name:
+        cluster_name = f"Cluster {cluster['cluster_id'] + 1}"
+    
+    cluster['name'] = cluster_name
+    
+    # Mettre à jour les documents avec la catégorie
+    for doc_id in doc_ids:
+        update_document_category_in_db(doc_id, cluster_name)
+    
+    return cluster
+
+def create_cluster_visualization(category_counts):
+    """Crée une visualisation des clusters à partir du nombre de documents par catégorie"""
     try:
-        # Préparer les données
-        categories = {}
-        for doc in documents:
-            category = doc.get('category', 'Non catégorisé')
-            if category not in categories:
-                categories[category] = []
-            categories[category].append(doc)
-        
         # Créer le graphique
         fig, ax = plt.subplots(figsize=(10, 6))
         
-        category_names = list(categories.keys())
-        category_counts = [len(docs) for docs in categories.values()]
+        category_names = list(category_counts.keys())
+        category_counts = list(category_counts.values())
         
         # Couleurs
         colors = plt.cm.Set3(np.linspace(0, 1, len(category_names)))
@@ -354,10 +1159,6 @@ def generate_fields_with_ai(category, documents, num_fields, existing_fields, ap
         if not api_key:
             return generate_fields_basic(category, documents, num_fields, existing_fields)
         
-        # Appel à Mistral AI
-        from mistralai import Mistral
-        client = Mistral(api_key=api_key)
-        
         # Préparer les exemples (1-2 documents)
         examples = []
         for doc in documents[:2]:
@@ -391,8 +1192,8 @@ Réponds uniquement avec le JSON des champs.
 """
         
         # Appel à Mistral
-        response = client.chat.complete(
-            model="mistral-large-latest",
+        response_text = mistral_chat(
+            api_key,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
@@ -402,13 +1203,10 @@ Réponds uniquement avec le JSON des champs.
         )
         
         # Parser la réponse JSON
-        response_text = response.choices[0].message.content.strip()
+        response_text = response_text.strip()
         
         # Nettoyer la réponse (enlever markdown si présent)
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0]
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0]
+        response_text = clean_json_response(response_text)
         
         # Parser le JSON
         import json
@@ -490,151 +1288,378 @@ def generate_fields_basic(category, documents, num_fields, existing_fields):
 def index():
     return render_template('index.html')
 
+def save_upload(file, filename, upload_folder=None):
+    """Enregistre un fichier uploadé sous le nom de son contenu (SHA-256), calculé pendant l'écriture.
+    
+    Retourne (chemin, hash). Un fichier identique déjà présent n'est pas réécrit.
+    """
+    upload_folder = upload_folder or app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    sha256 = hashlib.sha256()
+    temp_path = os.path.join(upload_folder, f".upload-{uuid.uuid4()}")
+    
+    with open(temp_path, 'wb') as output:
+        while True:
+            chunk = file.stream.read(1024 * 1024)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            output.write(chunk)
+    
+    content_hash = sha256.hexdigest()
+    file_path = os.path.join(upload_folder, f"{content_hash}.{filename.rsplit('.', 1)[1].lower()}")
+    if os.path.exists(file_path):
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, file_path)
+    
+    return file_path, content_hash
+
 @app.route('/upload', methods=['POST'])
 def upload_files():
-    """Gère l'upload des fichiers"""
+    """Enregistre les fichiers et lance leur traitement (extraction du texte, OCR) en tâche de fond.
+    
+    La réponse est immédiate (202) ; l'état de chaque fichier est suivi avec GET /jobs/<job_id>.
+    Une tâche est créée même si tous les fichiers sont des doublons ignorés (elle se termine aussitôt).
+    Les fichiers déjà importés (même contenu) sont traités selon la politique `duplicates` :
+    'skip' (ignorés), 'link' (nouveau document reprenant le contenu et l'extraction existants,
+    sans nouveau traitement) ou 'version' (nouvelle version, traitée à nouveau).
+    """
     if 'files' not in request.files:
         return jsonify({'error': 'Aucun fichier sélectionné'}), 400
     
+    policy = request.form.get('duplicates') or app.config['UPLOAD_DUPLICATE_POLICY']
+    if policy not in ['skip', 'link', 'version']:
+        return jsonify({'error': f'Politique de doublons inconnue: {policy}'}), 400
+    
     files = request.files.getlist('files')
     uploaded_documents = []
+    duplicates = []
+    files_info = {}
+    # Hash -> document de cette requête : un fichier répété est un doublon du premier
+    request_hashes = {}
     
-    for file in files:
-        if file and file.filename and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            # Traiter le document
-            title, content = process_document(file_path, filename)
-            
-            # Créer un ID unique pour le document
-            doc_id = str(uuid.uuid4())
-            
-            # Sauvegarder en JSON
-            json_data = {
-                'id': doc_id,
-                'title': title,
-                'content': content,
-                'filename': filename,
-                'type': 'document'
-            }
-            
-            json_path = os.path.join(app.config['JSON_FOLDER'], f"{doc_id}.json")
-            with open(json_path, 'w', encoding='utf-8') as json_file:
-                json.dump(json_data, json_file, ensure_ascii=False, indent=2)
+    reserved_ids = []
+    job = None
+    try:
+        for file in files:
+            if file and file.filename and allowed_file(file.filename):
+                filename = secure_filename(file.filename)
+                file_path, content_hash = save_upload(file, filename)
+                
+                # L'identifiant du document est attribué dès l'upload et enregistré comme en attente
+                # avant la réservation du hash : un upload concurrent ne le prend pas pour un orphelin
+                doc_id = str(uuid.uuid4())
+                file_info = {'filename': filename, 'path': file_path, 'content_hash': content_hash}
+                with _jobs_lock:
+                    _pending_upload_ids.add(doc_id)
+                reserved_ids.append(doc_id)
+                
+                if content_hash in request_hashes:
+                    existing_id = request_hashes[content_hash]
+                else:
+                    existing_id = document_store.claim_hash(content_hash, doc_id)
+                    if existing_id != doc_id and load_document(existing_id) is None and not is_ingestion_pending(existing_id):
+                        # Association orpheline (document supprimé ou jamais créé) : le fichier est importé normalement
+                        document_store.set_hash(content_hash, doc_id)
+                        existing_id = doc_id
+                if existing_id != doc_id:
+                    duplicates.append({'filename': filename, 'duplicate_of': existing_id, 'policy': policy})
+                    if policy == 'skip':
+                        continue
+                    if policy == 'link':
+                        file_info['link_to'] = existing_id
+                    else:
+                        file_info['previous_version'] = existing_id
+                        document_store.set_hash(content_hash, doc_id)
+                
+                if not file_info.get('link_to'):
+                    request_hashes[content_hash] = doc_id
+                files_info[doc_id] = file_info
+                uploaded_documents.append({
+                    'id': doc_id,
+                    'title': filename.rsplit('.', 1)[0],
+                    'filename': filename,
+                    'type': 'document',
+                    'status': 'pending',
+                    'duplicate_of': existing_id if existing_id != doc_id else None
+                })
+        
+        if not files_info and not duplicates:
+            return jsonify({'error': 'Aucun fichier valide'}), 400
+        
+        with _jobs_lock:
+            # Les documents passent de l'upload en cours à la tâche sans instant où ils ne sont plus en attente
+            job = create_job('ingestion', {'files': files_info}, list(files_info))
+            for doc_id, file_info in files_info.items():
+                job['progress']['documents'][doc_id]['filename'] = file_info['filename']
+            save_job(job)
+    finally:
+        with _jobs_lock:
+            _pending_upload_ids.difference_update(reserved_ids)
+        if job is None:
+            # Requête interrompue : les hashes réservés ne doivent pas bloquer un nouvel upload
+            for doc_id, file_info in files_info.items():
+                release_upload_hash(file_info, doc_id)
+    start_job(job, None)
+    
+    return jsonify({'job_id': job['id'], 'documents': uploaded_documents, 'duplicates': duplicates}), 202
+
+def spreadsheet_header(values):
+    """Noms de colonnes d'une ligne d'en-tête, nommés comme pandas (Unnamed: i, doublons suffixés .1, .2...)"""
+    header = []
+    seen = {}
+    for index, value in enumerate(values):
+        name = str(value) if value is not None and str(value) != '' else f'Unnamed: {index}'
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        header.append(name)
+    return header
+
+def spreadsheet_cell_text(value):
+    """Texte d'une cellule lue par openpyxl (vide si la cellule est vide)"""
+    return '' if value is None else str(value)
+
+def iter_spreadsheet_chunks(file_path, start_idx=0, end_idx=None, chunk_size=5000):
+    """Lit un fichier Excel/CSV par blocs de lignes (DataFrame de textes) sans le charger entièrement.
+    
+    start_idx, end_idx : positions des lignes de données à lire (end_idx exclu, None = jusqu'à la fin).
+    L'index de chaque bloc est la position de la ligne dans le fichier.
+    """
+    extension = file_path.rsplit('.', 1)[1].lower()
+    
+    if extension == 'csv':
+        position = 0
+        for chunk in pd.read_csv(file_path, dtype=str, keep_default_na=False, chunksize=chunk_size, nrows=end_idx):
+            chunk.index = pd.RangeIndex(position, position + len(chunk))
+            position += len(chunk)
+            if position > start_idx:
+                yield chunk.iloc[max(0, start_idx - chunk.index[0]):]
+    
+    elif extension == 'xlsx':
+        # Lecture en flux avec openpyxl (mode read-only)
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            header = spreadsheet_header(next(sheet.iter_rows(max_row=1, values_only=True), ()))
+            rows = sheet.iter_rows(
+                min_row=start_idx + 2, max_row=end_idx + 1 if end_idx is not None else None, values_only=True
+            )
             
-            uploaded_documents.append({
-                'id': doc_id,
-                'title': title,
-                'filename': filename,
-                'type': 'document'
-            })
+            # Sans dimension déclarée, les lignes lues peuvent être de longueurs différentes :
+            # chacune est complétée ou tronquée à la largeur de l'en-tête
+            width = len(header)
+            position = start_idx
+            chunk = []
+            for row in rows:
+                cells = [spreadsheet_cell_text(value) for value in row[:width]]
+                chunk.append(cells + [''] * (width - len(cells)))
+                if len(chunk) >= chunk_size:
+                    yield pd.DataFrame(chunk, columns=header, index=pd.RangeIndex(position, position + len(chunk)))
+                    position += len(chunk)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=header, index=pd.RangeIndex(position, position + len(chunk)))
+        finally:
+            workbook.close()
     
-    return jsonify({'documents': uploaded_documents})
+    else:
+        # Ancien format .xls : pas de lecture en flux possible
+        df = pd.read_excel(file_path, dtype=str, keep_default_na=False).iloc[start_idx:end_idx]
+        for offset in range(0, len(df), chunk_size):
+            yield df.iloc[offset:offset + chunk_size]
 
 @app.route('/upload_excel', methods=['POST'])
 def upload_excel():
-    """Gère l'upload et le traitement des fichiers Excel/CSV"""
-    if 'file' not in request.files:
-        return jsonify({'error': 'Aucun fichier sélectionné'}), 400
+    """Gère l'upload et le traitement des fichiers Excel/CSV.
     
-    file = request.files['file']
+    Le fichier est lu par blocs et les documents sont écrits par lots (une transaction par bloc).
+    La réponse ne contient qu'un aperçu des premières lignes (EXCEL_PREVIEW_ROWS).
+    """
     text_column = request.form.get('text_column')
     title_column = request.form.get('title_column', '')
-    start_row = int(request.form.get('start_row', 1))
-    end_row = int(request.form.get('end_row', 0))
+    start_row = int(request.form.get('start_row') or 1)
+    end_row = int(request.form.get('end_row') or 0)
     
-    if file and file.filename and allowed_file(file.filename):
+    # Fichier déjà envoyé à /get_excel_columns : réutilisé grâce à son jeton
+    upload_token = request.form.get('upload_token')
+    if upload_token and 'file' not in request.files:
+        sweep_upload_tokens()
+        file_path = get_upload_token_path(upload_token)
+        if file_path is None:
+            return jsonify({'error': 'Jeton d\'upload invalide ou expiré, veuillez renvoyer le fichier'}), 400
+        filename = secure_filename(request.form.get('filename') or upload_token)
+    elif 'file' in request.files:
+        file = request.files['file']
+        if not (file and file.filename and allowed_file(file.filename)):
+            return jsonify({'error': 'Fichier non valide'}), 400
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        try:
-            # Lire le fichier Excel ou CSV
-            if filename.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            else:
-                df = pd.read_excel(file_path)
-            
-            # Ajuster les indices pour commencer à 0
-            start_idx = start_row - 1
-            end_idx = end_row if end_row > 0 else len(df)
-            
-            # Filtrer les lignes
-            df_filtered = df.iloc[start_idx:end_idx]
-            
-            created_documents = []
+        file_path = save_upload(file, filename)[0]
+    else:
+        return jsonify({'error': 'Aucun fichier sélectionné'}), 400
+    
+    try:
+        # Ajuster les indices pour commencer à 0
+        start_idx = max(start_row - 1, 0)
+        end_idx = end_row if end_row > 0 else None
+        
+        created_documents = []
+        clustering_texts = []
+        total_rows = 0
+        
+        for chunk in iter_spreadsheet_chunks(file_path, start_idx, end_idx, app.config['EXCEL_CHUNK_SIZE']):
+            # Extraction vectorisée des colonnes texte et titre
+            if text_column in chunk.columns:
+                contents = chunk[text_column].astype(str)
+            else:
+                contents = pd.Series('', index=chunk.index)
+            if title_column and title_column in chunk.columns:
+                titles = chunk[title_column].astype(str)
+            else:
+                titles = 'Row ' + pd.Series(chunk.index + 1, index=chunk.index).astype(str)
             
-            for index, row in df_filtered.iterrows():
-                # Récupérer le contenu texte
-                content = str(row[text_column]) if text_column in df.columns else ""
-                
-                # Récupérer le titre
-                if title_column and title_column in df.columns:
-                    title = str(row[title_column])
-                else:
-                    title = f"Row {index + 1}"
-                
-                # Créer un ID unique
-                doc_id = str(uuid.uuid4())
-                
-                # Sauvegarder en JSON
-                json_data = {
-                    'id': doc_id,
+            documents = [
+                {
+                    'id': str(uuid.uuid4()),
                     'title': title,
                     'content': content,
                     'filename': filename,
-                    'row_index': index + 1,
+                    'row_index': int(position) + 1,
                     'type': 'excel_row'
                 }
-                
-                json_path = os.path.join(app.config['JSON_FOLDER'], f"{doc_id}.json")
-                with open(json_path, 'w', encoding='utf-8') as json_file:
-                    json.dump(json_data, json_file, ensure_ascii=False, indent=2)
-                
-                created_documents.append({
-                    'id': doc_id,
-                    'title': title,
-                    'content': content[:100] + "..." if len(content) > 100 else content,
-                    'row_index': index + 1
-                })
+                for position, title, content in zip(chunk.index, titles, contents)
+            ]
             
-            return jsonify({
-                'success': True,
-                'documents': created_documents,
-                'total_rows': len(df_filtered)
-            })
+            # Un seul lot d'écriture par bloc de lignes
+            document_store.save_many(documents)
+            total_rows += len(documents)
             
-        except Exception as e:
-            return jsonify({'error': f'Erreur lors du traitement du fichier: {str(e)}'}), 400
+            for json_data in documents:
+                clustering_texts.append(get_clustering_text(json_data))
+                if len(created_documents) < app.config['EXCEL_PREVIEW_ROWS']:
+                    content = json_data['content']
+                    created_documents.append({
+                        'id': json_data['id'],
+                        'title': json_data['title'],
+                        'content': content[:100] + "..." if len(content) > 100 else content,
+                        'row_index': json_data['row_index']
+                    })
+        
+        precompute_embeddings(clustering_texts)
+        
+        return jsonify({
+            'success': True,
+            'documents': created_documents,
+            'total_rows': total_rows
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors du traitement du fichier: {str(e)}'}), 400
+
+def count_csv_rows(file_path):
+    """Nombre de lignes de données d'un CSV, compté par blocs binaires sans analyser le fichier.
     
-    return jsonify({'error': 'Fichier non valide'}), 400
+    Approximatif si des champs entre guillemets contiennent des retours à la ligne.
+    """
+    lines = 0
+    last_byte = b'\n'
+    with open(file_path, 'rb') as file:
+        while True:
+            block = file.read(1024 * 1024)
+            if not block:
+                break
+            lines += block.count(b'\n')
+            last_byte = block[-1:]
+    if last_byte != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+def probe_spreadsheet(file_path):
+    """Colonnes et nombre de lignes d'un fichier Excel/CSV, en ne lisant que l'en-tête"""
+    extension = file_path.rsplit('.', 1)[1].lower()
+    
+    if extension == 'csv':
+        columns = list(pd.read_csv(file_path, nrows=0).columns)
+        return columns, count_csv_rows(file_path)
+    
+    if extension == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            columns = spreadsheet_header(next(sheet.iter_rows(max_row=1, values_only=True), ()))
+            # Dimensions enregistrées dans le classeur ; à défaut, les lignes sont comptées en flux
+            if sheet.max_row is not None:
+                total_rows = max(sheet.max_row - 1, 0)
+            else:
+                total_rows = sum(1 for _ in sheet.iter_rows(min_row=2, values_only=True))
+            return columns, total_rows
+        finally:
+            workbook.close()
+    
+    # Ancien format .xls : lecture complète
+    df = pd.read_excel(file_path)
+    return list(df.columns), len(df)
+
+def get_upload_token_path(upload_token):
+    """Chemin du fichier désigné par un jeton d'upload (hash du contenu + extension), None s'il est
+    invalide ou expiré (plus de UPLOAD_TOKEN_TTL secondes depuis l'analyse du fichier)"""
+    if not upload_token or not re.fullmatch(r'[0-9a-f]{64}\.[a-z]+', upload_token) or not allowed_file(upload_token):
+        return None
+    
+    file_path = os.path.join(app.config['UPLOAD_TOKEN_FOLDER'], upload_token)
+    try:
+        if time.time() - os.path.getmtime(file_path) > app.config['UPLOAD_TOKEN_TTL']:
+            return None
+    except OSError:
+        return None
+    return file_path
+
+def sweep_upload_tokens():
+    """Supprime les fichiers analysés dont le jeton a expiré"""
+    token_folder = app.config['UPLOAD_TOKEN_FOLDER']
+    if not os.path.exists(token_folder):
+        return
+    
+    expires_before = time.time() - app.config['UPLOAD_TOKEN_TTL']
+    for filename in os.listdir(token_folder):
+        file_path = os.path.join(token_folder, filename)
+        try:
+            if os.path.getmtime(file_path) < expires_before:
+                os.remove(file_path)
+        except OSError as e:
+            print(f"Erreur suppression jeton d'upload {filename}: {e}")
 
 @app.route('/get_excel_columns', methods=['POST'])
 def get_excel_columns():
-    """Récupère les colonnes d'un fichier Excel/CSV"""
+    """Récupère les colonnes d'un fichier Excel/CSV.
+    
+    Seul l'en-tête est lu. Le fichier est conservé UPLOAD_TOKEN_TTL secondes : le jeton
+    `upload_token` retourné permet à /upload_excel de le réutiliser sans nouvel envoi.
+    """
     if 'file' not in request.files:
         return jsonify({'error': 'Aucun fichier sélectionné'}), 400
     
+    sweep_upload_tokens()
+    
     file = request.files['file']
     if file and file.filename and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{filename}")
-        file.save(file_path)
+        file_path = save_upload(file, filename, app.config['UPLOAD_TOKEN_FOLDER'])[0]
+        # Un fichier déjà analysé voit la validité de son jeton renouvelée
+        os.utime(file_path)
         
         try:
-            if filename.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            else:
-                df = pd.read_excel(file_path)
-            
-            # Nettoyer le fichier temporaire
-            os.remove(file_path)
+            columns, total_rows = probe_spreadsheet(file_path)
             
             return jsonify({
-                'columns': list(df.columns),
-                'total_rows': len(df)
+                'columns': columns,
+                'total_rows': total_rows,
+                'upload_token': os.path.basename(file_path)
             })
             
         except Exception as e:
@@ -645,11 +1670,9 @@ def get_excel_columns():
 @app.route('/get_document/<doc_id>')
 def get_document(doc_id):
     """Récupère le contenu d'un document"""
-    json_path = os.path.join(app.config['JSON_FOLDER'], f"{doc_id}.json")
+    data = load_document(doc_id)
     
-    if os.path.exists(json_path):
-        with open(json_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+    if data is not None:
         return jsonify(data)
     
     return jsonify({'error': 'Document non trouvé'}), 404
@@ -659,24 +1682,65 @@ def categorization():
     """Page de catégorisation"""
     return render_template('categorization.html')
 
+def parse_document_query(args):
+    """Lit les paramètres de filtrage et de projection communs aux listes de documents.
+    
+    Retourne (query, fields) : les arguments de DocumentStore.build_query et la liste
+    des clés à conserver dans chaque document (None pour toutes). Lève ValueError si
+    excerpt n'est pas un entier positif.
+    """
+    query = {'filters': {column: args.get(column) for column in DocumentStore.FILTER_COLUMNS}}
+    
+    if args.get('uncategorized') in ['1', 'true']:
+        query['categorized'] = False
+    
+    fields = [field.strip() for field in args.get('fields', '').split(',') if field.strip()] or None
+    if fields is not None and 'content' not in fields:
+        query['include_content'] = False
+    elif args.get('excerpt'):
+        query['excerpt'] = int(args.get('excerpt'))
+        if query['excerpt'] <= 0:
+            raise ValueError('excerpt')
+    
+    return query, fields
+
+def project_document(document, fields):
+    """Ne conserve que les clés demandées d'un document (l'identifiant est toujours inclus)"""
+    if fields is None:
+        return document
+    projected = {key: document[key] for key in fields if key in document}
+    projected['id'] = document['id']
+    if document.get('content_truncated') and 'content' in projected:
+        projected['content_truncated'] = True
+    return projected
+
 @app.route('/get_all_documents')
 def get_all_documents():
-    """Récupère tous les documents pour la catégorisation"""
-    documents = []
-    json_folder = app.config['JSON_FOLDER']
+    """Récupère les documents pour la catégorisation.
     
-    if os.path.exists(json_folder):
-        for filename in os.listdir(json_folder):
-            if filename.endswith('.json'):
-                json_path = os.path.join(json_folder, filename)
-                try:
-                    with open(json_path, 'r', encoding='utf-8') as file:
-                        data = json.load(file)
-                        documents.append(data)
-                except Exception as e:
-                    print(f"Erreur lecture {filename}: {e}")
-    
-    return jsonify({'documents': documents})
+    Paramètres optionnels : fields (clés à inclure), excerpt (longueur du contenu),
+    category, type, filename, extraction_status, uncategorized, limit et cursor (pagination).
+    """
+    try:
+        query, fields = parse_document_query(request.args)
+        
+        if request.args.get('limit'):
+            limit = min(int(request.args.get('limit')), app.config['DOCUMENTS_PAGE_MAX'])
+            cursor = request.args.get('cursor')
+            documents, next_cursor = document_store.list_documents(
+                limit, after=int(cursor) if cursor else None, **query
+            )
+            return jsonify({
+                'documents': [project_document(document, fields) for document in documents],
+                'next_cursor': next_cursor
+            })
+        
+        documents = [project_document(document, fields) for document in document_store.iter_documents(**query)]
+        
+        return jsonify({'documents': documents})
+        
+    except ValueError:
+        return jsonify({'error': 'Paramètres de pagination ou excerpt invalides'}), 400
 
 @app.route('/cluster_documents', methods=['POST'])
 def cluster_documents():
@@ -695,12 +1759,11 @@ def cluster_documents():
         texts = []
         doc_ids = []
         for doc in documents:
-            text = f"{doc.get('title', '')} {doc.get('content', '')}"
-            texts.append(text)
+            texts.append(get_clustering_text(doc))
             doc_ids.append(doc['id'])
         
         # Clustering
-        clustering_result = perform_clustering(texts, doc_ids, len(documents))
+        clustering_result = perform_clustering(texts, doc_ids, len(documents), parse_k_range(data))
         
         # Nommage avec Mistral si clé API fournie
         if api_key:
@@ -730,17 +1793,7 @@ def update_document_category():
         if not doc_id or not category:
             return jsonify({'error': 'ID document et catégorie requis'}), 400
         
-        json_path = os.path.join(app.config['JSON_FOLDER'], f"{doc_id}.json")
-        
-        if os.path.exists(json_path):
-            with open(json_path, 'r', encoding='utf-8') as file:
-                doc_data = json.load(file)
-            
-            doc_data['category'] = category
-            
-            with open(json_path, 'w', encoding='utf-8') as file:
-                json.dump(doc_data, file, ensure_ascii=False, indent=2)
-            
+        if document_store.update(doc_id, category=category):
             return jsonify({'success': True})
         else:
             return jsonify({'error': 'Document non trouvé'}), 404
@@ -748,6 +1801,213 @@ def update_document_category():
     except Exception as e:
         return jsonify({'error': f'Erreur lors de la mise à jour: {str(e)}'}), 500
 
+_category_centroids = {}
+_category_centroids_lock = threading.Lock()
+
+def get_category_centroids(categories):
+    """Centroïdes (normalisés) des embeddings des documents déjà classés dans chaque catégorie.
+    
+    Un centroïde n'est recalculé que si la catégorie a changé (nombre de documents ou date de
+    dernière mise à jour) ou si le backend d'embeddings a changé. Les catégories vides n'ont pas
+    de centroïde.
+    """
+    if not categories:
+        return {}
+    
+    encoder_name = get_embedding_backend().model_name
+    placeholders = ', '.join('?' for _ in categories)
+    signatures = {
+        category: (encoder_name, count, last_update)
+        for category, count, last_update in document_store.connect().execute(
+            "SELECT category, COUNT(*), MAX(updated_at) FROM documents"
+            f" WHERE category IN ({placeholders}) GROUP BY category",
+            list(categories)
+        )
+    }
+    
+    centroids = {}
+    for category, signature in signatures.items():
+        with _category_centroids_lock:
+            cached = _category_centroids.get(category)
+        if cached and cached[0] == signature:
+            centroids[category] = cached[1]
+            continue
+        
+        texts = [
+            get_clustering_text(doc) for doc in document_store.iter_documents(
+                filters={'category': category}, limit=app.config['CATEGORY_CENTROID_MAX_DOCS']
+            )
+        ]
+        centroid = embedding_cache.get_embeddings(texts).mean(axis=0)
+        centroid = centroid / (np.linalg.norm(centroid) or 1.0)
+        with _category_centroids_lock:
+            _category_centroids[category] = (signature, centroid)
+        centroids[category] = centroid
+    
+    return centroids
+
+def assign_categories_by_centroid(documents, categories):
+    """Classe localement les documents par similarité cosinus avec les centroïdes des catégories.
+    
+    Retourne (assignations {id: catégorie}, documents ambigus). Un document est ambigu si l'écart
+    de similarité entre les deux catégories les plus proches est inférieur à CATEGORY_MARGIN_THRESHOLD.
+    """
+    centroids = get_category_centroids(categories)
+    
+    # Sans au moins deux catégories comparables (ou si certaines sont vides), tout passe par le LLM
+    if len(centroids) < 2 or len(centroids) < len(set(categories)):
+        return {}, documents
+    
+    names = list(centroids)
+    centroid_matrix = np.vstack([centroids[name] for name in names])
+    embeddings = embedding_cache.get_embeddings([get_clustering_text(doc) for doc in documents])
+    similarities = embeddings @ centroid_matrix.T
+    
+    top_two = np.argsort(-similarities, axis=1)[:, :2]
+    rows = np.arange(len(documents))
+    margins = similarities[rows, top_two[:, 0]] - similarities[rows, top_two[:, 1]]
+    
+    assignments = {}
+    ambiguous = []
+    for doc, best, margin in zip(documents, top_two[:, 0], margins):
+        if margin >= app.config['CATEGORY_MARGIN_THRESHOLD']:
+            assignments[doc['id']] = names[best]
+        else:
+            ambiguous.append(doc)
+    
+    return assignments, ambiguous
+
+def classify_document_with_mistral(doc, categories, api_key):
+    """Demande à Mistral la catégorie d'un document ; None si la réponse ne correspond à aucune catégorie"""
+    # Construire le prompt pour classifier le document
+    prompt = f"""Tu es un expert en classification de documents. 
+
+Voici un document à classer :
+Titre : {doc.get('title', 'Sans titre')}
+Contenu : {doc.get('content', '')[:app.config['CLASSIFICATION_EXCERPT_CHARS']]}...
+
+Voici les catégories disponibles :
+{', '.join(categories)}
+
+À quelle catégorie ce document appartient-il ? Réponds UNIQUEMENT avec le nom exact de la catégorie, rien d'autre."""
+    
+    # Appeler l'API Mistral
+    category = call_mistral_api(prompt, api_key)
+    
+    if not category:
+        print(f"Erreur API pour le document {doc['id']}. Document laissé non catégorisé.")
+        return None
+    
+    # Nettoyer et valider la réponse : enlever les guillemets, points, etc.
+    category = category.strip()
+    category = category.strip('"').strip("'").strip('.').strip()
+    
+    # Vérifier que la catégorie retournée existe dans la liste (recherche insensible à la casse)
+    for cat in categories:
+        if cat.lower() == category.lower() or category.lower() in cat.lower() or cat.lower() in category.lower():
+            return cat
+    
+    # Laisser le document non catégorisé plutôt que de le mettre dans la première catégorie
+    print(f"Catégorie '{category}' non trouvée dans {categories}. Document laissé non catégorisé.")
+    return None
+
+def pack_classification_batches(documents, categories):
+    """Regroupe les documents en lots dont le prompt tient dans CLASSIFICATION_BATCH_TOKENS (≈ 4 caractères par token)"""
+    excerpt_chars = app.config['CLASSIFICATION_EXCERPT_CHARS']
+    budget = app.config['CLASSIFICATION_BATCH_TOKENS'] * 4 - len(', '.join(categories)) - 600
+    max_docs = app.config['CLASSIFICATION_BATCH_MAX_DOCS']
+    
+    batches = []
+    batch = []
+    batch_size = 0
+    for doc in documents:
+        doc_size = len(doc.get('title') or '') + min(len(doc.get('content') or ''), excerpt_chars) + 40
+        if batch and (batch_size + doc_size > budget or len(batch) >= max_docs):
+            batches.append(batch)
+            batch = []
+            batch_size = 0
+        batch.append(doc)
+        batch_size += doc_size
+    if batch:
+        batches.append(batch)
+    
+    return batches
+
+def classify_batch_with_mistral(documents, categories, api_key):
+    """Classe plusieurs documents en un seul appel Mistral (réponse JSON numéro -> catégorie).
+    
+    Retourne {id: catégorie} pour les seules réponses correspondant exactement à une catégorie ;
+    les autres documents sont absents du résultat.
+    """
+    excerpt_chars = app.config['CLASSIFICATION_EXCERPT_CHARS']
+    excerpts = "\n\n".join(
+        f"[{index}] Titre : {doc.get('title', 'Sans titre')}\nContenu : {doc.get('content', '')[:excerpt_chars]}"
+        for index, doc in enumerate(documents, 1)
+    )
+    
+    prompt = f"""Tu es un expert en classification de documents.
+
+Voici les catégories disponibles :
+{json.dumps(categories, ensure_ascii=False)}
+
+Voici {len(documents)} documents à classer, chacun précédé de son numéro :
+
+{excerpts}
+
+Réponds UNIQUEMENT avec un objet JSON associant le numéro de chaque document (en chaîne) au nom exact de sa catégorie, par exemple {{"1": "{categories[0]}"}}."""
+    
+    longest_category = max(len(category) for category in categories)
+    response_text = mistral_chat(
+        api_key,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.1,
+        max_tokens=min(50 + len(documents) * (10 + longest_category // 2), 4000),
+        response_format={"type": "json_object"}
+    )
+    
+    answers = json.loads(clean_json_response(response_text.strip()))
+    if not isinstance(answers, dict):
+        raise ValueError("Format de réponse invalide")
+    
+    # Validation stricte : seul le nom exact (à la casse près) d'une catégorie est accepté
+    known_categories = {category.lower(): category for category in categories}
+    assignments = {}
+    for index, doc in enumerate(documents, 1):
+        answer = answers.get(str(index))
+        if isinstance(answer, str) and answer.strip().lower() in known_categories:
+            assignments[doc['id']] = known_categories[answer.strip().lower()]
+    
+    return assignments
+
+def classify_documents_with_mistral(documents, categories, api_key):
+    """Classe des documents avec Mistral : par lots, puis individuellement pour les réponses inexploitables"""
+    assignments = {}
+    
+    if app.config['CLASSIFICATION_MODE'] == 'batch' and len(documents) > 1:
+        def classify_batch(batch):
+            try:
+                return classify_batch_with_mistral(batch, categories, api_key)
+            except Exception as e:
+                print(f"Erreur classification par lot ({len(batch)} documents): {e}")
+                return {}
+        
+        for batch_assignments in run_in_parallel(classify_batch, pack_classification_batches(documents, categories)):
+            assignments.update(batch_assignments)
+    
+    def classify_single(doc):
+        try:
+            return classify_document_with_mistral(doc, categories, api_key)
+        except Exception as e:
+            print(f"Erreur lors de la classification du document {doc['id']}: {str(e)}")
+            # En cas d'erreur, laisser le document non catégorisé
+            return None
+    
+    remaining = [doc for doc in documents if doc['id'] not in assignments]
+    for doc, category in zip(remaining, run_in_parallel(classify_single, remaining)):
+        assignments[doc['id']] = category
+    
+    return assignments
+
 @app.route('/organize_documents_with_ai', methods=['POST'])
 def organize_documents_with_ai():
     """Organise les documents non catégorisés dans les catégories existantes avec IA"""
@@ -765,87 +2025,503 @@ def organize_documents_with_ai():
         if not categories:
             return jsonify({'error': 'Aucune catégorie disponible'}), 400
         
-        if not api_key:
+        # Le contenu complet est lu dans le stockage (la liste côté client peut être tronquée)
+        documents = [load_document(doc['id']) or doc for doc in documents]
+        
+        # Passe locale : similarité avec les centroïdes des catégories, le LLM ne reçoit que les cas ambigus
+        assignments = {}
+        ambiguous = documents
+        if app.config['CATEGORY_CENTROIDS_ENABLED']:
+            try:
+                assignments, ambiguous = assign_categories_by_centroid(documents, categories)
+            except Exception as e:
+                print(f"Erreur classification par centroïdes: {e}")
+        
+        if ambiguous and not api_key:
             return jsonify({'error': 'Clé API Mistral requise. Veuillez la configurer dans les paramètres.'}), 400
         
-        organized_documents = []
+        if ambiguous:
+            assignments.update(classify_documents_with_mistral(ambiguous, categories, api_key))
         
+        organized_documents = []
         for doc in documents:
-            try:
-                # Construire le prompt pour classifier le document
-                prompt = f"""Tu es un expert en classification de documents. 
-
-Voici un document à classer :
-Titre : {doc.get('title', 'Sans titre')}
-Contenu : {doc.get('content', '')[:1000]}...
-
-Voici les catégories disponibles :
-{', '.join(categories)}
-
-À quelle catégorie ce document appartient-il ? Réponds UNIQUEMENT avec le nom exact de la catégorie, rien d'autre."""
-                
-                # Appeler l'API Mistral
-                category = call_mistral_api(prompt, api_key)
-                
-                # Nettoyer et valider la réponse
-                if category:
-                    category = category.strip()
-                    # Enlever les guillemets, points, etc.
-                    category = category.strip('"').strip("'").strip('.').strip()
-                    
-                    # Vérifier que la catégorie retournée existe dans la liste (recherche insensible à la casse)
-                    matched_category = None
-                    for cat in categories:
-                        if cat.lower() == category.lower() or category.lower() in cat.lower() or cat.lower() in category.lower():
-                            matched_category = cat
-                            break
-                    
-                    if matched_category:
-                        organized_documents.append({
-                            'id': doc['id'],
-                            'category': matched_category
-                        })
-                        update_document_category_in_db(doc['id'], matched_category)
-                    else:
-                        # Si aucune correspondance exacte, essayer une correspondance partielle
-                        print(f"Catégorie '{category}' non trouvée dans {categories}. Tentative de correspondance partielle...")
-                        # Pour l'instant, laisser le document non catégorisé plutôt que de le mettre dans la première catégorie
-                        organized_documents.append({
-                            'id': doc['id'],
-                            'category': None
-                        })
-                else:
-                    print(f"Erreur API pour le document {doc['id']}. Document laissé non catégorisé.")
-                    # Laisser le document non catégorisé plutôt que de le mettre dans la première catégorie
-                    organized_documents.append({
-                        'id': doc['id'],
-                        'category': None
-                    })
-                    
-            except Exception as e:
-                print(f"Erreur lors de la classification du document {doc['id']}: {str(e)}")
-                # En cas d'erreur, laisser le document non catégorisé
-                organized_documents.append({
-                    'id': doc['id'],
-                    'category': None
-                })
+            category = assignments.get(doc['id'])
+            if category:
+                update_document_category_in_db(doc['id'], category)
+            organized_documents.append({
+                'id': doc['id'],
+                'category': category
+            })
         
         return jsonify({
             'success': True,
-            'organized_documents': organized_documents
+            'organized_documents': organized_documents,
+            'llm_classified': len(ambiguous)
         })
         
     except Exception as e:
         return jsonify({'error': f'Erreur lors de l\'organisation par IA: {str(e)}'}), 500
 
+class RateLimiter:
+    """Limiteur de débit (seau à jetons) partagé entre les threads"""
+    
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Bloque jusqu'à ce qu'une requête puisse être émise"""
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+class LLMCache:
+    """Cache disque (SQLite) des réponses Mistral, indexé par modèle, paramètres et prompt.
+    
+    Les entrées expirent après `ttl` secondes et les moins récemment utilisées sont
+    supprimées au-delà de `max_entries`.
+    """
+    
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0}
+        self.writes_since_eviction = 0
+        
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT,"
+                " response TEXT,"
+                " created_at REAL,"
+                " last_used_at REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at)")
+    
+    def connect(self):
+        """Connexion SQLite propre au thread courant"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self.local.connection = connection
+        return connection
+    
+    @staticmethod
+    def make_key(params):
+        """Clé de cache : hash des paramètres de l'appel (modèle, température, messages...)"""
+        payload = json.dumps(params, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+    
+    def get(self, key, count_miss=True):
+        """Retourne la réponse en cache, ou None si absente ou expirée.
+        
+        count_miss=False : une absence n'est pas comptée (l'appelant la comptera s'il émet la requête).
+        """
+        connection = self.connect()
+        row = connection.execute(
+            "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        
+        now = time.time()
+        if row is None or (self.ttl and now - row[1] > self.ttl):
+            if count_miss:
+                self.count('misses')
+            return None
+        
+        with connection:
+            connection.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (now, key))
+        self.count('hits')
+        return row[0]
+    
+    def set(self, key, model, response):
+        """Enregistre une réponse"""
+        now = time.time()
+        connection = self.connect()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_used_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+        
+        with self.lock:
+            self.writes_since_eviction += 1
+            should_evict = self.writes_since_eviction >= 100
+            if should_evict:
+                self.writes_since_eviction = 0
+        if should_evict:
+            self.evict()
+    
+    def evict(self):
+        """Supprime les entrées expirées puis les plus anciennes au-delà de max_entries"""
+        connection = self.connect()
+        with connection:
+            deleted = 0
+            if self.ttl:
+                deleted += connection.execute(
+                    "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,)
+                ).rowcount
+            if self.max_entries:
+                deleted += connection.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                ).rowcount
+        with self.lock:
+            self.counters['evictions'] += deleted
+    
+    def clear(self):
+        """Vide le cache"""
+        connection = self.connect()
+        with connection:
+            connection.execute("DELETE FROM llm_cache")
+    
+    def stats(self):
+        """Compteurs d'utilisation et taille du cache"""
+        entries, size = self.connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(response)), 0) FROM llm_cache"
+        ).fetchone()
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'entries': entries,
+            'size_bytes': size,
+            'hit_rate': stats['hits'] / lookups if lookups else 0.0
+        })
+        return stats
+
+llm_cache = LLMCache(
+    app.config['LLM_CACHE_FILE'], app.config['LLM_CACHE_TTL'], app.config['LLM_CACHE_MAX_ENTRIES']
+)
+
+# Suivi des appels Mistral (nombre, tokens, latence, tentatives, coût)
+#
+# Les étiquettes d'un appel (route, tâche, catégorie, champ) sont portées par une variable
+# de contexte : elles suivent l'exécution dans run_in_parallel et dans les tâches de fond.
+
+LLM_USAGE_LABELS = ['model', 'route', 'job_type', 'category', 'field', 'outcome']
+LLM_BATCH_FIELD = '_batch'  # Étiquette des appels qui couvrent plusieurs champs
+
+llm_usage_labels = contextvars.ContextVar('llm_usage_labels', default={})
+
+@contextmanager
+def llm_usage_scope(**labels):
+    """Ajoute des étiquettes aux appels Mistral émis dans le bloc"""
+    token = llm_usage_labels.set({**llm_usage_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        llm_usage_labels.reset(token)
+
+class LLMUsageLedger:
+    """Compteurs d'utilisation de l'API Mistral, agrégés par combinaison d'étiquettes.
+    
+    Les compteurs sont en mémoire (remis à zéro au redémarrage, comme des compteurs Prometheus) ;
+    les totaux par tâche sont conservés pour les max_jobs dernières tâches.
+    """
+    
+    # calls : appels de mistral_chat, y compris ceux servis par le cache ou partagés ;
+    # requests : requêtes réellement envoyées à l'API
+    COUNTERS = ['calls', 'requests', 'prompt_tokens', 'completion_tokens', 'retries', 'latency_seconds', 'cost']
+    
+    def __init__(self, latency_buckets, prices, max_jobs=1000, max_errors=50):
+        self.latency_buckets = latency_buckets
+        self.prices = prices
+        self.max_jobs = max_jobs
+        self.lock = threading.Lock()
+        self.series = {}
+        self.jobs = {}
+        self.errors = deque(maxlen=max_errors)
+    
+    def new_totals(self):
+        totals = {counter: 0 for counter in self.COUNTERS}
+        totals['latency_buckets'] = [0] * len(self.latency_buckets)
+        return totals
+    
+    def add(self, totals, values, latency):
+        for counter, value in values.items():
+            totals[counter] += value
+        for index, bound in enumerate(self.latency_buckets):
+            if latency <= bound:
+                totals['latency_buckets'][index] += 1
+    
+    def record(self, model, outcome, latency, retries=0, usage=None, error=None):
+        """Enregistre un appel avec les étiquettes du contexte courant"""
+        labels = llm_usage_labels.get()
+        key = (model, labels.get('route') or '', labels.get('job_type') or '', labels.get('category') or '',
+               labels.get('field') or '', outcome)
+        
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        input_price, output_price = self.prices.get(model, (0.0, 0.0))
+        values = {
+            'calls': 1,
+            'requests': 0 if outcome in ['cache', 'coalesced'] else 1,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'retries': retries,
+            'latency_seconds': latency,
+            'cost': (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+        }
+        
+        with self.lock:
+            self.add(self.series.setdefault(key, self.new_totals()), values, latency)
+            
+            job_id = labels.get('job')
+            if job_id:
+                if job_id not in self.jobs and len(self.jobs) >= self.max_jobs:
+                    self.jobs.pop(next(iter(self.jobs)))
+                self.add(self.jobs.setdefault(job_id, self.new_totals()), values, latency)
+            
+            if error is not None:
+                self.errors.append(dict(zip(LLM_USAGE_LABELS, key), time=time.time(), error=str(error)))
+    
+    def job_totals(self, job_id):
+        """Totaux d'une tâche (None si elle n'a fait aucun appel)"""
+        with self.lock:
+            totals = self.jobs.get(job_id)
+            return self.public_totals(totals) if totals else None
+    
+    @staticmethod
+    def public_totals(totals):
+        result = {counter: totals[counter] for counter in LLMUsageLedger.COUNTERS}
+        result['latency_seconds'] = round(result['latency_seconds'], 3)
+        result['average_latency_seconds'] = round(totals['latency_seconds'] / totals['calls'], 3) if totals['calls'] else 0.0
+        return result
+    
+    def snapshot(self):
+        """Totaux globaux et par étiquette (modèle, route, type de tâche, catégorie, champ, issue)"""
+        with self.lock:
+            series = list(self.series.items())
+            jobs = {job_id: self.public_totals(totals) for job_id, totals in self.jobs.items()}
+            errors = list(self.errors)
+        
+        totals = self.new_totals()
+        groups = {label: {} for label in LLM_USAGE_LABELS}
+        for key, values in series:
+            for target in [totals] + [groups[label].setdefault(value, self.new_totals()) for label, value in zip(LLM_USAGE_LABELS, key)]:
+                for counter in self.COUNTERS:
+                    target[counter] += values[counter]
+        
+        snapshot = {'totals': self.public_totals(totals)}
+        for label, group in groups.items():
+            snapshot[f'by_{label}'] = {value: self.public_totals(group_totals) for value, group_totals in group.items()}
+        snapshot['by_job'] = jobs
+        snapshot['recent_errors'] = errors
+        return snapshot
+    
+    def prometheus(self, prefix='la_chouette_llm'):
+        """Compteurs au format texte Prometheus"""
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        
+        with self.lock:
+            series = [(key, json.loads(json.dumps(values))) for key, values in self.series.items()]
+        
+        lines = []
+        metrics = [
+            ('calls_total', 'Appels Mistral (cache et appels partagés compris)', 'counter', lambda values: [('', values['calls'])]),
+            ('requests_total', 'Requêtes envoyées à l\'API Mistral', 'counter', lambda values: [('', values['requests'])]),
+            ('tokens_total', 'Tokens consommés', 'counter',
+             lambda values: [(',kind="prompt"', values['prompt_tokens']), (',kind="completion"', values['completion_tokens'])]),
+            ('retries_total', 'Tentatives supplémentaires après une erreur temporaire', 'counter',
+             lambda values: [('', values['retries'])]),
+            ('cost_total', 'Coût estimé (LLM_PRICES)', 'counter', lambda values: [('', values['cost'])])
+        ]
+        for name, help_text, metric_type, samples in metrics:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for key, values in series:
+                labels = ','.join(f'{label}="{escape(value)}"' for label, value in zip(LLM_USAGE_LABELS, key))
+                for extra, value in samples(values):
+                    lines.append(f"{prefix}_{name}{{{labels}{extra}}} {value}")
+        
+        lines.append(f"# HELP {prefix}_latency_seconds Durée des appels Mistral (tentatives comprises)")
+        lines.append(f"# TYPE {prefix}_latency_seconds histogram")
+        for key, values in series:
+            labels = ','.join(f'{label}="{escape(value)}"' for label, value in zip(LLM_USAGE_LABELS, key))
+            for bound, count in zip(self.latency_buckets, values['latency_buckets']):
+                lines.append(f'{prefix}_latency_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{prefix}_latency_seconds_bucket{{{labels},le="+Inf"}} {values["calls"]}')
+            lines.append(f"{prefix}_latency_seconds_sum{{{labels}}} {values['latency_seconds']}")
+            lines.append(f"{prefix}_latency_seconds_count{{{labels}}} {values['calls']}")
+        
+        return "\n".join(lines) + "\n"
+    
+    def clear(self):
+        """Remet les compteurs à zéro"""
+        with self.lock:
+            self.series.clear()
+            self.jobs.clear()
+            self.errors.clear()
+
+llm_usage = LLMUsageLedger(app.config['LLM_LATENCY_BUCKETS'], app.config['LLM_PRICES'])
+
+@app.before_request
+def set_llm_usage_route():
+    """Étiquette les appels Mistral d'une requête avec sa route"""
+    llm_usage_labels.set({'route': request.endpoint or ''})
+
+_mistral_clients = {}
+_rate_limiters = {}
+_llm_inflight = {}
+_llm_lock = threading.Lock()
+_llm_semaphore = threading.BoundedSemaphore(app.config['LLM_MAX_CONCURRENCY'])
+
+def get_mistral_client(api_key):
+    """Retourne le client Mistral associé à une clé API (réutilisé entre les requêtes)"""
+    with _llm_lock:
+        if api_key not in _mistral_clients:
+            try:
+                from mistralai import Mistral
+            except ImportError:
+                raise Exception("Mistral AI n'est pas disponible. Veuillez installer mistralai.")
+            _mistral_clients[api_key] = Mistral(api_key=api_key)
+        return _mistral_clients[api_key]
+
+def get_rate_limiter(api_key):
+    """Retourne le limiteur de débit associé à une clé API"""
+    with _llm_lock:
+        if api_key not in _rate_limiters:
+            _rate_limiters[api_key] = RateLimiter(app.config['LLM_REQUESTS_PER_SECOND'])
+        return _rate_limiters[api_key]
+
+def is_retryable_error(error):
+    """Indique si une erreur de l'API Mistral est temporaire (quota, surcharge)"""
+    status_code = getattr(error, 'status_code', None)
+    return status_code in [429, 500, 502, 503, 504]
+
+def mistral_chat(api_key, messages, model="mistral-large-latest", temperature=0.1, max_tokens=100, response_format=None):
+    """Appelle l'API Mistral et retourne le texte de la réponse.
+    
+    Tous les appels passent par cette fonction : les réponses sont mises en cache sur
+    disque et les appels identiques simultanés ne donnent lieu qu'à une seule requête.
+    Les réponses servies par le cache ou partagées sont comptées dans llm_usage
+    (issues 'cache' et 'coalesced').
+    """
+    params = {
+        'model': model,
+        'messages': messages,
+        'temperature': temperature,
+        'max_tokens': max_tokens
+    }
+    if response_format:
+        params['response_format'] = response_format
+    
+    if not app.config['LLM_CACHE_ENABLED']:
+        return request_mistral_completion(api_key, params)
+    
+    started_at = time.monotonic()
+    cache_key = LLMCache.make_key(params)
+    cached_response = llm_cache.get(cache_key, count_miss=False)
+    if cached_response is not None:
+        llm_usage.record(model, 'cache', time.monotonic() - started_at)
+        return cached_response
+    
+    # Un seul appel en vol par clé de cache : les appels identiques attendent son résultat
+    with _llm_lock:
+        pending = _llm_inflight.get(cache_key)
+        is_leader = pending is None
+        if is_leader:
+            # Le précédent appel a pu enregistrer sa réponse entre la lecture du cache et la prise du verrou
+            cached_response = llm_cache.get(cache_key)
+            if cached_response is None:
+                pending = Future()
+                _llm_inflight[cache_key] = pending
+    
+    if cached_response is not None:
+        llm_usage.record(model, 'cache', time.monotonic() - started_at)
+        return cached_response
+    
+    if not is_leader:
+        llm_cache.count('coalesced')
+        try:
+            return pending.result()
+        finally:
+            llm_usage.record(model, 'coalesced', time.monotonic() - started_at)
+    
+    try:
+        response_text = request_mistral_completion(api_key, params)
+        llm_cache.set(cache_key, model, response_text)
+        pending.set_result(response_text)
+        return response_text
+    except Exception as e:
+        pending.set_exception(e)
+        raise
+    finally:
+        with _llm_lock:
+            _llm_inflight.pop(cache_key, None)
+
+def request_mistral_completion(api_key, params):
+    """Envoie une requête à l'API Mistral.
+    
+    Borne le nombre de requêtes simultanées, applique la limite de débit de la clé API
+    et réessaie les erreurs temporaires. Chaque appel est enregistré dans llm_usage
+    (tokens, latence tentatives comprises, nombre de tentatives, issue).
+    """
+    started_at = time.monotonic()
+    max_retries = app.config['LLM_MAX_RETRIES']
+    for attempt in range(max_retries + 1):
+        try:
+            client = get_mistral_client(api_key)
+            get_rate_limiter(api_key).acquire()
+            with _llm_semaphore:
+                response = client.chat.complete(**params)
+            content = response.choices[0].message.content
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                llm_usage.record(params['model'], 'error', time.monotonic() - started_at, retries=attempt, error=e)
+                raise
+            time.sleep(min(2 ** attempt, 30))
+            continue
+        
+        llm_usage.record(
+            params['model'], 'success', time.monotonic() - started_at,
+            retries=attempt, usage=getattr(response, 'usage', None)
+        )
+        return content
+
+def run_in_parallel(func, items, max_workers=None):
+    """Applique func à chaque élément dans un pool de threads.
+    
+    Les résultats sont retournés dans l'ordre des éléments, quel que soit l'ordre de fin.
+    Chaque élément s'exécute dans une copie du contexte de l'appelant (étiquettes de llm_usage).
+    """
+    max_workers = max(1, min(max_workers or app.config['LLM_MAX_CONCURRENCY'], len(items) or 1))
+    if max_workers == 1:
+        return [func(item) for item in items]
+    
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda context, item: context.run(func, item), contexts, items))
+
 def call_mistral_api(prompt, api_key):
     """Appelle l'API Mistral avec un prompt simple"""
     try:
-        from mistralai import Mistral
-        client = Mistral(api_key=api_key)
-        
-        response = client.chat.complete(
-            model="mistral-large-latest",
+        response_text = mistral_chat(
+            api_key,
             messages=[
                 {"role": "user", "content": prompt}
             ],
@@ -853,28 +2529,66 @@ def call_mistral_api(prompt, api_key):
             max_tokens=100
         )
         
-        return response.choices[0].message.content.strip()
+        return response_text.strip()
         
     except Exception as e:
         print(f"Erreur lors de l'appel à Mistral: {str(e)}")
         return None
 
+@app.route('/llm_cache', methods=['GET'])
+def get_llm_cache_stats():
+    """Statistiques du cache des réponses Mistral"""
+    try:
+        return jsonify(llm_cache.stats())
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors de la lecture du cache: {str(e)}'}), 500
+
+@app.route('/llm_cache/clear', methods=['POST'])
+def clear_llm_cache():
+    """Vide le cache des réponses Mistral"""
+    try:
+        llm_cache.clear()
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors du vidage du cache: {str(e)}'}), 500
+
+@app.route('/llm_usage', methods=['GET'])
+def get_llm_usage():
+    """Utilisation de l'API Mistral : totaux, détail par étiquette et par tâche, dernières erreurs"""
+    try:
+        return jsonify(llm_usage.snapshot())
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors de la lecture de l\'utilisation: {str(e)}'}), 500
+
+@app.route('/llm_usage/clear', methods=['POST'])
+def clear_llm_usage():
+    """Remet à zéro les compteurs d'utilisation de l'API Mistral"""
+    llm_usage.clear()
+    return jsonify({'success': True})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Compteurs d'utilisation de l'API Mistral au format Prometheus"""
+    return Response(llm_usage.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/embedding_backend', methods=['GET'])
+def get_embedding_backend_status():
+    """Backend d'embeddings utilisé pour le clustering (charge le modèle si nécessaire)"""
+    try:
+        encoder = get_embedding_backend()
+        return jsonify({
+            'configured': app.config['EMBEDDING_BACKEND'],
+            'backend': encoder.backend,
+            'model': encoder.model_name,
+            'cache': embedding_cache.stats()
+        })
+    except Exception as e:
+        return jsonify({'error': f'Backend d\'embeddings indisponible: {str(e)}'}), 500
+
 def update_document_category_in_db(doc_id, category):
     """Met à jour la catégorie d'un document dans la base de données"""
     try:
-        json_path = os.path.join(app.config['JSON_FOLDER'], f"{doc_id}.json")
-        
-        if os.path.exists(json_path):
-            with open(json_path, 'r', encoding='utf-8') as file:
-                doc_data = json.load(file)
-            
-            doc_data['category'] = category
-            
-            with open(json_path, 'w', encoding='utf-8') as file:
-                json.dump(doc_data, file, ensure_ascii=False, indent=2)
-            
-            return True
-        return False
+        return document_store.update(doc_id, category=category)
     except Exception as e:
         print(f"Erreur lors de la mise à jour de la catégorie du document {doc_id}: {str(e)}")
         return False
@@ -883,27 +2597,14 @@ def update_document_category_in_db(doc_id, category):
 def get_cluster_visualization():
     """Génère et retourne la visualisation des clusters"""
     try:
-        # Récupérer tous les documents
-        documents = []
-        json_folder = app.config['JSON_FOLDER']
-        
-        if os.path.exists(json_folder):
-            for filename in os.listdir(json_folder):
-                if filename.endswith('.json'):
-                    json_path = os.path.join(json_folder, filename)
-                    try:
-                        with open(json_path, 'r', encoding='utf-8') as file:
-                            data = json.load(file)
-                            if 'category' in data:
-                                documents.append(data)
-                    except Exception:
-                        continue
+        # Compter les documents par catégorie (requête sur l'index)
+        category_counts = document_store.category_counts()
         
-        if len(documents) < 2:
+        if sum(category_counts.values()) < 2:
             return jsonify({'error': 'Pas assez de documents catégorisés'}), 400
         
         # Créer la visualisation
-        img_base64 = create_cluster_visualization(documents)
+        img_base64 = create_cluster_visualization(category_counts)
         
         return jsonify({'visualization': img_base64})
         
@@ -917,27 +2618,56 @@ def field_selection():
 
 @app.route('/get_categories')
 def get_categories():
-    """Récupère toutes les catégories avec leurs documents"""
+    """Récupère toutes les catégories avec leurs documents.
+    
+    Accepte les mêmes paramètres de projection et de filtre que /get_all_documents,
+    ainsi que per_category (nombre maximum de documents renvoyés par catégorie).
+    """
     try:
+        query, fields = parse_document_query(request.args)
+        if request.args.get('per_category'):
+            query['per_category'] = int(request.args.get('per_category'))
+            if query['per_category'] <= 0:
+                raise ValueError('per_category')
+        
         categories = {}
-        json_folder = app.config['JSON_FOLDER']
+        counts = {}
         
-        if os.path.exists(json_folder):
-            for filename in os.listdir(json_folder):
-                if filename.endswith('.json'):
-                    json_path = os.path.join(json_folder, filename)
-                    try:
-                        with open(json_path, 'r', encoding='utf-8') as file:
-                            data = json.load(file)
-                            if 'category' in data:
-                                category = data['category']
-                                if category not in categories:
-                                    categories[category] = []
-                                categories[category].append(data)
-                    except Exception:
-                        continue
+        for category, count, extracted in document_store.category_summary():
+            if category is not None:
+                categories[category] = []
+                counts[category] = count
+        
+        for data in document_store.iter_documents(categorized=True, **query):
+            categories[data['category']].append(project_document(data, fields))
+        
+        return jsonify({'categories': categories, 'counts': counts})
+        
+    except ValueError:
+        return jsonify({'error': 'Paramètres excerpt ou per_category invalides (entiers positifs attendus)'}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors du chargement des catégories: {str(e)}'}), 500
+
+@app.route('/get_category_summary')
+def get_category_summary():
+    """Nombre de documents par catégorie (sans les documents)"""
+    try:
+        categories = {}
+        uncategorized = 0
+        total = 0
+        
+        for category, count, extracted in document_store.category_summary():
+            total += count
+            if category is None:
+                uncategorized = count
+            else:
+                categories[category] = {'count': count, 'extracted': extracted}
         
-        return jsonify({'categories': categories})
+        return jsonify({
+            'categories': categories,
+            'uncategorized': uncategorized,
+            'total_documents': total
+        })
         
     except Exception as e:
         return jsonify({'error': f'Erreur lors du chargement des catégories: {str(e)}'}), 500
@@ -985,17 +2715,21 @@ def save_catalog():
     except Exception as e:
         return jsonify({'error': f'Erreur lors de la sauvegarde: {str(e)}'}), 500
 
+def load_catalog():
+    """Charge le catalog sauvegardé (dictionnaire vide s'il n'existe pas)"""
+    catalog_path = app.config['CATALOG_FILE']
+    
+    if not os.path.exists(catalog_path):
+        return {}
+    
+    with open(catalog_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
 @app.route('/get_catalog')
 def get_catalog():
     """Récupère le catalog existant"""
     try:
-        catalog_path = app.config['CATALOG_FILE']
-        
-        if os.path.exists(catalog_path):
-            with open(catalog_path, 'r', encoding='utf-8') as file:
-                catalog = json.load(file)
-        else:
-            catalog = {}
+        catalog = load_catalog()
         
         return jsonify({'catalog': catalog})
         
@@ -1140,159 +2874,1194 @@ def extract_fields():
     """Extrait les champs des documents avec Mistral AI"""
     try:
         data = request.get_json()
-        documents = data.get('documents', [])
+        # Seuls les identifiants sont repris du client : le document stocké fait foi
+        # (les listes renvoient des documents projetés ou tronqués)
+        document_ids = data.get('document_ids') or [doc['id'] for doc in data.get('documents', [])]
         catalog = data.get('catalog', {})
         field_descriptions = data.get('field_descriptions', {})
         # Utiliser la clé API stockée ou celle fournie
         api_key = data.get('api_key') or load_api_key()
         instructions = data.get('instructions', '')
+        extraction_mode = data.get('extraction_mode') or app.config['EXTRACTION_MODE']
         
         if not api_key:
             return jsonify({'error': 'Clé API Mistral requise. Veuillez la configurer dans les paramètres.'}), 400
         
-        if not documents:
+        if not document_ids:
             return jsonify({'error': 'Aucun document à traiter'}), 400
         
         if not catalog:
             return jsonify({'error': 'Aucun catalog trouvé'}), 400
         
-        # Traiter chaque document
+        max_workers = min(int(data.get('max_concurrency') or app.config['LLM_MAX_CONCURRENCY']),
+                          app.config['LLM_MAX_CONCURRENCY'])
+        
+        def process(doc_id):
+            document = load_document(doc_id)
+            if document is None:
+                return {
+                    'success': False,
+                    'error': 'Document non trouvé',
+                    'document_title': '',
+                    'extracted_fields': {},
+                    'field_count': 0
+                }
+            return extract_and_save_document(
+                document, catalog, field_descriptions, api_key, instructions, extraction_mode
+            )
+        
+        # Traiter les documents en parallèle (les résultats restent dans l'ordre des documents)
+        document_results = run_in_parallel(process, document_ids, max_workers)
+        
         results = {}
         processed_documents = 0
         total_fields_extracted = 0
         
-        for i, document in enumerate(documents):
-            try:
-                category = document.get('category', 'Non catégorisé')
-                if category not in catalog:
-                    continue
-                
-                # Extraire les champs pour cette catégorie
-                extracted_fields = extract_document_fields(
-                    document, 
-                    catalog[category], 
-                    field_descriptions.get(category, {}),
-                    api_key, 
-                    instructions
-                )
-                
-                # Mettre à jour le document
-                document['extracted_fields'] = extracted_fields
-                
-                # Sauvegarder le document mis à jour
-                save_document_with_extracted_fields(document)
-                
-                results[document['id']] = {
-                    'success': True,
-                    'document_title': document.get('title', ''),
-                    'extracted_fields': extracted_fields,
-                    'field_count': len(extracted_fields)
-                }
-                
+        for doc_id, result in zip(document_ids, document_results):
+            if result is None:
+                continue
+            
+            results[doc_id] = result
+            if result['success']:
                 processed_documents += 1
-                total_fields_extracted += len(extracted_fields)
+                total_fields_extracted += result['field_count']
+        
+        return jsonify({
+            'results': results,
+            'total_documents': len(document_ids),
+            'processed_documents': processed_documents,
+            'total_fields_extracted': total_fields_extracted
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors de l\'extraction: {str(e)}'}), 500
+
+def extract_and_save_document(document, catalog, field_descriptions, api_key, instructions, extraction_mode=None,
+                               progress_callback=None):
+    """Extrait et sauvegarde les champs d'un document.
+    
+    Retourne le résultat du document, ou None si sa catégorie n'est pas dans le catalog.
+    """
+    try:
+        category = document.get('category', 'Non catégorisé')
+        if category not in catalog:
+            return None
+        
+        # Extraire les champs pour cette catégorie
+        with llm_usage_scope(category=category):
+            extracted_fields = extract_document_fields(
+                document, 
+                catalog[category], 
+                field_descriptions.get(category, {}),
+                api_key, 
+                instructions,
+                extraction_mode,
+                progress_callback
+            )
+        
+        # Mettre à jour le document
+        document['extracted_fields'] = extracted_fields
+        
+        # Sauvegarder le document mis à jour
+        save_document_with_extracted_fields(document)
+        
+        return {
+            'success': True,
+            'document_title': document.get('title', ''),
+            'extracted_fields': extracted_fields,
+            'field_count': len(extracted_fields)
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e),
+            'document_title': document.get('title', ''),
+            'extracted_fields': {},
+            'field_count': 0
+        }
+
+def tokenize_for_search(text):
+    """Mots normalisés (minuscules, sans accents) d'un texte, pour la recherche locale"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(character for character in text if not unicodedata.combining(character))
+    return re.findall(r'\w+', text)
+
+class DocumentContext:
+    """Index BM25 des passages d'un document, pour n'envoyer au LLM que le contexte utile à chaque champ.
+    
+    Le document est découpé en passages d'environ CONTEXT_CHUNK_CHARS caractères (limites de page
+    respectées si le document a des pages) ; un document court est envoyé en entier.
+    """
+    
+    k1 = 1.5
+    b = 0.75
+    
+    def __init__(self, document):
+        self.title = document.get('title', '')
+        self.content = document.get('content', '') or ''
+        self.chunks = self.split(self.content, document.get('pages'), app.config['CONTEXT_CHUNK_CHARS'])
+        
+        self.chunk_terms = []
+        self.document_frequency = {}
+        for chunk in self.chunks:
+            terms = {}
+            for token in tokenize_for_search(chunk['text']):
+                terms[token] = terms.get(token, 0) + 1
+            self.chunk_terms.append(terms)
+            for token in terms:
+                self.document_frequency[token] = self.document_frequency.get(token, 0) + 1
+        
+        lengths = [sum(terms.values()) for terms in self.chunk_terms]
+        self.chunk_lengths = lengths
+        self.average_length = (sum(lengths) / len(lengths)) if lengths else 0
+    
+    @staticmethod
+    def split(content, pages, chunk_chars):
+        """Découpe le texte en passages (paragraphes regroupés), avec positions et numéro de page"""
+        page_ranges = [(page['start'], page['end'], page['page']) for page in pages] if pages else [(0, len(content), None)]
+        
+        chunks = []
+        for page_start, page_end, page_number in page_ranges:
+            position = page_start
+            while position < page_end:
+                end = min(position + chunk_chars, page_end)
+                # Couper de préférence en fin de paragraphe, sinon de phrase ou de mot
+                if end < page_end:
+                    window = content[position:end]
+                    for separator in ['\n\n', '\n', '. ', ' ']:
+                        cut = window.rfind(separator)
+                        if cut > chunk_chars // 2:
+                            end = position + cut + len(separator)
+                            break
                 
+                text = content[position:end]
+                if text.strip():
+                    chunks.append({'text': text, 'start': position, 'end': end, 'page': page_number})
+                position = end
+        
+        return chunks
+    
+    def scores(self, query):
+        """Score BM25 de chaque passage pour une requête"""
+        query_tokens = set(tokenize_for_search(query)) - set(FRENCH_STOP_WORDS)
+        chunk_count = len(self.chunks)
+        
+        scores = []
+        for terms, length in zip(self.chunk_terms, self.chunk_lengths):
+            score = 0.0
+            for token in query_tokens:
+                frequency = terms.get(token)
+                if not frequency:
+                    continue
+                idf = math.log(1 + (chunk_count - self.document_frequency[token] + 0.5) / (self.document_frequency[token] + 0.5))
+                score += idf * frequency * (self.k1 + 1) / (
+                    frequency + self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+                )
+            scores.append(score)
+        return scores
+    
+    def select(self, query, token_budget):
+        """Texte à envoyer au LLM : les passages les plus pertinents dans la limite de token_budget.
+        
+        Le budget restant est complété par les passages du début du document ; les passages
+        retenus sont remis dans l'ordre du document.
+        """
+        char_budget = token_budget * 4  # Estimation : environ 4 caractères par token
+        if len(self.content) <= char_budget:
+            return self.content
+        
+        scores = self.scores(query)
+        ranked = sorted((index for index in range(len(self.chunks)) if scores[index] > 0), key=lambda index: -scores[index])
+        
+        selected = set()
+        used = 0
+        for index in ranked + list(range(len(self.chunks))):
+            size = len(self.chunks[index]['text'])
+            if index in selected or used + size > char_budget:
+                continue
+            selected.add(index)
+            used += size
+        
+        parts = []
+        for index in sorted(selected):
+            chunk = self.chunks[index]
+            prefix = f"[Page {chunk['page']}] " if chunk['page'] else ''
+            parts.append(prefix + chunk['text'].strip())
+        return "\n[...]\n".join(parts)
+
+def build_field_query(field_name, field_config, field_description):
+    """Requête de recherche d'un champ : nom, description et valeurs autorisées"""
+    parts = [field_name.replace('_', ' '), field_description or field_config.get('description', '')]
+    parts.extend(field_config.get('allowed_values') or [])
+    return ' '.join(part for part in parts if part)
+
+def get_field_context(context, document, query, token_budget):
+    """Contenu du document à envoyer pour une requête (troncature simple si la sélection est désactivée)"""
+    if context is None:
+        return document.get('content', '')[:2000]
+    return context.select(query, token_budget)
+
+def extract_document_fields(document, category_fields, field_descriptions, api_key, instructions, mode=None,
+                            progress_callback=None):
+    """Extrait les champs d'un document avec Mistral AI
+    
+    progress_callback, s'il est fourni, reçoit le nombre de champs traités au fil de l'extraction.
+    """
+    try:
+        mode = mode or app.config['EXTRACTION_MODE']
+        
+        extracted_fields = {}
+        fields_to_extract = list(category_fields.keys())
+        
+        # Index des passages du document, construit une fois pour tous les champs
+        context = DocumentContext(document) if app.config['CONTEXT_RETRIEVAL_ENABLED'] else None
+        
+        # Mode batch : un seul appel JSON pour tous les champs de la catégorie
+        if mode == 'batch' and len(fields_to_extract) > 1:
+            try:
+                with llm_usage_scope(field=LLM_BATCH_FIELD):
+                    extracted_fields = extract_fields_batch(
+                        api_key, document, category_fields, field_descriptions, instructions, context
+                    )
             except Exception as e:
-                results[document['id']] = {
-                    'success': False,
-                    'error': str(e),
-                    'document_title': document.get('title', ''),
-                    'extracted_fields': {},
-                    'field_count': 0
-                }
+                print(f"Erreur extraction batch: {e}")
+                extracted_fields = {}
+            
+            # Seuls les champs absents ou mal formés repassent en extraction champ par champ
+            fields_to_extract = [name for name in fields_to_extract if name not in extracted_fields]
+            if progress_callback:
+                progress_callback(len(extracted_fields))
+        
+        # Traiter chaque champ restant individuellement
+        for field_name in fields_to_extract:
+            field_config = category_fields[field_name]
+            try:
+                field_description = field_descriptions.get(field_name, field_config.get('description', ''))
+                with llm_usage_scope(field=field_name):
+                    extracted_fields[field_name] = extract_single_field(
+                        api_key, document, field_name, field_config, field_description, instructions, context
+                    )
+            except Exception as e:
+                print(f"Erreur extraction champ {field_name}: {e}")
+                extracted_fields[field_name] = None
+            
+            if progress_callback:
+                progress_callback(len(extracted_fields))
+        
+        # Conserver l'ordre du catalog
+        return {field_name: extracted_fields.get(field_name) for field_name in category_fields}
+        
+    except Exception as e:
+        print(f"Erreur extraction document: {e}")
+        return {}
+
+def extract_single_field(api_key, document, field_name, field_config, field_description, instructions, context=None):
+    """Extrait la valeur d'un seul champ (un appel Mistral par champ).
+    
+    context : DocumentContext du document ; seuls les passages pertinents pour le champ sont envoyés.
+    """
+    allowed_values = field_config.get('allowed_values', [])
+    content = get_field_context(
+        context, document, build_field_query(field_name, field_config, field_description),
+        app.config['CONTEXT_FIELD_TOKENS']
+    )
+    
+    system_prompt = (
+        "Tu es un expert en extraction de données. "
+        "Ton objectif est d'extraire une valeur spécifique d'un document. "
+        "Réponds UNIQUEMENT avec la valeur extraite, sans explications ni formatage. "
+        "Si la valeur n'est pas trouvée, réponds 'N/A'."
+    )
+    
+    user_prompt = f"""
+Document: {document.get('title', '')} - {content}
+
+Champ à extraire: {field_name}
+Description: {field_description}
+Type: {field_config.get('type', 'text')}
+Valeurs autorisées: {', '.join(allowed_values) if allowed_values else 'Aucune'}
+
+Instructions: {instructions}
+
+Extrais la valeur pour le champ "{field_name}".
+"""
+    
+    # Appel à Mistral
+    extracted_value = mistral_chat(
+        api_key,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.1,
+        max_tokens=100
+    ).strip()
+    
+    # Nettoyer la valeur
+    if extracted_value.lower() in NOT_FOUND_VALUES:
+        return None
+    
+    # Vérifier si la valeur est dans les valeurs autorisées
+    if allowed_values and extracted_value not in allowed_values:
+        extracted_value = match_allowed_value(extracted_value, allowed_values) or extracted_value
+    
+    return extracted_value
+
+def match_allowed_value(value, allowed_values):
+    """Trouve la valeur autorisée correspondant à une valeur extraite (correspondance proche)"""
+    if value in allowed_values:
+        return value
+    for allowed_value in allowed_values:
+        if allowed_value.lower() in value.lower() or value.lower() in allowed_value.lower():
+            return allowed_value
+    return None
+
+def build_field_schema(field_config):
+    """Construit le schéma JSON d'un champ à partir de son type dans le catalog"""
+    field_type = (field_config.get('type') or 'text').lower()
+    allowed_values = field_config.get('allowed_values', [])
+    
+    if allowed_values:
+        schema = {'type': 'string', 'enum': list(allowed_values)}
+    elif field_type == 'int':
+        schema = {'type': 'integer'}
+    elif field_type in ['float', 'number', 'union_int_float']:
+        schema = {'type': 'number'}
+    elif field_type in ['bool', 'boolean']:
+        schema = {'type': 'boolean'}
+    elif field_type == 'date':
+        schema = {'type': 'string', 'format': 'date'}
+    else:
+        schema = {'type': 'string'}
+    
+    # Toute valeur peut être absente du document
+    schema['type'] = [schema['type'], 'null']
+    if 'enum' in schema:
+        schema['enum'].append(None)
+    
+    return schema
+
+def build_extraction_schema(category_fields, field_descriptions):
+    """Construit le schéma JSON de réponse pour tous les champs d'une catégorie"""
+    properties = {}
+    for field_name, field_config in category_fields.items():
+        field_schema = build_field_schema(field_config)
+        description = field_descriptions.get(field_name, field_config.get('description', ''))
+        if description:
+            field_schema['description'] = description
+        properties[field_name] = field_schema
+    
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(category_fields.keys())
+    }
+
+def normalize_batch_value(value, field_config):
+    """Valide une valeur issue de la réponse JSON et la convertit au format stocké.
+    
+    Retourne (valeur, valide). Une valeur invalide déclenche l'extraction champ par champ.
+    """
+    if value is None:
+        return None, True
+    
+    field_type = (field_config.get('type') or 'text').lower()
+    allowed_values = field_config.get('allowed_values', [])
+    
+    if isinstance(value, (dict, list)):
+        return None, False
+    
+    if isinstance(value, str):
+        value = value.strip()
+        if value.lower() in NOT_FOUND_VALUES:
+            return None, True
+    
+    if allowed_values:
+        if isinstance(value, bool):
+            value = 'Oui' if value else 'Non'
+        matched = match_allowed_value(str(value), allowed_values)
+        return (matched, True) if matched else (None, False)
+    
+    if field_type == 'int':
+        try:
+            number = float(str(value).replace(',', '.'))
+        except ValueError:
+            return None, False
+        if isinstance(value, bool) or not number.is_integer():
+            return None, False
+        return str(int(number)), True
+    
+    if field_type in ['float', 'number', 'union_int_float']:
+        if isinstance(value, bool):
+            return None, False
+        try:
+            number = float(str(value).replace(',', '.'))
+        except ValueError:
+            return None, False
+        if field_type == 'union_int_float' and number.is_integer():
+            return str(int(number)), True
+        return str(number), True
+    
+    if field_type in ['bool', 'boolean']:
+        if isinstance(value, bool):
+            return ('Oui' if value else 'Non'), True
+        if str(value).lower() in ['oui', 'non', 'true', 'false', 'yes', 'no']:
+            return ('Oui' if str(value).lower() in ['oui', 'true', 'yes'] else 'Non'), True
+        return None, False
+    
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return None, False
+    
+    return str(value), True
+
+def extract_fields_batch(api_key, document, category_fields, field_descriptions, instructions, context=None):
+    """Extrait tous les champs d'une catégorie en un seul appel Mistral (réponse JSON).
+    
+    Retourne uniquement les champs dont la valeur est valide ; les autres sont omis
+    pour être extraits individuellement. Avec un context, les passages envoyés sont ceux
+    qui correspondent à l'ensemble des champs.
+    """
+    schema = build_extraction_schema(category_fields, field_descriptions)
+    query = ' '.join(
+        build_field_query(field_name, field_config, field_descriptions.get(field_name, ''))
+        for field_name, field_config in category_fields.items()
+    )
+    content = get_field_context(context, document, query, app.config['CONTEXT_BATCH_TOKENS'])
+    
+    system_prompt = (
+        "Tu es un expert en extraction de données. "
+        "Ton objectif est d'extraire plusieurs valeurs d'un document en une seule fois. "
+        "Réponds UNIQUEMENT avec un objet JSON respectant le schéma fourni, sans Markdown ni explications. "
+        "Utilise exactement les noms de champs comme clés. "
+        "Si une valeur n'est pas trouvée, utilise null."
+    )
+    
+    user_prompt = f"""
+Document: {document.get('title', '')} - {content}
+
+Schéma JSON des champs à extraire:
+{json.dumps(schema, ensure_ascii=False, indent=2)}
+
+Instructions: {instructions}
+
+Extrais les valeurs de tous les champs du schéma.
+"""
+    
+    response_text = mistral_chat(
+        api_key,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.1,
+        max_tokens=min(100 + 60 * len(category_fields), 4000),
+        response_format={"type": "json_object"}
+    )
+    
+    response_text = clean_json_response(response_text.strip())
+    values = json.loads(response_text)
+    if not isinstance(values, dict):
+        raise ValueError("Format de réponse invalide")
+    
+    extracted_fields = {}
+    for field_name, field_config in category_fields.items():
+        if field_name not in values:
+            continue
+        value, valid = normalize_batch_value(values[field_name], field_config)
+        if valid:
+            extracted_fields[field_name] = value
+    
+    return extracted_fields
+
+def clean_json_response(response_text):
+    """Enlève le formatage Markdown autour d'une réponse JSON"""
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0]
+    elif "```" in response_text:
+        response_text = response_text.split("```")[1].split("```")[0]
+    return response_text.strip()
+
+def load_document(doc_id):
+    """Charge un document depuis le stockage (None s'il n'existe pas)"""
+    return document_store.get(doc_id)
+
+def save_document_with_extracted_fields(document):
+    """Sauvegarde le document avec les champs extraits"""
+    try:
+        document_store.save(document)
+            
+    except Exception as e:
+        print(f"Erreur sauvegarde document {document['id']}: {e}")
+
+# Tâches de fond persistantes (extraction, clustering, import, justification)
+#
+# L'état de chaque tâche est écrit dans JOBS_FOLDER/<job_id>.json. Les clés API ne
+# sont jamais persistées : une tâche interrompue est reprise avec la clé fournie
+# à la reprise ou la clé stockée côté serveur.
+
+JOB_ACTIVE_STATUSES = ['pending', 'running']
+
+_jobs = {}
+_jobs_lock = threading.RLock()
+_job_threads = {}
+_job_cancel_events = {}
+_job_saved_at = {}
+# Documents d'un upload en cours dont le hash est réservé avant la création de leur tâche d'import
+_pending_upload_ids = set()
+
+def get_job_path(job_id):
+    """Chemin du fichier d'état d'une tâche"""
+    return os.path.join(app.config['JOBS_FOLDER'], f"{job_id}.json")
+
+def save_job(job, force=True):
+    """Écrit l'état d'une tâche sur disque.
+    
+    Sans force, l'écriture est limitée à une par JOBS_SAVE_INTERVAL secondes.
+    """
+    with _jobs_lock:
+        now = time.time()
+        if not force and now - _job_saved_at.get(job['id'], 0) < app.config['JOBS_SAVE_INTERVAL']:
+            return
+        
+        job['updated_at'] = now
+        job_path = get_job_path(job['id'])
+        temp_path = f"{job_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(job, file, ensure_ascii=False, indent=2)
+        os.replace(temp_path, job_path)
+        _job_saved_at[job['id']] = now
+
+def load_job(job_id):
+    """Charge une tâche (mémoire puis disque), None si elle n'existe pas"""
+    with _jobs_lock:
+        if job_id in _jobs:
+            return _jobs[job_id]
+        
+        job_path = get_job_path(job_id)
+        if not os.path.exists(job_path):
+            return None
+        
+        with open(job_path, 'r', encoding='utf-8') as file:
+            _jobs[job_id] = json.load(file)
+        return _jobs[job_id]
+
+def create_job(job_type, params, document_ids):
+    """Crée et persiste une nouvelle tâche"""
+    job = {
+        'id': str(uuid.uuid4()),
+        'type': job_type,
+        'status': 'pending',
+        'created_at': time.time(),
+        'updated_at': time.time(),
+        'params': params,
+        'progress': {
+            'documents': {doc_id: {'status': 'pending'} for doc_id in document_ids}
+        },
+        'result': None,
+        'error': None
+    }
+    
+    with _jobs_lock:
+        _jobs[job['id']] = job
+        save_job(job)
+    
+    return job
+
+def is_job_running(job_id):
+    """Indique si la tâche s'exécute dans ce processus"""
+    thread = _job_threads.get(job_id)
+    return thread is not None and thread.is_alive()
+
+def start_job(job, api_key):
+    """Lance l'exécution d'une tâche dans un thread de fond"""
+    with _jobs_lock:
+        job['status'] = 'pending'
+        job['error'] = None
+        save_job(job)
+        
+        _job_cancel_events[job['id']] = threading.Event()
+        # La tâche s'exécute dans une copie du contexte de la requête (route des étiquettes llm_usage)
+        thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(run_job, job['id'], api_key), daemon=True
+        )
+        _job_threads[job['id']] = thread
+        thread.start()
+
+def run_job(job_id, api_key):
+    """Exécute une tâche jusqu'à sa fin, son annulation ou son échec"""
+    job = load_job(job_id)
+    cancel_event = _job_cancel_events[job_id]
+    
+    with _jobs_lock:
+        job['status'] = 'running'
+        save_job(job)
+    
+    try:
+        with llm_usage_scope(job=job_id, job_type=job['type']):
+            JOB_RUNNERS[job['type']](job, api_key, cancel_event)
+        status = 'cancelled' if cancel_event.is_set() else 'completed'
+        with _jobs_lock:
+            job['status'] = status
+    except Exception as e:
+        print(f"Erreur tâche {job_id}: {e}")
+        with _jobs_lock:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+    finally:
+        save_job(job)
+
+def update_job_document(job, doc_id, **values):
+    """Met à jour la progression d'un document d'une tâche"""
+    with _jobs_lock:
+        job['progress']['documents'][doc_id].update(values)
+        save_job(job, force=False)
+
+def summarize_job(job, include_documents=True):
+    """Résumé d'une tâche pour l'API (compteurs de progression par document et par champ)"""
+    with _jobs_lock:
+        documents = job['progress']['documents']
+        status_counts = {}
+        fields_done = 0
+        fields_total = 0
+        active_documents = []
+        
+        for doc_id, doc_progress in documents.items():
+            status = doc_progress['status']
+            status_counts[status] = status_counts.get(status, 0) + 1
+            fields_done += doc_progress.get('fields_done', 0)
+            fields_total += doc_progress.get('fields_total', 0)
+            if status == 'processing':
+                active_documents.append(dict(doc_progress, id=doc_id))
+        
+        summary = {
+            'id': job['id'],
+            'type': job['type'],
+            'status': job['status'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at'],
+            'error': job['error'],
+            'result': job['result'],
+            'total_documents': len(documents),
+            'completed_documents': len(documents) - status_counts.get('pending', 0) - status_counts.get('processing', 0),
+            'status_counts': status_counts,
+            'fields_done': fields_done,
+            'fields_total': fields_total,
+            'active_documents': active_documents,
+            'stage': job['progress'].get('stage'),
+            'llm_usage': llm_usage.job_totals(job['id'])
+        }
+        
+        if include_documents:
+            summary['documents'] = json.loads(json.dumps(documents))
+        
+        return summary
+
+def run_extraction_job(job, api_key, cancel_event):
+    """Extrait les champs des documents d'une tâche (les documents déjà traités sont ignorés)"""
+    params = job['params']
+    catalog = params['catalog']
+    documents_progress = job['progress']['documents']
+    
+    pending_ids = [
+        doc_id for doc_id, doc_progress in documents_progress.items()
+        if doc_progress['status'] not in ['done', 'skipped']
+    ]
+    
+    def process(doc_id):
+        if cancel_event.is_set():
+            return
+        
+        document = load_document(doc_id)
+        if document is None:
+            update_job_document(job, doc_id, status='error', error='Document non trouvé')
+            return
+        
+        category = document.get('category', 'Non catégorisé')
+        update_job_document(
+            job, doc_id,
+            status='processing',
+            document_title=document.get('title', ''),
+            fields_done=0,
+            fields_total=len(catalog.get(category, {}))
+        )
+        
+        result = extract_and_save_document(
+            document, catalog, params['field_descriptions'], api_key, params['instructions'],
+            params['extraction_mode'],
+            progress_callback=lambda fields_done: update_job_document(job, doc_id, fields_done=fields_done)
+        )
+        
+        if result is None:
+            update_job_document(job, doc_id, status='skipped')
+        elif result['success']:
+            update_job_document(job, doc_id, status='done', error=None, field_count=result['field_count'])
+        else:
+            update_job_document(job, doc_id, status='error', error=result['error'])
+    
+    run_in_parallel(process, pending_ids, params['max_concurrency'])
+
+def run_clustering_job(job, api_key, cancel_event):
+    """Regroupe les documents d'une tâche puis nomme chaque cluster avec Mistral"""
+    params = job['params']
+    documents_progress = job['progress']['documents']
+    
+    # Le clustering déjà calculé est conservé lors d'une reprise
+    if not job['result']:
+        texts = []
+        doc_ids = []
+        for doc_id in documents_progress:
+            document = load_document(doc_id)
+            if document is None:
+                update_job_document(job, doc_id, status='error', error='Document non trouvé')
+                continue
+            texts.append(get_clustering_text(document))
+            doc_ids.append(doc_id)
+        
+        with _jobs_lock:
+            job['progress']['stage'] = 'clustering'
+            save_job(job)
+        
+        clusters = perform_clustering(texts, doc_ids, len(doc_ids), params.get('k_range'))
+        
+        with _jobs_lock:
+            job['result'] = {'clusters': clusters}
+            for doc_id in doc_ids:
+                documents_progress[doc_id]['status'] = 'clustered'
+            save_job(job)
+    
+    if not api_key:
+        return
+    
+    with _jobs_lock:
+        job['progress']['stage'] = 'naming'
+        save_job(job)
+    
+    for cluster in job['result']['clusters']:
+        if cancel_event.is_set():
+            return
+        if cluster.get('named'):
+            continue
+        
+        name_cluster_with_mistral(cluster, api_key, params['instructions'])
+        
+        with _jobs_lock:
+            cluster['named'] = True
+            for doc_id in cluster['documents']:
+                documents_progress[doc_id]['status'] = 'done'
+            save_job(job)
+
+def run_ingestion_job(job, api_key, cancel_event):
+    """Extrait le texte des fichiers uploadés et enregistre les documents (les fichiers déjà traités sont ignorés)"""
+    files_info = job['params']['files']
+    documents_progress = job['progress']['documents']
+    
+    pending_ids = [
+        doc_id for doc_id, doc_progress in documents_progress.items()
+        if doc_progress['status'] != 'done'
+    ]
+    
+    # Reprise : les hashes libérés à l'annulation ou à l'interruption sont de nouveau associés
+    for doc_id in pending_ids:
+        file_info = files_info[doc_id]
+        if file_info.get('previous_version'):
+            document_store.set_hash(file_info['content_hash'], doc_id)
+        elif not file_info.get('link_to'):
+            document_store.claim_hash(file_info['content_hash'], doc_id)
+    
+    # Tous les OCR d'images sont soumis au pool avant de traiter les fichiers
+    ocr_futures = {}
+    for doc_id in pending_ids:
+        filename = files_info[doc_id]['filename']
+        if filename.rsplit('.', 1)[1].lower() in ['png', 'jpg', 'jpeg']:
+            ocr_futures[doc_id] = submit_ocr(files_info[doc_id]['path'])
+    
+    def process(doc_id):
+        if cancel_event.is_set():
+            if doc_id in ocr_futures:
+                ocr_futures[doc_id].cancel()
+            return None
+        
+        file_info = files_info[doc_id]
+        update_job_document(job, doc_id, status='processing')
+        
+        # Doublon lié : le contenu et l'extraction du document existant sont repris sans nouveau traitement
+        original = load_document(file_info['link_to']) if file_info.get('link_to') else None
+        if original is not None:
+            json_data = {
+                key: original[key] for key in DUPLICATE_LINK_KEYS if key in original
+            }
+            json_data.update({
+                'id': doc_id,
+                'title': file_info['filename'].rsplit('.', 1)[0],
+                'filename': file_info['filename'],
+                'type': 'document',
+                'content_hash': file_info['content_hash'],
+                'duplicate_of': original['id']
+            })
+            document_store.save(json_data)
+            update_job_document(job, doc_id, status='done', error=None, title=json_data['title'], linked=True)
+            return None
+        
+        try:
+            title, content, pages = process_document(file_info['path'], file_info['filename'], ocr_futures.get(doc_id))
+        except Exception as e:
+            # L'erreur est enregistrée dans la tâche, aucun document n'est créé
+            release_upload_hash(file_info, doc_id)
+            update_job_document(job, doc_id, status='error', error=str(e))
+            return None
+        
+        json_data = {
+            'id': doc_id,
+            'title': title,
+            'content': content,
+            'filename': file_info['filename'],
+            'type': 'document',
+            'content_hash': file_info['content_hash']
+        }
+        if pages:
+            json_data['pages'] = pages
+        if file_info.get('previous_version'):
+            previous = load_document(file_info['previous_version']) or {}
+            json_data['previous_version'] = file_info['previous_version']
+            json_data['version'] = previous.get('version', 1) + 1
+        
+        document_store.save(json_data)
+        update_job_document(job, doc_id, status='done', error=None, title=title)
+        return get_clustering_text(json_data)
+    
+    # Les doublons liés sont traités après les originaux de la même tâche
+    originals = [doc_id for doc_id in pending_ids if not files_info[doc_id].get('link_to')]
+    links = [doc_id for doc_id in pending_ids if files_info[doc_id].get('link_to')]
+    
+    try:
+        clustering_texts = run_in_parallel(process, originals, app.config['INGESTION_WORKERS'])
+        run_in_parallel(process, links, app.config['INGESTION_WORKERS'])
+    finally:
+        # Fichiers non traités (annulation, échec) : leur hash ne doit pas bloquer un nouvel upload
+        release_pending_upload_hashes(job)
+    precompute_embeddings([text for text in clustering_texts if text is not None])
+
+def release_upload_hash(file_info, doc_id):
+    """Libère le hash d'un fichier uploadé dont le document n'a pas été créé"""
+    document_store.release_hash(file_info['content_hash'], doc_id, file_info.get('previous_version'))
+
+def release_pending_upload_hashes(job):
+    """Libère les hashes des fichiers d'une tâche d'import qui n'ont pas encore été traités"""
+    files_info = job['params']['files']
+    with _jobs_lock:
+        pending_ids = [
+            doc_id for doc_id, doc_progress in job['progress']['documents'].items()
+            if doc_progress['status'] in ['pending', 'processing']
+        ]
+    for doc_id in pending_ids:
+        release_upload_hash(files_info[doc_id], doc_id)
+
+def is_ingestion_pending(doc_id):
+    """Indique si un document est en attente d'import (upload en cours ou tâche active)"""
+    with _jobs_lock:
+        return doc_id in _pending_upload_ids or any(
+            job['type'] == 'ingestion' and job['status'] in JOB_ACTIVE_STATUSES
+            and job['progress']['documents'].get(doc_id, {}).get('status') in ['pending', 'processing']
+            for job in _jobs.values()
+        )
+
+def run_justification_job(job, api_key, cancel_event):
+    """Justifie les champs extraits des documents d'une tâche (les documents déjà traités sont ignorés).
+    
+    Sans clé API, seuls les passages repérés localement sont enregistrés.
+    """
+    params = job['params']
+    documents_progress = job['progress']['documents']
+    
+    pending_ids = [
+        doc_id for doc_id, doc_progress in documents_progress.items()
+        if doc_progress['status'] not in ['done', 'skipped']
+    ]
+    
+    def process(doc_id):
+        if cancel_event.is_set():
+            return
+        
+        document = load_document(doc_id)
+        if document is None:
+            update_job_document(job, doc_id, status='error', error='Document non trouvé')
+            return
+        
+        existing = document.get('justifications') or {}
+        fields = {
+            field_name: value for field_name, value in (document.get('extracted_fields') or {}).items()
+            if get_justification_value(value).lower() not in NOT_FOUND_VALUES + ['null']
+            and (params['overwrite'] or field_name not in existing)
+        }
+        if not fields:
+            update_job_document(job, doc_id, status='skipped')
+            return
+        
+        update_job_document(
+            job, doc_id,
+            status='processing',
+            document_title=document.get('title', ''),
+            fields_done=0,
+            fields_total=len(fields)
+        )
+        
+        try:
+            justifications = justify_document_fields(document, fields, api_key)
+            if justifications:
+                # Une seule écriture par document
+                save_field_justifications(doc_id, justifications)
+        except Exception as e:
+            update_job_document(job, doc_id, status='error', error=str(e))
+            return
+        
+        llm_count = sum(1 for justification in justifications.values() if justification.get('method') == 'llm')
+        update_job_document(
+            job, doc_id,
+            status='done',
+            error=None,
+            fields_done=len(justifications),
+            local=len(justifications) - llm_count,
+            llm=llm_count
+        )
+    
+    run_in_parallel(process, pending_ids, params['max_concurrency'])
+
+JOB_RUNNERS = {
+    'extraction': run_extraction_job,
+    'clustering': run_clustering_job,
+    'ingestion': run_ingestion_job,
+    'justification': run_justification_job
+}
+
+def mark_interrupted_jobs():
+    """Marque comme interrompues les tâches qui tournaient lors de l'arrêt du serveur"""
+    jobs_folder = app.config['JOBS_FOLDER']
+    for filename in os.listdir(jobs_folder):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            job = load_job(filename[:-len('.json')])
+            if job['status'] in JOB_ACTIVE_STATUSES:
+                job['status'] = 'interrupted'
+                save_job(job)
+                if job['type'] == 'ingestion':
+                    release_pending_upload_hashes(job)
+        except Exception as e:
+            print(f"Erreur lecture tâche {filename}: {e}")
+
+def init_server():
+    """Démarrage du serveur : import des JSON existants et reprise de l'état des tâches.
+    
+    N'est exécuté que par le processus principal : les processus du pool OCR qui réimportent
+    app.py (méthodes spawn/forkserver) ne doivent ni importer ni modifier les tâches.
+    """
+    document_store.import_json_folder(app.config['JSON_FOLDER'])
+    mark_interrupted_jobs()
+
+if multiprocessing.parent_process() is None:
+    init_server()
+
+@app.route('/jobs/extraction', methods=['POST'])
+def start_extraction_job():
+    """Lance une extraction en tâche de fond et retourne immédiatement son identifiant"""
+    try:
+        data = request.get_json()
+        document_ids = data.get('document_ids') or [doc['id'] for doc in data.get('documents', [])]
+        catalog = data.get('catalog', {})
+        # Utiliser la clé API stockée ou celle fournie
+        api_key = data.get('api_key') or load_api_key()
         
-        return jsonify({
-            'results': results,
-            'total_documents': len(documents),
-            'processed_documents': processed_documents,
-            'total_fields_extracted': total_fields_extracted
-        })
+        if not api_key:
+            return jsonify({'error': 'Clé API Mistral requise. Veuillez la configurer dans les paramètres.'}), 400
+        
+        if not document_ids:
+            return jsonify({'error': 'Aucun document à traiter'}), 400
+        
+        if not catalog:
+            return jsonify({'error': 'Aucun catalog trouvé'}), 400
+        
+        params = {
+            'catalog': catalog,
+            'field_descriptions': data.get('field_descriptions', {}),
+            'instructions': data.get('instructions', ''),
+            'extraction_mode': data.get('extraction_mode') or app.config['EXTRACTION_MODE'],
+            'max_concurrency': min(int(data.get('max_concurrency') or app.config['LLM_MAX_CONCURRENCY']),
+                                   app.config['LLM_MAX_CONCURRENCY'])
+        }
+        
+        job = create_job('extraction', params, document_ids)
+        start_job(job, api_key)
+        
+        return jsonify({'job_id': job['id'], 'status': job['status']}), 202
         
     except Exception as e:
-        return jsonify({'error': f'Erreur lors de l\'extraction: {str(e)}'}), 500
+        return jsonify({'error': f'Erreur lors du lancement de l\'extraction: {str(e)}'}), 500
 
-def extract_document_fields(document, category_fields, field_descriptions, api_key, instructions):
-    """Extrait les champs d'un document avec Mistral AI"""
+@app.route('/jobs/clustering', methods=['POST'])
+def start_clustering_job():
+    """Lance le clustering et le nommage des clusters en tâche de fond"""
     try:
-        from mistralai import Mistral
-        client = Mistral(api_key=api_key)
+        data = request.get_json()
+        document_ids = data.get('document_ids') or [doc['id'] for doc in data.get('documents', [])]
+        # Utiliser la clé API stockée ou celle fournie
+        api_key = data.get('api_key') or load_api_key()
         
-        extracted_fields = {}
+        if not document_ids:
+            return jsonify({'error': 'Aucun document à traiter'}), 400
         
-        # Traiter chaque champ de la catégorie
-        for field_name, field_config in category_fields.items():
-            try:
-                # Construire le prompt pour ce champ
-                field_description = field_descriptions.get(field_name, field_config.get('description', ''))
-                allowed_values = field_config.get('allowed_values', [])
-                
-                system_prompt = (
-                    "Tu es un expert en extraction de données. "
-                    "Ton objectif est d'extraire une valeur spécifique d'un document. "
-                    "Réponds UNIQUEMENT avec la valeur extraite, sans explications ni formatage. "
-                    "Si la valeur n'est pas trouvée, réponds 'N/A'."
-                )
-                
-                user_prompt = f"""
-Document: {document.get('title', '')} - {document.get('content', '')[:2000]}
-
-Champ à extraire: {field_name}
-Description: {field_description}
-Type: {field_config.get('type', 'text')}
-Valeurs autorisées: {', '.join(allowed_values) if allowed_values else 'Aucune'}
-
-Instructions: {instructions}
+        params = {
+            'instructions': data.get('instructions', ''),
+            'k_range': parse_k_range(data)
+        }
+        
+        job = create_job('clustering', params, document_ids)
+        start_job(job, api_key)
+        
+        return jsonify({'job_id': job['id'], 'status': job['status']}), 202
+        
+    except Exception as e:
+        return jsonify({'error': f'Erreur lors du lancement du clustering: {str(e)}'}), 500
 
-Extrais la valeur pour le champ "{field_name}".
-"""
-                
-                # Appel à Mistral
-                response = client.chat.complete(
-                    model="mistral-large-latest",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.1,
-                    max_tokens=100
+@app.route('/jobs/justification', methods=['POST'])
+def start_justification_job():
+    """Lance la justification de tous les champs extraits d'un ensemble de documents.
+    
+    Documents : document_ids, sinon les documents extraits des catégories category/categories,
+    sinon tous les documents extraits. Les champs déjà justifiés sont conservés sauf avec overwrite.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        document_ids = data.get('document_ids')
+        if not document_ids:
+            categories = data.get('categories') or [data.get('category')]
+            document_ids = [
+                document['id']
+                for category in categories
+                for document in document_store.iter_documents(
+                    filters={'category': category, 'extraction_status': 'extracted'}, include_content=False
                 )
-                
-                extracted_value = response.choices[0].message.content.strip()
-                
-                # Nettoyer la valeur
-                if extracted_value.lower() in ['n/a', 'non trouvé', 'non disponible', '']:
-                    extracted_value = None
-                else:
-                    # Vérifier si la valeur est dans les valeurs autorisées
-                    if allowed_values and extracted_value not in allowed_values:
-                        # Essayer de trouver une correspondance proche
-                        for allowed_value in allowed_values:
-                            if allowed_value.lower() in extracted_value.lower() or extracted_value.lower() in allowed_value.lower():
-                                extracted_value = allowed_value
-                                break
-                
-                extracted_fields[field_name] = extracted_value
-                
-            except Exception as e:
-                print(f"Erreur extraction champ {field_name}: {e}")
-                extracted_fields[field_name] = None
+            ]
+        # Utiliser la clé API stockée ou celle fournie (sans clé, repérage local uniquement)
+        api_key = data.get('api_key') or load_api_key()
+        
+        if not document_ids:
+            return jsonify({'error': 'Aucun document à traiter'}), 400
+        
+        params = {
+            'overwrite': bool(data.get('overwrite')),
+            'max_concurrency': min(int(data.get('max_concurrency') or app.config['LLM_MAX_CONCURRENCY']),
+                                   app.config['LLM_MAX_CONCURRENCY'])
+        }
+        
+        job = create_job('justification', params, document_ids)
+        start_job(job, api_key)
         
-        return extracted_fields
+        return jsonify({'job_id': job['id'], 'status': job['status'], 'total_documents': len(document_ids)}), 202
         
     except Exception as e:
-        print(f"Erreur extraction document: {e}")
-        return {}
+        return jsonify({'error': f'Erreur lors du lancement de la justification: {str(e)}'}), 500
 
-def save_document_with_extracted_fields(document):
-    """Sauvegarde le document avec les champs extraits"""
+@app.route('/jobs')
+def list_jobs():
+    """Liste les tâches connues (sans le détail par document)"""
     try:
-        json_path = os.path.join(app.config['JSON_FOLDER'], f"{document['id']}.json")
+        jobs = []
+        jobs_folder = app.config['JOBS_FOLDER']
+        for filename in os.listdir(jobs_folder):
+            if filename.endswith('.json'):
+                job = load_job(filename[:-len('.json')])
+                if job:
+                    jobs.append(summarize_job(job, include_documents=False))
+        
+        jobs.sort(key=lambda job: job['created_at'], reverse=True)
+        return jsonify({'jobs': jobs})
         
-        with open(json_path, 'w', encoding='utf-8') as file:
-            json.dump(document, file, ensure_ascii=False, indent=2)
-            
     except Exception as e:
-        print(f"Erreur sauvegarde document {document['id']}: {e}")
+        return jsonify({'error': f'Erreur lors du chargement des tâches: {str(e)}'}), 500
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Retourne l'état et la progression d'une tâche"""
+    job = load_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+    
+    include_documents = request.args.get('documents', '1') != '0'
+    return jsonify(summarize_job(job, include_documents))
+
+@app.route('/jobs/<job_id>/stream')
+def stream_job(job_id):
+    """Diffuse la progression d'une tâche en NDJSON : une ligne par document terminé, puis le résumé.
+    
+    Pour une tâche de justification, chaque ligne contient les justifications du document.
+    """
+    job = load_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+    
+    def generate():
+        sent = set()
+        while True:
+            with _jobs_lock:
+                active = job['status'] in JOB_ACTIVE_STATUSES
+                finished = [
+                    dict(doc_progress, id=doc_id)
+                    for doc_id, doc_progress in job['progress']['documents'].items()
+                    if doc_progress['status'] not in ['pending', 'processing'] and doc_id not in sent
+                ]
+            
+            for doc_progress in finished:
+                sent.add(doc_progress['id'])
+                if job['type'] == 'justification' and doc_progress['status'] == 'done':
+                    document = load_document(doc_progress['id']) or {}
+                    doc_progress['justifications'] = document.get('justifications', {})
+                yield json.dumps(doc_progress, ensure_ascii=False) + "\n"
+            
+            if not active:
+                break
+            time.sleep(app.config['JOBS_STREAM_INTERVAL'])
+        
+        yield json.dumps({'job': summarize_job(job, include_documents=False)}, ensure_ascii=False) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Annule une tâche (les documents en cours de traitement sont terminés)"""
+    job = load_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+    
+    if is_job_running(job_id):
+        _job_cancel_events[job_id].set()
+    elif job['status'] in JOB_ACTIVE_STATUSES + ['interrupted']:
+        with _jobs_lock:
+            job['status'] = 'cancelled'
+            save_job(job)
+    
+    return jsonify({'success': True, 'status': job['status']})
+
+@app.route('/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """Reprend une tâche interrompue, annulée ou en échec sans refaire le travail terminé"""
+    job = load_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+    
+    if is_job_running(job_id):
+        return jsonify({'error': 'La tâche est déjà en cours'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    # Utiliser la clé API stockée ou celle fournie
+    api_key = data.get('api_key') or load_api_key()
+    
+    if job['type'] == 'extraction' and not api_key:
+        return jsonify({'error': 'Clé API Mistral requise. Veuillez la configurer dans les paramètres.'}), 400
+    
+    start_job(job, api_key)
+    
+    return jsonify({'job_id': job['id'], 'status': job['status']}), 202
 
 def save_api_key(api_key):
     """Sauvegarde la clé API Mistral"""
@@ -1347,37 +4116,279 @@ def validation():
 
 @app.route('/justify_field', methods=['POST'])
 def justify_field():
-    """Génère une justification IA pour un champ extrait"""
+    """Justifie un champ extrait : repérage local du passage, Mistral AI si la confiance est insuffisante"""
     try:
         data = request.get_json()
+        document_id = data.get('document_id')
         document_content = data.get('document_content', '')
         field_name = data.get('field_name', '')
         field_value = data.get('field_value', '')
         
-        # Utiliser la clé API stockée ou celle fournie
-        api_key = data.get('api_key') or load_api_key()
-        
-        if not api_key:
-            return jsonify({'error': 'Clé API Mistral requise. Veuillez la configurer dans les paramètres.'}), 400
+        # Le document stocké fait foi (pages comprises) ; le contenu envoyé sert pour un document non enregistré
+        document = document_store.get(document_id) if document_id else None
+        if document is None:
+            document = {'content': document_content}
         
-        if not document_content or not field_name or not field_value:
+        if not document.get('content') or not field_name or not field_value:
             return jsonify({'error': 'Contenu du document, nom du champ et valeur requis'}), 400
         
-        # Générer la justification avec Mistral AI
-        justification = generate_field_justification(
-            document_content, field_name, field_value, api_key
-        )
+        justification = locate_field_justification(document, field_name, field_value)
+        if justification is None or justification['confidence'] < app.config['JUSTIFICATION_LOCAL_THRESHOLD']:
+            # Utiliser la clé API stockée ou celle fournie
+            api_key = data.get('api_key') or load_api_key()
+            
+            if not api_key:
+                return jsonify({'error': 'Clé API Mistral requise. Veuillez la configurer dans les paramètres.'}), 400
+            
+            # Générer la justification avec Mistral AI
+            with llm_usage_scope(category=document.get('category'), field=field_name):
+                justification = generate_field_justification(
+                    document, field_name, field_value, api_key, fallback=justification
+                )
+        
+        if document_id:
+            save_field_justifications(document_id, {field_name: justification})
         
         return jsonify(justification)
         
     except Exception as e:
         return jsonify({'error': f'Erreur lors de la génération de la justification: {str(e)}'}), 500
 
-def generate_field_justification(document_content, field_name, field_value, api_key):
-    """Génère une justification IA pour un champ extrait"""
+class FoldTable(dict):
+    """Table pour str.translate : minuscule sans accent, caractère pour caractère.
+    
+    La longueur du texte est conservée, donc une position trouvée dans le texte replié
+    est aussi une position dans le texte d'origine.
+    """
+    
+    def __missing__(self, code):
+        character = chr(code)
+        folded = unicodedata.normalize('NFKD', character)[:1].lower()
+        if len(folded) != 1:
+            folded = character
+        self[code] = folded
+        return folded
+
+FOLD_TABLE = FoldTable()
+
+def fold_text(text):
+    """Texte en minuscules sans accents, de même longueur que l'original"""
+    return text.translate(FOLD_TABLE)
+
+def get_value_patterns(value):
+    """Expressions régulières d'une valeur sur le texte replié.
+    
+    Les mots de la valeur peuvent être séparés par n'importe quelle ponctuation (3,5 / 3.5,
+    12/03/2021 / 12-03-2021), les zéros initiaux sont facultatifs, et une date ISO est aussi
+    cherchée sous les formes 12/03/2021 et 12 mars 2021.
+    """
+    tokens = tokenize_for_search(value)
+    if not tokens:
+        return []
+    
+    variants = [tokens]
+    if len(tokens) == 3 and all(token.isdigit() for token in tokens) and len(tokens[0]) == 4:
+        year, month, day = tokens
+        variants.append([day, month, year])
+        if 1 <= int(month) <= 12:
+            variants.append([day, FRENCH_MONTHS[int(month) - 1], year])
+    
+    patterns = []
+    for variant in variants:
+        parts = [f'0*{int(token)}' if token.isdigit() and len(token) < 10 else re.escape(token) for token in variant]
+        patterns.append(re.compile(r'(?<!\w)' + r'\W+'.join(parts) + r'(?!\w)'))
+    return patterns
+
+def find_fuzzy_spans(folded, needle, min_similarity, max_windows=50):
+    """Correspondances approchées d'une valeur (distance d'édition) dans le texte replié.
+    
+    La valeur est coupée en max_errors + 1 morceaux : toute correspondance acceptable contient
+    au moins un morceau intact, donc seules les fenêtres autour de ces morceaux (au plus
+    max_windows) sont alignées (algorithme de Sellers). Retourne les (début, fin, erreurs) de coût minimal.
+    """
+    length = len(needle)
+    max_errors = int(length * (1 - min_similarity))
+    if max_errors < 1:
+        return []
+    
+    # Morceaux les plus rares d'abord : une vraie correspondance contient aussi ceux-là
+    piece_size = length // (max_errors + 1)
+    pieces = [(needle[offset:offset + piece_size], offset) for offset in range(0, piece_size * (max_errors + 1), piece_size)]
+    pieces.sort(key=lambda item: folded.count(item[0]))
+    windows = []
+    for piece, offset in pieces:
+        position = folded.find(piece)
+        while position != -1 and len(windows) < max_windows:
+            start = max(0, position - offset - max_errors)
+            windows.append((start, min(len(folded), position - offset + length + max_errors)))
+            position = folded.find(piece, position + 1)
+    
+    # Fusionner les fenêtres qui se chevauchent
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    
+    spans = []
+    for start, end in merged:
+        # costs[i] : erreurs minimales entre needle[:i] et un texte finissant à la position courante,
+        # origins[i] : début de ce texte
+        costs = list(range(length + 1))
+        origins = [start] * (length + 1)
+        best = None
+        for position in range(start, end):
+            character = folded[position]
+            new_costs = [0]
+            new_origins = [position + 1]
+            for i in range(1, length + 1):
+                cost = costs[i - 1] + (needle[i - 1] != character)
+                origin = origins[i - 1]
+                if costs[i] + 1 < cost:
+                    cost = costs[i] + 1
+                    origin = origins[i]
+                if new_costs[i - 1] + 1 < cost:
+                    cost = new_costs[i - 1] + 1
+                    origin = new_origins[i - 1]
+                new_costs.append(cost)
+                new_origins.append(origin)
+            costs, origins = new_costs, new_origins
+            if costs[length] <= max_errors and (best is None or costs[length] < best[2]):
+                best = (origins[length], position + 1, costs[length])
+        if best:
+            spans.append(best)
+    
+    if not spans:
+        return []
+    fewest_errors = min(errors for _, _, errors in spans)
+    return [span for span in spans if span[2] == fewest_errors]
+
+def find_value_spans(content, value, fuzzy=True):
+    """Positions d'une valeur dans un texte : exacte, normalisée puis approchée.
+    
+    La recherche approchée (coût proportionnel à la longueur de la valeur) n'est tentée que
+    si fuzzy est vrai et que la valeur fait au plus JUSTIFICATION_FUZZY_MAX_CHARS caractères.
+    Retourne (positions, méthode, similarité) ; positions est vide si la valeur n'est pas trouvée.
+    """
+    exact = [match.span() for match in re.finditer(r'(?<!\w)' + re.escape(value) + r'(?!\w)', content)]
+    if exact:
+        return exact, 'exact', 1.0
+    
+    folded = fold_text(content)
+    for pattern in get_value_patterns(value):
+        spans = [match.span() for match in pattern.finditer(folded)]
+        if spans:
+            return spans, 'normalized', 1.0
+    
+    needle = ' '.join(fold_text(value).split())
+    if fuzzy and len(needle) <= app.config['JUSTIFICATION_FUZZY_MAX_CHARS']:
+        fuzzy_spans = find_fuzzy_spans(folded, needle, app.config['JUSTIFICATION_FUZZY_MIN_SIMILARITY'])
+        if fuzzy_spans:
+            return [(start, end) for start, end, _ in fuzzy_spans], 'fuzzy', 1 - fuzzy_spans[0][2] / len(needle)
+    
+    return [], None, 0.0
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n\s*')
+
+def expand_to_sentences(content, start, end, extra_sentences, max_chars):
+    """Étend une correspondance à sa phrase (plus extra_sentences de chaque côté), dans la limite de max_chars"""
+    lower = max(0, start - max_chars)
+    boundaries = list(SENTENCE_BOUNDARY.finditer(content, lower, start))
+    if len(boundaries) > extra_sentences:
+        passage_start = boundaries[-1 - extra_sentences].end()
+    else:
+        passage_start = lower
+    
+    upper = min(len(content), end + max_chars)
+    boundaries = list(SENTENCE_BOUNDARY.finditer(content, end, upper))
+    if len(boundaries) > extra_sentences:
+        passage_end = boundaries[extra_sentences].start()
+    else:
+        passage_end = upper
+    
+    # Phrase trop longue : fenêtre centrée sur la correspondance, coupée entre deux mots
+    if passage_end - passage_start > max_chars:
+        margin = max(0, (max_chars - (end - start)) // 2)
+        if start - margin > passage_start:
+            space = content.find(' ', start - margin, start)
+            passage_start = space + 1 if space != -1 else start - margin
+        if end + margin < passage_end:
+            space = content.rfind(' ', end, end + margin)
+            passage_end = space if space != -1 else end + margin
+    
+    while passage_start < start and content[passage_start].isspace():
+        passage_start += 1
+    while passage_end > end and content[passage_end - 1].isspace():
+        passage_end -= 1
+    return passage_start, passage_end
+
+def get_justification_value(field_value):
+    """Texte cherché pour une valeur extraite"""
+    if isinstance(field_value, str):
+        return field_value.strip()
+    return json.dumps(field_value, ensure_ascii=False)
+
+def locate_field_justification(document, field_name, field_value):
+    """Repère localement le passage qui justifie une valeur, sans appel au LLM.
+    
+    Retourne {'passage', 'start', 'end', 'method', 'confidence'} ou None si la valeur n'est pas
+    trouvée. Quand la valeur apparaît plusieurs fois, la phrase qui contient le plus de mots du
+    nom du champ est retenue ; une égalité baisse la confiance, fortement pour une valeur courte.
+    """
+    content = document.get('content', '')
+    value = get_justification_value(field_value)
+    if not content or not value:
+        return None
+    
+    spans, method, similarity = find_value_spans(content, value)
+    if not spans:
+        return None
+    
+    value_tokens = set(tokenize_for_search(value))
+    query_tokens = set(tokenize_for_search(field_name.replace('_', ' '))) - set(FRENCH_STOP_WORDS) - value_tokens
+    
+    candidates = []
+    for start, end in spans[:50]:
+        passage_start, passage_end = expand_to_sentences(
+            content, start, end,
+            app.config['JUSTIFICATION_CONTEXT_SENTENCES'], app.config['JUSTIFICATION_MAX_PASSAGE_CHARS']
+        )
+        score = len(query_tokens & set(tokenize_for_search(content[passage_start:passage_end])))
+        candidates.append((score, passage_start, passage_end))
+    
+    best_score, passage_start, passage_end = max(candidates, key=lambda candidate: candidate[0])
+    confidence = similarity if method == 'fuzzy' else {'exact': 1.0, 'normalized': 0.95}[method]
+    if sum(1 for candidate in candidates if candidate[0] == best_score) > 1:
+        confidence *= 0.9
+        if len(re.sub(r'\W', '', value)) < 4:
+            confidence *= 0.6
+    
+    return {
+        "passage": content[passage_start:passage_end],
+        "start": passage_start,
+        "end": passage_end,
+        "method": method,
+        "confidence": round(confidence, 3)
+    }
+
+def save_field_justifications(document_id, justifications):
+    """Enregistre les justifications de plusieurs champs d'un document en une écriture"""
+    document_store.modify(
+        document_id,
+        lambda document_data: document_data.setdefault('justifications', {}).update(justifications)
+    )
+
+def generate_field_justification(document, field_name, field_value, api_key, fallback=None, context=None):
+    """Génère une justification IA pour un champ extrait
+    
+    Seuls les passages pertinents du document sont envoyés (context : index déjà construit du
+    document) ; le passage répondu est repéré dans le document pour en donner les positions.
+    En cas d'erreur, fallback (repérage local peu sûr) ou la valeur elle-même est retournée.
+    """
     try:
-        from mistralai import Mistral
-        client = Mistral(api_key=api_key)
+        content = document.get('content', '')
+        value = get_justification_value(field_value)
         
         system_prompt = (
             "Tu es un expert en analyse de documents. "
@@ -1385,64 +4396,151 @@ def generate_field_justification(document_content, field_name, field_value, api_
             "Réponds UNIQUEMENT avec le passage exact du document, sans explications ni formatage."
         )
         
+        if context is None and app.config['CONTEXT_RETRIEVAL_ENABLED']:
+            context = DocumentContext(document)
+        excerpt = get_field_context(
+            context, document, f"{field_name.replace('_', ' ')} {value}", app.config['CONTEXT_FIELD_TOKENS']
+        )
+        
         user_prompt = f"""
-Document: {document_content[:3000]}
+Document: {excerpt}
 
 Champ extrait: {field_name}
-Valeur extraite: {field_value}
+Valeur extraite: {value}
 
 Trouve le passage exact dans le document qui contient cette valeur. 
 Réponds UNIQUEMENT avec le passage exact, sans explications.
 """
         
-        response = client.chat.complete(
-            model="mistral-large-latest",
+        response_text = mistral_chat(
+            api_key,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
             temperature=0.1,
             max_tokens=500
-        )
-        
-        response_text = response.choices[0].message.content.strip()
+        ).strip()
         
         # Nettoyer la réponse (enlever les guillemets et formatage)
         response_text = response_text.strip('"').strip("'").strip()
         
         # Si la réponse est vide ou trop courte, utiliser la valeur extraite
         if len(response_text) < 3:
-            response_text = field_value
+            response_text = value
         
-        # Sauvegarder la justification dans le document
-        document_id = request.json.get('document_id')
-        if document_id:
-            document_path = os.path.join(app.config['JSON_FOLDER'], f'{document_id}.json')
-            if os.path.exists(document_path):
-                with open(document_path, 'r', encoding='utf-8') as file:
-                    document_data = json.load(file)
-                
-                # Ajouter la justification au niveau 0
-                if 'justifications' not in document_data:
-                    document_data['justifications'] = {}
-                
-                document_data['justifications'][field_name] = {
-                    "passage": response_text
-                }
-                
-                with open(document_path, 'w', encoding='utf-8') as file:
-                    json.dump(document_data, file, ensure_ascii=False, indent=2)
+        # Positions du passage répondu dans le document
+        # Passage recopié par le LLM : correspondance exacte ou normalisée uniquement
+        spans, _, _ = find_value_spans(content, response_text, fuzzy=False)
+        if spans:
+            start, end = spans[0]
+            return {"passage": content[start:end], "start": start, "end": end, "method": "llm"}
         
         return {
-            "passage": response_text
+            "passage": response_text,
+            "method": "llm"
         }
         
     except Exception as e:
         print(f"Erreur génération justification: {e}")
-        return {
-            "passage": field_value
+        return fallback or {
+            "passage": get_justification_value(field_value)
         }
 
+def justify_fields_batch(document, fields, api_key, context=None):
+    """Justifie plusieurs champs d'un document en un seul appel Mistral (réponse JSON).
+    
+    Seuls les passages retrouvés dans le document sont retournés ; les autres champs sont
+    omis pour être justifiés individuellement.
+    """
+    content = document.get('content', '')
+    values = {field_name: get_justification_value(value) for field_name, value in fields.items()}
+    query = ' '.join(f"{field_name.replace('_', ' ')} {value}" for field_name, value in values.items())
+    excerpt = get_field_context(context, document, query, app.config['CONTEXT_BATCH_TOKENS'])
+    
+    system_prompt = (
+        "Tu es un expert en analyse de documents. "
+        "Ton objectif est de trouver, pour chaque valeur extraite, le passage exact du document qui la justifie. "
+        "Réponds UNIQUEMENT avec un objet JSON dont les clés sont les noms des champs et les valeurs "
+        "le passage exact du document, ou null si aucun passage ne contient la valeur."
+    )
+    
+    user_prompt = f"""
+Document: {excerpt}
+
+Valeurs extraites:
+{json.dumps(values, ensure_ascii=False, indent=2)}
+
+Trouve le passage exact du document qui contient chaque valeur.
+"""
+    
+    response_text = mistral_chat(
+        api_key,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.1,
+        max_tokens=min(100 + 150 * len(fields), 4000),
+        response_format={"type": "json_object"}
+    )
+    
+    passages = json.loads(clean_json_response(response_text.strip()))
+    if not isinstance(passages, dict):
+        raise ValueError("Format de réponse invalide")
+    
+    justifications = {}
+    for field_name in fields:
+        passage = passages.get(field_name)
+        if not isinstance(passage, str) or len(passage.strip().strip('"').strip()) < 3:
+            continue
+        spans, _, _ = find_value_spans(content, passage.strip().strip('"').strip(), fuzzy=False)
+        if spans:
+            start, end = spans[0]
+            justifications[field_name] = {"passage": content[start:end], "start": start, "end": end, "method": "llm"}
+    
+    return justifications
+
+def justify_document_fields(document, fields, api_key):
+    """Justifie plusieurs champs d'un document.
+    
+    Repérage local d'abord ; les champs incertains sont envoyés par prompts groupés
+    (JUSTIFICATION_BATCH_FIELDS), puis un par un s'ils manquent dans la réponse groupée.
+    Sans clé API, le repérage local incertain est conservé tel quel.
+    """
+    justifications = {}
+    uncertain = {}
+    for field_name, value in fields.items():
+        located = locate_field_justification(document, field_name, value)
+        if located and located['confidence'] >= app.config['JUSTIFICATION_LOCAL_THRESHOLD']:
+            justifications[field_name] = located
+        else:
+            uncertain[field_name] = located
+    
+    if not api_key:
+        justifications.update({field_name: located for field_name, located in uncertain.items() if located})
+        return justifications
+    
+    context = DocumentContext(document) if app.config['CONTEXT_RETRIEVAL_ENABLED'] else None
+    field_names = list(uncertain)
+    batch_size = app.config['JUSTIFICATION_BATCH_FIELDS']
+    for start in range(0, len(field_names), batch_size):
+        batch = {field_name: fields[field_name] for field_name in field_names[start:start + batch_size]}
+        try:
+            with llm_usage_scope(category=document.get('category'), field=LLM_BATCH_FIELD):
+                justifications.update(justify_fields_batch(document, batch, api_key, context))
+        except Exception as e:
+            print(f"Erreur justification groupée: {e}")
+    
+    for field_name in field_names:
+        if field_name not in justifications:
+            with llm_usage_scope(category=document.get('category'), field=field_name):
+                justifications[field_name] = generate_field_justification(
+                    document, field_name, fields[field_name], api_key, fallback=uncertain[field_name], context=context
+                )
+    
+    return justifications
+
 @app.route('/update_document', methods=['POST'])
 def update_document():
     """Met à jour un document avec les modifications"""
@@ -1453,8 +4551,13 @@ def update_document():
         if not document or 'id' not in document:
             return jsonify({'error': 'Document invalide'}), 400
         
-        # Sauvegarder le document mis à jour
-        save_document_with_extracted_fields(document)
+        # Un contenu tronqué (liste paginée) ne doit jamais remplacer le contenu complet
+        if document.pop('content_truncated', False):
+            document.pop('content', None)
+        
+        # Fusionner avec le document stocké : les clés absentes (ex. contenu non chargé) sont conservées
+        if document_store.modify(document['id'], lambda stored_document: stored_document.update(document)) is None:
+            save_document_with_extracted_fields(document)
         
         return jsonify({'success': True})
         
@@ -1508,103 +4611,375 @@ def download_catalog():
     except Exception as e:
         return jsonify({'error': f'Erreur lors du téléchargement: {str(e)}'}), 500
 
+EXPORT_BASE_COLUMNS = ['Document ID', 'Titre', 'Catégorie', 'Contenu']
+
+def get_export_columns():
+    """Colonnes de l'export, dans l'ordre de première apparition.
+    
+    Les noms de champs sont lus par SQLite (json_each) sans charger les documents.
+    Retourne (colonnes, champs extraits, colonnes de justification).
+    """
+    rows = document_store.connect().execute(
+        "SELECT kind, key FROM ("
+        " SELECT documents.rowid AS doc_rowid, 0 AS kind, fields.key AS key, fields.id AS position"
+        " FROM documents, json_each(documents.data, '$.extracted_fields') AS fields"
+        " WHERE json_type(documents.data, '$.extracted_fields') = 'object'"
+        " UNION ALL"
+        " SELECT documents.rowid, 1, fields.key, fields.id"
+        " FROM documents, json_each(documents.data, '$.justifications') AS fields"
+        " WHERE json_type(documents.data, '$.justifications') = 'object')"
+        " ORDER BY doc_rowid, kind, position"
+    )
+    
+    columns = list(EXPORT_BASE_COLUMNS)
+    seen_columns = set(columns)
+    extracted_field_names = set()
+    justification_field_names = set()
+    
+    for kind, field_name in rows:
+        if kind == 0:
+            column = field_name
+            extracted_field_names.add(column)
+        else:
+            column = f"{field_name}_justification"
+            justification_field_names.add(column)
+        if column not in seen_columns:
+            seen_columns.add(column)
+            columns.append(column)
+    
+    return columns, extracted_field_names, justification_field_names
+
+def get_justification_passage(doc, field_name):
+    """Passage justifiant un champ d'un document"""
+    justification = (doc.get('justifications') or {}).get(field_name)
+    if justification is None:
+        return None
+    return justification.get('passage', '') if isinstance(justification, dict) else str(justification)
+
+def iter_export_rows(columns):
+    """Génère les lignes de l'export (une liste de valeurs par document, dans l'ordre des colonnes)"""
+    for doc in document_store.iter_documents(excerpt=100):
+        content = doc.get('content', '')
+        row = {
+            'Document ID': doc.get('id', ''),
+            'Titre': doc.get('title', ''),
+            'Catégorie': doc.get('category', ''),
+            'Contenu': content + '...' if doc.get('content_truncated') else content
+        }
+        
+        # Ajouter les champs extraits
+        for field_name, field_value in (doc.get('extracted_fields') or {}).items():
+            row[field_name] = field_value
+        
+        # Ajouter les justifications
+        for field_name in (doc.get('justifications') or {}):
+            row[f"{field_name}_justification"] = get_justification_passage(doc, field_name)
+        
+        yield [row.get(column) for column in columns]
+
+def stream_csv_export(columns):
+    """Génère le CSV ligne par ligne"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    
+    writer.writerow(columns)
+    for row in iter_export_rows(columns):
+        writer.writerow(row)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
+
+def write_excel_export(columns, extracted_field_names, justification_field_names):
+    """Écrit l'export Excel en mode write-only dans un fichier temporaire et le retourne"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Données Extraites')
+    
+    # Appliquer les couleurs aux titres des colonnes si disponible
+    if OPENPYXL_STYLES_AVAILABLE:
+        # Couleurs définies
+        green_fill = PatternFill(start_color='90EE90', end_color='90EE90', fill_type='solid')  # Vert clair
+        orange_fill = PatternFill(start_color='FFB366', end_color='FFB366', fill_type='solid')  # Orange clair
+        white_font = Font(color='FFFFFF')  # Police blanche pour contraste
+    
+    header = []
+    for column_title in columns:
+        cell = WriteOnlyCell(worksheet, value=column_title)
+        
+        if OPENPYXL_STYLES_AVAILABLE:
+            if column_title in extracted_field_names:
+                # Champs extraits en vert
+                cell.fill = green_fill
+                cell.font = white_font
+            elif column_title in justification_field_names:
+                # Justifications en orange
+                cell.fill = orange_fill
+                cell.font = white_font
+            # Les autres colonnes (Document ID, Titre, Catégorie, Contenu) restent par défaut
+        
+        header.append(cell)
+    worksheet.append(header)
+    
+    for row in iter_export_rows(columns):
+        worksheet.append(row)
+    
+    output = tempfile.SpooledTemporaryFile(max_size=app.config['EXPORT_SPOOL_MAX_SIZE'])
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+def get_export_field_type(field_config):
+    """Type de colonne d'export correspondant au type d'un champ du catalog"""
+    field_type = (field_config.get('type') or 'text').lower()
+    
+    if field_type in ['bool', 'boolean']:
+        return 'bool'
+    if field_type in ['literal', 'select'] or field_config.get('allowed_values'):
+        return 'dictionary'
+    if field_type == 'int':
+        return 'int'
+    if field_type in ['float', 'number', 'union_int_float']:
+        return 'float'
+    if field_type == 'date':
+        return 'date'
+    return 'string'
+
+def get_export_field_types(field_names):
+    """Types des champs extraits d'après le catalog (texte si inconnu ou ambigu entre catégories)"""
+    field_types = {}
+    for category_fields in load_catalog().values():
+        for field_name, field_config in category_fields.items():
+            export_type = get_export_field_type(field_config)
+            known_type = field_types.setdefault(field_name, export_type)
+            if known_type != export_type:
+                # Entier d'un côté, décimal de l'autre : la colonne reste numérique
+                numeric = {known_type, export_type} <= {'int', 'float'}
+                field_types[field_name] = 'float' if numeric else 'string'
+    
+    return {field_name: field_types.get(field_name, 'string') for field_name in field_names}
+
+def get_export_dictionaries(field_names):
+    """Valeurs distinctes des champs dictionnaires (lues par SQLite, sans charger les documents)"""
+    dictionaries = {field_name: set() for field_name in field_names}
+    if not field_names:
+        return {}
+    
+    placeholders = ', '.join('?' for _ in field_names)
+    rows = document_store.connect().execute(
+        "SELECT DISTINCT fields.key, fields.type, fields.value"
+        " FROM documents, json_each(documents.data, '$.extracted_fields') AS fields"
+        " WHERE json_type(documents.data, '$.extracted_fields') = 'object'"
+        f" AND fields.key IN ({placeholders}) AND fields.value IS NOT NULL",
+        list(field_names)
+    )
+    for field_name, value_type, value in rows:
+        # SQLite rend les booléens JSON en 1/0 et les tableaux/objets en texte JSON
+        if value_type in ['true', 'false']:
+            value = value_type == 'true'
+        elif value_type in ['array', 'object']:
+            value = json.loads(value)
+        dictionaries[field_name].add(get_export_text(value))
+    
+    return {field_name: sorted(values) for field_name, values in dictionaries.items()}
+
+def get_export_text(value):
+    """Texte d'une valeur extraite dans une colonne dictionnaire (même forme quelle que soit la lecture)"""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def convert_export_value(value, export_type):
+    """Convertit une valeur extraite (texte) vers le type de sa colonne, None si impossible"""
+    if value is None or value == '':
+        return None
+    
+    text = get_export_text(value).strip()
+    try:
+        if export_type == 'int':
+            number = float(text.replace(',', '.'))
+            return int(number) if number.is_integer() else None
+        if export_type == 'float':
+            return float(text.replace(',', '.'))
+        if export_type == 'bool':
+            if text.lower() in ['oui', 'true', 'vrai', 'yes', '1']:
+                return True
+            if text.lower() in ['non', 'false', 'faux', 'no', '0']:
+                return False
+            return None
+        if export_type == 'date':
+            for date_format in ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d']:
+                try:
+                    return datetime.strptime(text, date_format).date()
+                except ValueError:
+                    continue
+            return None
+    except ValueError:
+        return None
+    
+    return text
+
+def build_export_array(values, export_type, dictionary=None):
+    """Construit une colonne Arrow typée"""
+    if export_type == 'dictionary':
+        positions = {value: index for index, value in enumerate(dictionary)}
+        indices = pa.array(
+            [positions.get(get_export_text(value)) if value is not None else None for value in values], type=pa.int32()
+        )
+        return pa.DictionaryArray.from_arrays(indices, pa.array(dictionary, type=pa.string()))
+    
+    return pa.array([convert_export_value(value, export_type) for value in values], type=EXPORT_ARROW_TYPES[export_type])
+
+EXPORT_JUSTIFICATION_MODES = ['columns', 'file', 'none']
+
+def write_columnar_export(format_type, justifications_mode):
+    """Écrit l'export Parquet ou Arrow IPC par lots de documents.
+    
+    justifications_mode : 'columns' (colonnes <champ>_justification), 'file' (fichier
+    séparé au format long, l'ensemble est livré en zip) ou 'none'.
+    Retourne (fichier, nom de téléchargement, type MIME).
+    """
+    columns, extracted_field_names, justification_field_names = get_export_columns()
+    extracted_columns = [column for column in columns if column in extracted_field_names]
+    justification_columns = [column for column in columns if column in justification_field_names]
+    
+    field_types = get_export_field_types(extracted_columns)
+    dictionaries = get_export_dictionaries(
+        [field_name for field_name, export_type in field_types.items() if export_type == 'dictionary']
+    )
+    dictionaries['Catégorie'] = sorted(
+        category for category, count, extracted in document_store.category_summary() if category is not None
+    )
+    
+    # Colonnes : (nom, type d'export, lecture de la valeur dans le document)
+    column_specs = [
+        ('Document ID', 'string', lambda doc: doc.get('id')),
+        ('Titre', 'string', lambda doc: doc.get('title')),
+        ('Catégorie', 'dictionary', lambda doc: doc.get('category')),
+        ('Contenu', 'string', lambda doc: doc.get('content', '') + '...' if doc.get('content_truncated') else doc.get('content', ''))
+    ]
+    for field_name in extracted_columns:
+        column_specs.append((
+            field_name, field_types[field_name],
+            lambda doc, field_name=field_name: (doc.get('extracted_fields') or {}).get(field_name)
+        ))
+    if justifications_mode == 'columns':
+        for column in justification_columns:
+            field_name = column[:-len('_justification')]
+            column_specs.append((
+                column, 'string',
+                lambda doc, field_name=field_name: get_justification_passage(doc, field_name)
+            ))
+    
+    schema = pa.schema([
+        (name, pa.dictionary(pa.int32(), pa.string()) if export_type == 'dictionary' else EXPORT_ARROW_TYPES[export_type])
+        for name, export_type, getter in column_specs
+    ])
+    justification_schema = pa.schema([('Document ID', pa.string()), ('Champ', pa.string()), ('Passage', pa.string())])
+    
+    def open_writer(sink, writer_schema):
+        if format_type == 'arrow':
+            return pa.ipc.new_file(sink, writer_schema)
+        return pq.ParquetWriter(sink, writer_schema)
+    
+    spool_size = app.config['EXPORT_SPOOL_MAX_SIZE']
+    output = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    writer = open_writer(output, schema)
+    justification_output = None
+    justification_writer = None
+    if justifications_mode == 'file':
+        justification_output = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        justification_writer = open_writer(justification_output, justification_schema)
+    
+    def write_batch(documents):
+        arrays = [
+            build_export_array([getter(doc) for doc in documents], export_type, dictionaries.get(name))
+            for name, export_type, getter in column_specs
+        ]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        
+        if justification_writer:
+            rows = [
+                (doc.get('id'), field_name, get_justification_passage(doc, field_name))
+                for doc in documents for field_name in (doc.get('justifications') or {})
+            ]
+            if rows:
+                justification_writer.write_table(pa.Table.from_arrays(
+                    [pa.array(list(values), type=pa.string()) for values in zip(*rows)],
+                    schema=justification_schema
+                ))
+    
+    batch = []
+    for doc in document_store.iter_documents(excerpt=100):
+        batch.append(doc)
+        if len(batch) >= app.config['EXPORT_BATCH_SIZE']:
+            write_batch(batch)
+            batch = []
+    if batch:
+        write_batch(batch)
+    
+    writer.close()
+    extension = 'arrow' if format_type == 'arrow' else 'parquet'
+    mimetype = 'application/vnd.apache.arrow.file' if format_type == 'arrow' else 'application/vnd.apache.parquet'
+    
+    if not justification_writer:
+        output.seek(0)
+        return output, f'extracted_data.{extension}', mimetype
+    
+    # Données et justifications livrées ensemble dans une archive zip
+    justification_writer.close()
+    archive = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for source, name in [(output, f'extracted_data.{extension}'), (justification_output, f'justifications.{extension}')]:
+            source.seek(0)
+            with zip_file.open(name, 'w') as destination:
+                shutil.copyfileobj(source, destination)
+            source.close()
+    archive.seek(0)
+    return archive, 'extracted_data.zip', 'application/zip'
+
 @app.route('/export_data', methods=['GET'])
 def export_data():
-    """Exporte les données extraites en Excel/CSV"""
+    """Exporte les données extraites en Excel/CSV/Parquet/Arrow sans charger tout le corpus en mémoire"""
     try:
-        import pandas as pd
-        from io import BytesIO
-        import os
-        
         format_type = request.args.get('format', 'excel').lower()
         
-        # Charger tous les documents
-        json_folder = app.config['JSON_FOLDER']
-        documents = []
-        
-        if os.path.exists(json_folder):
-            for filename in os.listdir(json_folder):
-                if filename.endswith('.json'):
-                    filepath = os.path.join(json_folder, filename)
-                    with open(filepath, 'r', encoding='utf-8') as file:
-                        doc_data = json.load(file)
-                        documents.append(doc_data)
-        
-        if not documents:
+        if not document_store.count():
             return jsonify({'error': 'Aucun document trouvé'}), 404
         
-        # Créer le DataFrame
-        rows = []
-        extracted_field_names = set()
-        justification_field_names = set()
+        # Premier passage léger : découvrir les colonnes
+        columns, extracted_field_names, justification_field_names = get_export_columns()
         
-        for doc in documents:
-            row = {
-                'Document ID': doc.get('id', ''),
-                'Titre': doc.get('title', ''),
-                'Catégorie': doc.get('category', ''),
-                'Contenu': doc.get('content', '')[:100] + '...' if len(doc.get('content', '')) > 100 else doc.get('content', '')
-            }
-            
-            # Ajouter les champs extraits
-            extracted_fields = doc.get('extracted_fields', {})
-            for field_name, field_value in extracted_fields.items():
-                row[field_name] = field_value
-                extracted_field_names.add(field_name)
+        # Créer le fichier selon le format
+        if format_type in ['parquet', 'arrow']:
+            if not PYARROW_AVAILABLE:
+                return jsonify({'error': 'L\'export Parquet/Arrow nécessite pyarrow. Veuillez installer pyarrow.'}), 400
             
-            # Ajouter les justifications
-            justifications = doc.get('justifications', {})
-            for field_name, justification in justifications.items():
-                justification_col_name = f"{field_name}_justification"
-                row[justification_col_name] = justification.get('passage', '') if isinstance(justification, dict) else str(justification)
-                justification_field_names.add(justification_col_name)
+            justifications_mode = request.args.get('justifications', 'columns')
+            if justifications_mode not in EXPORT_JUSTIFICATION_MODES:
+                return jsonify({
+                    'error': f"Paramètre justifications invalide : {justifications_mode} "
+                             f"(valeurs possibles : {', '.join(EXPORT_JUSTIFICATION_MODES)})"
+                }), 400
+            output, download_name, mimetype = write_columnar_export(format_type, justifications_mode)
             
-            rows.append(row)
-        
-        df = pd.DataFrame(rows)
+            return send_file(output, as_attachment=True, download_name=download_name, mimetype=mimetype)
         
-        # Créer le fichier selon le format
-        if format_type == 'csv':
-            output = BytesIO()
-            df.to_csv(output, index=False, encoding='utf-8')
-            output.seek(0)
-            
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name='extracted_data.csv',
-                mimetype='text/csv'
+        elif format_type == 'csv':
+            return Response(
+                stream_with_context(stream_csv_export(columns)),
+                mimetype='text/csv',
+                headers={'Content-Disposition': 'attachment; filename=extracted_data.csv'}
             )
         
         else:  # Excel avec couleurs
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Données Extraites')
-                
-                # Appliquer les couleurs aux titres des colonnes si disponible
-                if OPENPYXL_STYLES_AVAILABLE:
-                    worksheet = writer.sheets['Données Extraites']
-                    
-                    # Couleurs définies
-                    green_fill = PatternFill(start_color='90EE90', end_color='90EE90', fill_type='solid')  # Vert clair
-                    orange_fill = PatternFill(start_color='FFB366', end_color='FFB366', fill_type='solid')  # Orange clair
-                    white_font = Font(color='FFFFFF')  # Police blanche pour contraste
-                    
-                    # Appliquer les couleurs aux en-têtes
-                    for col_num, column_title in enumerate(df.columns, 1):
-                        cell = worksheet.cell(row=1, column=col_num)
-                        
-                        if column_title in extracted_field_names:
-                            # Champs extraits en vert
-                            cell.fill = green_fill
-                            cell.font = white_font
-                        elif column_title in justification_field_names:
-                            # Justifications en orange
-                            cell.fill = orange_fill
-                            cell.font = white_font
-                        # Les autres colonnes (Document ID, Titre, Catégorie, Contenu) restent par défaut
-            
-            output.seek(0)
+            output = write_excel_export(columns, extracted_field_names, justification_field_names)
             
             return send_file(
                 output,
@@ -1622,7 +4997,10 @@ def reset_all():
     try:
         import shutil
         
-        # Supprimer tous les documents JSON
+        # Supprimer tous les documents et leurs embeddings
+        document_store.delete_all()
+        embedding_cache.clear()
+        
         json_folder = app.config['JSON_FOLDER']
         if os.path.exists(json_folder):
             shutil.rmtree(json_folder)
@@ -45,7 +45,8 @@ function initializeEventListeners() {
 // Chargement des documents
 async function loadDocuments() {
     try {
-        const response = await fetch('/get_all_documents');
+        // Seules les métadonnées et un extrait du contenu sont nécessaires ici
+        const response = await fetch('/get_all_documents?fields=id,title,type,category,content&excerpt=100');
         const result = await response.json();
         
         if (response.ok) {
@@ -336,13 +337,14 @@ async function startClustering() {
     showStatusMessage('Clustering en cours...', 'info');
     
     try {
-        const response = await fetch('/cluster_documents', {
+        // Le clustering et le nommage tournent en tâche de fond côté serveur
+        const response = await fetch('/jobs/clustering', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                documents: allDocuments,
+                document_ids: allDocuments.map(doc => doc.id),
                 api_key: apiKey || null, // Si null, le serveur utilisera la clé stockée
                 instructions: instructions
             })
@@ -351,11 +353,36 @@ async function startClustering() {
         const result = await response.json();
         
         if (response.ok) {
+            waitForClusteringJob(result.job_id);
+        } else {
+            showStatusMessage('Erreur lors du clustering: ' + result.error, 'error');
+        }
+    } catch (error) {
+        console.error('Erreur:', error);
+        showStatusMessage('Erreur lors du clustering', 'error');
+    }
+}
+
+async function waitForClusteringJob(jobId) {
+    try {
+        const response = await fetch(`/jobs/${jobId}?documents=0`);
+        const job = await response.json();
+        
+        if (!response.ok) {
+            showStatusMessage('Erreur lors du clustering: ' + job.error, 'error');
+            return;
+        }
+        
+        if (job.status === 'completed') {
             showStatusMessage('Clustering terminé avec succès !', 'success');
             hideMistralConfig();
             loadDocuments(); // Recharger pour afficher les nouvelles catégories
+        } else if (job.status === 'failed' || job.status === 'cancelled' || job.status === 'interrupted') {
+            showStatusMessage('Erreur lors du clustering: ' + (job.error || job.status), 'error');
         } else {
-            showStatusMessage('Erreur lors du clustering: ' + result.error, 'error');
+            const stage = job.stage === 'naming' ? 'Nommage des clusters' : 'Clustering';
+            showStatusMessage(`${stage} en cours... (${job.completed_documents}/${job.total_documents} documents)`, 'info');
+            setTimeout(() => waitForClusteringJob(jobId), 1500);
         }
     } catch (error) {
         console.error('Erreur:', error);
@@ -424,6 +451,9 @@ async function startAIOrganization() {
             if (unorganizedCount > 0) {
                 message += `, ${unorganizedCount} documents non classés`;
             }
+            if (result.llm_classified !== undefined) {
+                message += ` (${result.llm_classified} soumis à Mistral, les autres classés localement)`;
+            }
             showStatusMessage(message, 'success');
         } else {
             showStatusMessage('Erreur lors de l\'organisation par IA: ' + result.error, 'error');
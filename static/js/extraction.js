@@ -4,6 +4,11 @@ let catalog = {};
 let documents = [];
 let extractionResults = {};
 let storedApiKey = null;
+let currentJobId = null;
+let jobPollTimer = null;
+
+const JOB_POLL_INTERVAL = 1500;
+const FINISHED_JOB_STATUSES = ['completed', 'cancelled', 'failed', 'interrupted'];
 
 // Initialisation
 document.addEventListener('DOMContentLoaded', function() {
@@ -11,19 +16,22 @@ document.addEventListener('DOMContentLoaded', function() {
     loadData();
     loadApiKeyStatus();
     initializeLanguageSelector();
+    restoreExtractionJob();
 });
 
 function initializeEventListeners() {
     // Boutons de contrôle
     document.getElementById('start-extraction').addEventListener('click', startExtraction);
     document.getElementById('preview-extraction').addEventListener('click', previewExtraction);
+    document.getElementById('cancel-extraction').addEventListener('click', cancelExtraction);
+    document.getElementById('resume-extraction').addEventListener('click', resumeExtraction);
 }
 
 // Chargement des données
 async function loadData() {
     try {
-        // Charger les catégories
-        const categoriesResponse = await fetch('/get_categories');
+        // Charger le nombre de documents par catégorie
+        const categoriesResponse = await fetch('/get_category_summary');
         const categoriesResult = await categoriesResponse.json();
         
         if (categoriesResponse.ok) {
@@ -45,7 +53,7 @@ async function loadData() {
         }
         
         // Charger les documents
-        const documentsResponse = await fetch('/get_all_documents');
+        const documentsResponse = await fetch('/get_all_documents?fields=id,title,category');
         const documentsResult = await documentsResponse.json();
         
         if (documentsResponse.ok) {
@@ -89,7 +97,7 @@ function createCategoryElement(categoryName, fields) {
     div.className = 'extraction-category';
     div.dataset.categoryName = categoryName;
     
-    const documentsInCategory = categories[categoryName] || [];
+    const documentCount = categories[categoryName] ? categories[categoryName].count : 0;
     
     div.innerHTML = `
         <div class="category-header">
@@ -97,7 +105,7 @@ function createCategoryElement(categoryName, fields) {
         </div>
         <div class="category-stats">
             <div class="stat-item">
-                <span class="stat-number">${documentsInCategory.length}</span> documents
+                <span class="stat-number">${documentCount}</span> documents
             </div>
             <div class="stat-item">
                 <span class="stat-number">${Object.keys(fields).length}</span> champs
@@ -233,13 +241,14 @@ async function startExtraction() {
     updateProgress(0, 'Initialisation...', []);
     
     try {
-        const response = await fetch('/extract_fields', {
+        // L'extraction tourne en tâche de fond côté serveur : on récupère son identifiant
+        const response = await fetch('/jobs/extraction', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                documents: documents,
+                document_ids: documents.map(doc => doc.id),
                 catalog: catalog,
                 field_descriptions: fieldDescriptions,
                 api_key: finalApiKey,
@@ -250,21 +259,7 @@ async function startExtraction() {
         const result = await response.json();
         
         if (response.ok) {
-            // Traiter les résultats
-            extractionResults = result.results;
-            
-            // Mettre à jour la progression finale
-            updateProgress(100, `Terminé: ${result.processed_documents}/${result.total_documents} documents traités`, []);
-            
-            // Afficher les résultats
-            displayResults(result);
-            
-            // Masquer la progression après 3 secondes
-            setTimeout(() => {
-                hideExtractionProgress();
-                showStatusMessage(`Extraction terminée: ${result.processed_documents} documents traités avec succès`, 'success');
-            }, 3000);
-            
+            trackExtractionJob(result.job_id);
         } else {
             hideExtractionProgress();
             showStatusMessage('Erreur lors de l\'extraction: ' + result.error, 'error');
@@ -276,6 +271,177 @@ async function startExtraction() {
     }
 }
 
+// Suivi de la tâche d'extraction
+function trackExtractionJob(jobId) {
+    currentJobId = jobId;
+    localStorage.setItem('extractionJobId', jobId);
+    
+    document.getElementById('cancel-extraction').style.display = '';
+    document.getElementById('resume-extraction').style.display = 'none';
+    
+    clearTimeout(jobPollTimer);
+    pollExtractionJob();
+}
+
+async function pollExtractionJob() {
+    if (!currentJobId) return;
+    
+    try {
+        const response = await fetch(`/jobs/${currentJobId}?documents=0`);
+        const job = await response.json();
+        
+        if (!response.ok) {
+            localStorage.removeItem('extractionJobId');
+            hideExtractionProgress();
+            showStatusMessage('Erreur lors du suivi de l\'extraction: ' + job.error, 'error');
+            return;
+        }
+        
+        const percentage = job.total_documents > 0
+            ? Math.round(job.completed_documents / job.total_documents * 100)
+            : 0;
+        const items = job.active_documents.map(doc => ({
+            name: doc.document_title || doc.id,
+            status: 'processing',
+            count: `${doc.fields_done || 0}/${doc.fields_total || 0}`
+        }));
+        
+        updateProgress(
+            percentage,
+            `${job.completed_documents}/${job.total_documents} documents, ${job.fields_done}/${job.fields_total} champs`,
+            items
+        );
+        
+        if (FINISHED_JOB_STATUSES.includes(job.status)) {
+            await finishExtractionJob(job);
+        } else {
+            jobPollTimer = setTimeout(pollExtractionJob, JOB_POLL_INTERVAL);
+        }
+    } catch (error) {
+        console.error('Erreur:', error);
+        jobPollTimer = setTimeout(pollExtractionJob, JOB_POLL_INTERVAL);
+    }
+}
+
+async function finishExtractionJob(job) {
+    if (job.status === 'interrupted') {
+        // Le serveur a redémarré : proposer la reprise
+        document.getElementById('cancel-extraction').style.display = 'none';
+        document.getElementById('resume-extraction').style.display = '';
+        showStatusMessage('Extraction interrompue. Vous pouvez la reprendre là où elle s\'est arrêtée.', 'info');
+        return;
+    }
+    
+    localStorage.removeItem('extractionJobId');
+    
+    // Charger le détail par document pour afficher les résultats
+    const response = await fetch(`/jobs/${job.id}`);
+    const fullJob = await response.json();
+    const result = jobToExtractionResult(fullJob);
+    extractionResults = result.results;
+    
+    updateProgress(100, `Terminé: ${result.processed_documents}/${result.total_documents} documents traités`, []);
+    displayResults(result);
+    
+    setTimeout(() => {
+        hideExtractionProgress();
+        if (job.status === 'completed') {
+            showStatusMessage(`Extraction terminée: ${result.processed_documents} documents traités avec succès`, 'success');
+        } else if (job.status === 'cancelled') {
+            showStatusMessage(`Extraction annulée: ${result.processed_documents} documents traités`, 'info');
+        } else {
+            showStatusMessage('Erreur lors de l\'extraction: ' + job.error, 'error');
+        }
+    }, 3000);
+}
+
+function jobToExtractionResult(job) {
+    const results = {};
+    let processedDocuments = 0;
+    let totalFieldsExtracted = 0;
+    
+    Object.keys(job.documents || {}).forEach(docId => {
+        const docProgress = job.documents[docId];
+        if (docProgress.status === 'skipped') return;
+        
+        results[docId] = {
+            success: docProgress.status === 'done',
+            document_title: docProgress.document_title || '',
+            field_count: docProgress.field_count || 0,
+            error: docProgress.error
+        };
+        
+        if (docProgress.status === 'done') {
+            processedDocuments += 1;
+            totalFieldsExtracted += docProgress.field_count || 0;
+        }
+    });
+    
+    return {
+        results: results,
+        total_documents: job.total_documents,
+        processed_documents: processedDocuments,
+        total_fields_extracted: totalFieldsExtracted
+    };
+}
+
+// Reprise du suivi après un rechargement de la page
+async function restoreExtractionJob() {
+    const jobId = localStorage.getItem('extractionJobId');
+    if (!jobId) return;
+    
+    showExtractionProgress();
+    trackExtractionJob(jobId);
+}
+
+async function cancelExtraction() {
+    if (!currentJobId) return;
+    
+    try {
+        const response = await fetch(`/jobs/${currentJobId}/cancel`, { method: 'POST' });
+        const result = await response.json();
+        
+        if (response.ok) {
+            showStatusMessage('Annulation demandée, les documents en cours vont se terminer...', 'info');
+        } else {
+            showStatusMessage('Erreur lors de l\'annulation: ' + result.error, 'error');
+        }
+    } catch (error) {
+        console.error('Erreur:', error);
+        showStatusMessage('Erreur lors de l\'annulation', 'error');
+    }
+}
+
+async function resumeExtraction() {
+    if (!currentJobId) return;
+    
+    const apiKeyInput = document.getElementById('mistral-api-key');
+    const apiKey = apiKeyInput ? apiKeyInput.value.trim() : '';
+    
+    try {
+        const response = await fetch(`/jobs/${currentJobId}/resume`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                api_key: apiKey || getApiKey()
+            })
+        });
+        
+        const result = await response.json();
+        
+        if (response.ok) {
+            trackExtractionJob(result.job_id);
+        } else {
+            showStatusMessage('Erreur lors de la reprise: ' + result.error, 'error');
+        }
+    } catch (error) {
+        console.error('Erreur:', error);
+        showStatusMessage('Erreur lors de la reprise', 'error');
+    }
+}
+
 // Gestion de la progression
 function showExtractionProgress() {
     document.getElementById('extraction-progress').style.display = 'block';
@@ -293,7 +459,7 @@ function updateProgress(percentage, text, items) {
     progressFill.style.width = percentage + '%';
     progressText.textContent = text;
     
-    if (items && items.length > 0) {
+    if (items) {
         progressDetails.innerHTML = items.map(item => `
             <div class="progress-item">
                 <div class="progress-item-name">${item.name}</div>
@@ -345,7 +511,9 @@ function displayResults(result) {
     // Détails
     detailsDiv.innerHTML = Object.keys(extractionResults).map(docId => {
         const docResult = extractionResults[docId];
-        const fieldCount = Object.keys(docResult.extracted_fields || {}).length;
+        const fieldCount = docResult.field_count !== undefined
+            ? docResult.field_count
+            : Object.keys(docResult.extracted_fields || {}).length;
         
         return `
             <div class="result-item">
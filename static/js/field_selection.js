@@ -1,5 +1,6 @@
 // Variables globales
 let categories = {};
+let categoryCounts = {};
 let catalog = {};
 let currentCategory = null;
 let currentField = null;
@@ -50,11 +51,13 @@ function initializeEventListeners() {
 // Chargement des données
 async function loadCategories() {
     try {
-        const response = await fetch('/get_categories');
+        // Deux documents d'exemple par catégorie suffisent pour la génération des champs
+        const response = await fetch('/get_categories?per_category=2&fields=id,title,content&excerpt=2000');
         const result = await response.json();
         
         if (response.ok) {
             categories = result.categories;
+            categoryCounts = result.counts || {};
             displayCategories();
         } else {
             showStatusMessage('Erreur lors du chargement des catégories: ' + result.error, 'error');
@@ -127,7 +130,7 @@ function createCategoryElement(categoryName, documents) {
         </div>
         <div class="category-stats">
             <div class="stat-item">
-                <span class="stat-number">${documents.length}</span> documents
+                <span class="stat-number">${categoryCounts[categoryName] !== undefined ? categoryCounts[categoryName] : documents.length}</span> documents
             </div>
             <div class="stat-item">
                 <span class="stat-number">${fieldCount}</span> champs
@@ -1,5 +1,6 @@
 // Variables globales
 let currentExcelFile = null;
+let currentExcelToken = null;  // Fichier déjà envoyé au serveur lors de la lecture des colonnes
 let uploadedDocuments = [];
 let storedApiKey = null;
 
@@ -150,6 +151,15 @@ async function uploadDocuments(files) {
             });
             displayDocuments();
             showDocumentsSection();
+            
+            // Fichiers déjà importés (même contenu)
+            const skipped = result.duplicates.filter(duplicate => duplicate.policy === 'skip');
+            if (skipped.length > 0) {
+                alert(`${skipped.length} fichier(s) déjà importé(s) ignoré(s): ${skipped.map(duplicate => duplicate.filename).join(', ')}`);
+            }
+            
+            // Le traitement des fichiers (texte, OCR) se poursuit côté serveur
+            trackIngestionJob(result.job_id);
         } else {
             alert('Erreur lors de l\'upload: ' + result.error);
         }
@@ -159,9 +169,41 @@ async function uploadDocuments(files) {
     }
 }
 
+// Suivi du traitement des fichiers uploadés
+async function trackIngestionJob(jobId) {
+    try {
+        const response = await fetch(`/jobs/${jobId}`);
+        const job = await response.json();
+        
+        if (!response.ok) {
+            console.error('Erreur suivi upload:', job.error);
+            return;
+        }
+        
+        Object.entries(job.documents).forEach(([docId, progress]) => {
+            const doc = uploadedDocuments.find(d => d.id === docId);
+            if (doc) {
+                doc.status = progress.status;
+                doc.error = progress.error;
+                if (progress.title) {
+                    doc.title = progress.title;
+                }
+            }
+        });
+        displayDocuments();
+        
+        if (['pending', 'running'].includes(job.status)) {
+            setTimeout(() => trackIngestionJob(jobId), 1000);
+        }
+    } catch (error) {
+        console.error('Erreur:', error);
+    }
+}
+
 // Gestion des fichiers Excel
 async function handleExcelFile(file) {
     currentExcelFile = file;
+    currentExcelToken = null;
     
     // Afficher la configuration
     document.getElementById('excel-config').style.display = 'block';
@@ -181,6 +223,7 @@ async function handleExcelFile(file) {
         if (response.ok) {
             populateColumnSelects(result.columns);
             updateRowRange(result.total_rows);
+            currentExcelToken = result.upload_token;
         } else {
             alert('Erreur lors de la lecture du fichier: ' + result.error);
         }
@@ -231,7 +274,12 @@ async function processExcelFile() {
     }
     
     const formData = new FormData();
-    formData.append('file', currentExcelFile);
+    if (currentExcelToken) {
+        formData.append('upload_token', currentExcelToken);
+        formData.append('filename', currentExcelFile.name);
+    } else {
+        formData.append('file', currentExcelFile);
+    }
     formData.append('text_column', textColumn);
     formData.append('title_column', titleColumn);
     formData.append('start_row', startRow);
@@ -265,6 +313,7 @@ function cancelExcelConfig() {
     document.getElementById('excel-config').style.display = 'none';
     document.getElementById('excel-input').value = '';
     currentExcelFile = null;
+    currentExcelToken = null;
 }
 
 // Affichage des documents
@@ -286,10 +335,19 @@ function createDocumentCard(doc) {
     const typeLabel = doc.type === 'excel_row' ? 'Ligne Excel' : 'Document';
     const rowInfo = doc.row_index ? ` (Ligne ${doc.row_index})` : '';
     
+    // État du traitement côté serveur (documents uploadés)
+    let preview = doc.content || 'Aucun aperçu disponible';
+    if (doc.status === 'pending' || doc.status === 'processing') {
+        preview = 'Traitement en cours...';
+    } else if (doc.status === 'error') {
+        preview = `Erreur: ${doc.error}`;
+        card.classList.add('document-error');
+    }
+    
     card.innerHTML = `
         <div class="document-title">${doc.title}${rowInfo}</div>
         <div class="document-filename">${doc.filename || 'Fichier Excel'}</div>
-        <div class="document-preview">${doc.content || 'Aucun aperçu disponible'}</div>
+        <div class="document-preview">${preview}</div>
         <div class="document-type">${typeLabel}</div>
     `;
     
@@ -43,7 +43,8 @@ function initializeEventListeners() {
 // Chargement des documents
 async function loadDocuments() {
     try {
-        const response = await fetch('/get_all_documents');
+        // Le contenu complet est chargé à la sélection d'un document
+        const response = await fetch('/get_all_documents?fields=id,title,category,extracted_fields,justifications');
         const result = await response.json();
         
         if (response.ok) {
@@ -99,7 +100,7 @@ function createDocumentElement(doc) {
 }
 
 // Sélection d'un document
-function selectDocument(doc) {
+async function selectDocument(doc) {
     // Désélectionner tous les documents
     document.querySelectorAll('.document-item').forEach(item => {
         item.classList.remove('selected');
@@ -111,6 +112,18 @@ function selectDocument(doc) {
         docElement.classList.add('selected');
     }
     
+    // Charger le document complet (contenu inclus)
+    if (doc.content === undefined) {
+        try {
+            const response = await fetch(`/get_document/${doc.id}`);
+            if (response.ok) {
+                Object.assign(doc, await response.json());
+            }
+        } catch (error) {
+            console.error('Erreur:', error);
+        }
+    }
+    
     currentDocument = doc;
     displayValidationInterface();
 }
@@ -289,22 +302,94 @@ async function justifyField(fieldName) {
     }
 }
 
-// Justification IA pour tous les champs
+// Justification IA pour tous les champs (une tâche de fond, résultats lus au fil de l'eau)
 async function generateAIJustification() {
     if (!currentDocument || !currentDocument.extracted_fields) return;
     
-    const fields = Object.keys(currentDocument.extracted_fields);
+    const fields = Object.keys(currentDocument.extracted_fields).filter(fieldName => currentDocument.extracted_fields[fieldName]);
+    fields.forEach(fieldName => {
+        const justificationDiv = document.getElementById(`justification-${fieldName}`);
+        if (justificationDiv) {
+            justificationDiv.style.display = 'block';
+            justificationDiv.innerHTML = '<div class="justification-text">Génération de la justification...</div>';
+        }
+    });
     
-    for (const fieldName of fields) {
-        await justifyField(fieldName);
-        // Petite pause entre les appels
-        await new Promise(resolve => setTimeout(resolve, 500));
+    try {
+        const response = await fetch('/jobs/justification', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                document_ids: [currentDocument.id],
+                overwrite: true
+                // La clé API sera automatiquement récupérée côté serveur
+            })
+        });
+        
+        const result = await response.json();
+        
+        if (!response.ok) {
+            showStatusMessage('Erreur lors de la génération des justifications: ' + result.error, 'error');
+            return;
+        }
+        
+        // Flux NDJSON : une ligne par document terminé, puis le résumé de la tâche
+        const stream = await fetch(`/jobs/${result.job_id}/stream`);
+        const reader = stream.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => applyJustificationResult(JSON.parse(line)));
+        }
+    } catch (error) {
+        console.error('Erreur:', error);
+        showStatusMessage('Erreur lors de la génération des justifications', 'error');
     }
     
+    // Champs restés sans justification
+    fields.forEach(fieldName => {
+        const justificationDiv = document.getElementById(`justification-${fieldName}`);
+        if (justificationDiv && !(currentDocument.justifications && currentDocument.justifications[fieldName])) {
+            justificationDiv.innerHTML = '<div class="justification-text">Erreur lors de la génération de la justification.</div>';
+        }
+    });
+    
     // Surligner automatiquement tous les champs justifiés
     highlightAllJustifiedFields();
 }
 
+// Affichage des justifications d'un document reçues dans le flux d'une tâche
+function applyJustificationResult(result) {
+    if (!currentDocument || result.id !== currentDocument.id) return;
+    
+    if (result.status === 'error') {
+        showStatusMessage('Erreur lors de la génération des justifications: ' + result.error, 'error');
+        return;
+    }
+    if (!result.justifications) return;
+    
+    currentDocument.justifications = result.justifications;
+    Object.keys(result.justifications).forEach(fieldName => {
+        const justificationDiv = document.getElementById(`justification-${fieldName}`);
+        if (!justificationDiv) return;
+        
+        justificationDiv.style.display = 'block';
+        justificationDiv.innerHTML = `
+            <div class="justification-passage">Passage: "${result.justifications[fieldName].passage}"</div>
+        `;
+        updateFieldColorIndicator(fieldName);
+    });
+}
+
 // Surlignage d'un passage dans le texte
 function highlightPassageInText(passage, color) {
     const contentDiv = document.getElementById('document-content');
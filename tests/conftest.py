@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py importé dans un dossier temporaire (base, uploads et tâches y sont créés)"""
+    os.chdir(tmp_path_factory.mktemp('server'))
+    import app
+    app.app.config['EMBEDDING_PRECOMPUTE'] = False
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    app_module.document_store.delete_all()
+    return app_module.app.test_client()
@@ -0,0 +1,37 @@
+import random
+import time
+
+import pytest
+
+WORDS = ['contrat', 'prestation', 'montant', 'société', 'durée', 'article', 'clause', 'paiement', 'résiliation', 'signé']
+
+
+@pytest.fixture(scope='module')
+def long_document():
+    generator = random.Random(1)
+    return ' '.join(generator.choice(WORDS) for _ in range(40000))
+
+
+def test_fuzzy_match_tolerates_typos(app_module):
+    content = "Le présent contrat est conclu pour une durée de trois ans à compter de sa signature."
+    spans, method, similarity = app_module.find_value_spans(content, "une duree de troi ans")
+    
+    assert method == 'fuzzy'
+    assert 0.8 <= similarity < 1
+    start, end = spans[0]
+    assert content[start:end] == "une durée de trois ans"
+
+
+@pytest.mark.parametrize('length', [64, 382])
+def test_value_search_is_bounded_on_long_documents(app_module, long_document, length):
+    generator = random.Random(length)
+    value = ' '.join(generator.choice(WORDS) for _ in range(length))[:length]
+    
+    started_at = time.perf_counter()
+    app_module.find_value_spans(long_document, value)
+    assert time.perf_counter() - started_at < 0.5
+
+
+def test_llm_passages_skip_fuzzy_search(app_module):
+    content = "Le présent contrat est conclu pour une durée de trois ans."
+    assert app_module.find_value_spans(content, "une duree de troi ans", fuzzy=False) == ([], None, 0.0)
@@ -0,0 +1,46 @@
+import io
+import time
+
+
+def upload(client, files, policy):
+    data = {'files': [(io.BytesIO(content), filename) for filename, content in files], 'duplicates': policy}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 202
+    return response.get_json()
+
+
+def wait_for_job(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] not in ['pending', 'running']:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'tâche {job_id} non terminée')
+
+
+def test_identical_files_in_one_request_are_skipped(client, app_module):
+    result = upload(client, [('a.txt', b'meme contenu'), ('b.txt', b'meme contenu')], 'skip')
+    
+    assert [document['filename'] for document in result['documents']] == ['a.txt']
+    first_id = result['documents'][0]['id']
+    assert result['duplicates'] == [{'filename': 'b.txt', 'duplicate_of': first_id, 'policy': 'skip'}]
+    
+    job = wait_for_job(client, result['job_id'])
+    assert job['status'] == 'completed'
+    assert app_module.document_store.count() == 1
+    assert app_module.document_store.claim_hash(app_module.load_document(first_id)['content_hash'], 'autre') == first_id
+
+
+def test_identical_files_in_one_request_are_linked(client, app_module):
+    result = upload(client, [('a.txt', b'contenu lie'), ('b.txt', b'contenu lie')], 'link')
+    
+    first_id, second_id = [document['id'] for document in result['documents']]
+    assert result['documents'][1]['duplicate_of'] == first_id
+    
+    wait_for_job(client, result['job_id'])
+    second = app_module.load_document(second_id)
+    assert second['duplicate_of'] == first_id
+    assert second['content'] == app_module.load_document(first_id)['content']
+    # Le hash reste associé au premier document
+    assert app_module.document_store.claim_hash(second['content_hash'], 'autre') == first_id